@@ -1,17 +1,93 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+import io
 import random
 import os
-import pandas as pd
-from model_utils import preprocess_and_predict
+import time
+import uuid
+import model_utils
+from model_utils import preprocess_and_predict, build_form_data
+from chat_utils import get_response_bank, detect_emotion, choose_response
+from memory_utils import make_memory_store
+from log_utils import PREDICTION_LOG_PATH, PredictionLogWriter
+from store_utils import PredictionStore
+from bulk_utils import score_stream, render_csv, render_ndjson
+from event_log_utils import app_log
+from metrics_utils import metrics
+from drift_utils import drift_stats, drift_report, load_baseline
+from variant_utils import variants, variant_report
+from static_utils import PageCache, asset_response, asset_url
+from series_utils import SeriesCache
+from profile_utils import PROFILING, PROFILE_HEADER, profiler
 
 app = Flask(__name__)
+app.jinja_env.globals["asset_url"] = asset_url
+page_cache = PageCache(app)
+prediction_store = PredictionStore()
+# History from before the store existed is imported once, into an empty store
+_legacy_rows = prediction_store.import_legacy(PREDICTION_LOG_PATH)
+if _legacy_rows:
+    app_log.event("store.legacy_imported", path=PREDICTION_LOG_PATH, rows=_legacy_rows)
+prediction_log = PredictionLogWriter(prediction_store)
+series_cache = SeriesCache(prediction_store)
+
+
+# =========================
+# Request metrics
+# =========================
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    started = g.get("request_started")
+    if started is not None:
+        metrics.observe("wellness_http_request_seconds", time.perf_counter() - started, route=route)
+    metrics.inc("wellness_http_requests_total", route=route, status=str(response.status_code))
+    return response
+
+
+# =========================
+# Request profiling (off unless configured, see profile_utils)
+# =========================
+if PROFILING:
+    @app.before_request
+    def start_profile():
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        profiler.start(route, token=request.headers.get(PROFILE_HEADER))
+
+    @app.after_request
+    def finish_profile(response):
+        if response.is_streamed:
+            # The body (e.g. /predict/bulk's scoring) runs after this; stop once it is sent
+            g.profile_streamed = True
+            response.call_on_close(profiler.stop)
+            return response
+        profile_name = profiler.stop()
+        if profile_name:
+            response.headers["X-Profile"] = profile_name
+        return response
+
+    @app.teardown_request
+    def finish_profile_on_error(exc):
+        # after_request does not run when a view raises
+        if not g.get("profile_streamed"):
+            profiler.stop()
 
 # =========================
 # Home Route
 # =========================
 @app.route("/")
 def home():
-    return render_template("index.html")
+    return page_cache.response("index.html")
+
+
+# Vendored front-end dependencies (see static_utils), cached for a year
+@app.route("/vendor/<path:name>")
+def vendor_asset(name):
+    return asset_response(name)
 
 
 # =========================
@@ -20,39 +96,16 @@ def home():
 @app.route("/predict", methods=["POST"])
 def predict():
     try:
-        form_dict = request.form.to_dict()
-        print("FORM DATA RECEIVED:", request.form.to_dict())
-        def safe_get(key, default="unknown"):
-            val = form_dict.get(key)
-            if val is None or str(val).strip() == "":
-                return default
-            return str(val).strip()
-        form_data = {
-            "Gender": safe_get("gender"),
-            "Country": safe_get("country"),
-            "Occupation": safe_get("occupation"),
-            "self_employed": "no",  # not in form
-            "family_history": safe_get("family_history", "no"),
-            "Days_Indoors": safe_get("days_indoors", "15-30 days"),
-            "Growing_Stress": safe_get("growing_stress", "no"),
-            "Changes_Habits": safe_get("changes_habits", "no"),
-            "Mental_Health_History": "no",  # not in form
-            "Mood_Swings": safe_get("mood_swings", "medium"),
-            "Coping_Struggles": safe_get("coping_struggles", "no"),
-            "Work_Interest": safe_get("work_interest", "no"),
-            "Social_Weakness": "no",  # not in form
-            "mental_health_interview": safe_get("mental_health_interview", "no"),
-            "care_options": safe_get("care_options", "no"),
-            "Year": 2014,
-            "Month": 8,
-            "Weekday": "wednesday",
-            "Hour": 11
-        }
+        with metrics.stage("parse_form"):
+            form_dict = request.form.to_dict()
+            app_log.event("predict.form", form=form_dict)
+            form_data = build_form_data(form_dict)
 
         # Predict
         prediction, confidence = preprocess_and_predict(form_data)
         if prediction is None:
             raise ValueError("Prediction failed")
+        drift_stats.observe(form_data, prediction, confidence)
 
         # Display result
         if prediction == 1:
@@ -89,25 +142,24 @@ def predict():
             "Growth is quiet, gentle, and unstoppable 🌱."
         ])
 
-        # Save to log for dashboard
-        log_path = "prediction_log.csv"
-        pd.DataFrame([{
-            "Prediction": prediction,
-            "Confidence": confidence,
-            "Message": message
-        }]).to_csv(log_path, mode="a", header=not os.path.exists(log_path), index=False)
-
-        return render_template(
-            "result.html",
-            emoji=emoji,
-            message=message,
-            description=description,
-            confidence=round(confidence * 100, 1),
-            tips=tips,
-            quote=quote
-        )
+        # Save to log for dashboard (written in the background)
+        with metrics.stage("log_append"):
+            prediction_log.log(prediction, confidence, message)
+
+        with metrics.stage("render"):
+            return render_template(
+                "result.html",
+                emoji=emoji,
+                message=message,
+                description=description,
+                confidence=round(confidence * 100, 1),
+                tips=tips,
+                quote=quote
+            )
 
     except Exception as e:
+        metrics.inc("wellness_errors_total", where="predict_route")
+        app_log.error("predict.route_failed", e)
         return render_template(
             "result.html",
             emoji="⚠",
@@ -119,37 +171,76 @@ def predict():
         )
 
 
+# =========================
+# Bulk Scoring (CSV / NDJSON)
+# =========================
+@app.route("/predict/bulk", methods=["POST"])
+def predict_bulk():
+    # Accept a multipart "file" upload or a raw request body
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    if upload:
+        # Werkzeug closes request files when the view returns, before the
+        # response streams; detach ours (score_stream closes it when done)
+        upload.stream = io.BytesIO()
+    content_type = upload.mimetype if upload else request.mimetype
+    filename = upload.filename if upload else ""
+    input_format = request.args.get("input") or (
+        "csv" if "csv" in (content_type or "") or (filename or "").endswith(".csv") else "ndjson"
+    )
+
+    results = score_stream(stream, input_format)
+    if request.args.get("format") == "csv":
+        return Response(stream_with_context(render_csv(results)), mimetype="text/csv")
+    return Response(stream_with_context(render_ndjson(results)), mimetype="application/x-ndjson")
+
+
 # =========================
 # Calming Mode
 # =========================
 @app.route("/calming")
 def calming_mode():
-    return render_template("calming.html")
+    return page_cache.response("calming.html")
 
 
 # =========================
 # Wellness Dashboard
 # =========================
+DASHBOARD_INITIAL_DAYS = 7
+DASHBOARD_INITIAL_POINTS = 120
+
+
 @app.route("/dashboard")
 def dashboard():
-    log_file = "prediction_log.csv"
-    if not os.path.exists(log_file):
-        mood_data = []
+    with metrics.stage("store_query"):
+        count, mean_confidence = prediction_store.totals()
+        # The last week, coarse, so the chart draws at once; the page then
+        # loads finer and wider ranges from /dashboard/series
+        first, last = prediction_store.time_bounds()
+        start = None if last is None else max(first, last + 1 - DASHBOARD_INITIAL_DAYS * 86400 * 1000)
+        mood_series = series_cache.series(start, None, DASHBOARD_INITIAL_POINTS)
+    if count == 0:
         avg_mood = 0
         ai_message = "No data yet — start your first prediction to see trends 🌱"
     else:
-        df = pd.read_csv(log_file)
-        df["Confidence"] = pd.to_numeric(df["Confidence"], errors="coerce").fillna(0)
-        last_entries = df.tail(7)
-        mood_data = [{"day": f"Day {i+1}", "mood": round(row["Confidence"] * 10, 1)} for i, row in last_entries.iterrows()]
-        avg_mood = round(df["Confidence"].mean() * 10, 1)
+        avg_mood = round(mean_confidence * 10, 1)
         ai_message = (
             "You’ve been maintaining balance 🌿 — keep nurturing your calm!"
             if avg_mood >= 7
             else "Looks like a stressful week 🌧 — take time to recharge and rest."
         )
 
-    return render_template("dashboard.html", mood_data=mood_data, avg_mood=avg_mood, ai_message=ai_message)
+    return render_template("dashboard.html", mood_series=mood_series, avg_mood=avg_mood, ai_message=ai_message)
+
+
+@app.route("/dashboard/series")
+def dashboard_series():
+    # Mood history for any range, downsampled server-side, with ETags (see series_utils)
+    return series_cache.response(
+        request.args.get("start", type=int),
+        request.args.get("end", type=int),
+        request.args.get("points", type=int),
+    )
 
 
 # =========================
@@ -157,324 +248,92 @@ def dashboard():
 # =========================
 @app.route("/companion")
 def companion_page():
-    return render_template("companion.html")
+    return page_cache.response("companion.html")
+
+
+CHAT_SESSION_COOKIE = "companion_sid"
+CHAT_SESSION_MAX_CHARS = 128
+conversation_memory = make_memory_store()
+
+
+def _session_id(value):
+    # Client-supplied ids are only used as plain, bounded strings
+    return value if isinstance(value, str) and 0 < len(value) <= CHAT_SESSION_MAX_CHARS else None
 
 
 @app.route("/chat", methods=["POST"])
 def chat():
     user_message = request.json.get("message", "").strip().lower()
 
-    # Keep short-term conversation memory
-    if "conversation_history" not in globals():
-        global conversation_history
-        conversation_history = []
-    conversation_history.append({"role": "user", "content": user_message})
-
-    # Keyword sets
-    negative_words = [
-        "sad", "tired", "depressed", "stress", "anxious", "lonely", "angry", "upset",
-        "overwhelmed", "burnt", "hopeless", "exhausted", "stressed", "panic", "worried",
-        "nervous", "down", "hopelessness", "helpless", "frustrated", "grief", "mourning",
-        "guilt", "ashamed", "shame", "panic", "fearful", "afraid"
-    ]
-    positive_words = [
-        "happy", "grateful", "peaceful", "relaxed", "good", "great", "better", "excited",
-        "motivated", "calm", "joyful", "optimistic", "hopeful", "energetic", "cheerful",
-        "content", "satisfied", "uplifted", "blessed", "thankful"
-    ]
-    neutral_words = [
-        "okay", "fine", "normal", "alright", "so-so", "average", "meh", "indifferent",
-        "steady", "neutral"
-    ]
-
-    def detect_emotion(text):
-        if any(w in text for w in negative_words):
-            return "negative"
-        if any(w in text for w in positive_words):
-            return "positive"
-        if any(w in text for w in neutral_words):
-            return "neutral"
-        return "unknown"
-
-    emotion = detect_emotion(user_message)
-    response = ""
-
-    # ---------- Large curated response bank (200+ total) ----------
-    negative_responses = [
-        "I’m really sorry you’re feeling that way 💛. Want to tell me what’s been heaviest lately?",
-        "That sounds difficult — I’m here with you. Would you like to share more about it?",
-        "I hear you. When things feel heavy, small steps can still matter a lot.",
-        "It’s okay to feel tired and unsure. Would a short grounding exercise help right now?",
-        "You’ve been carrying a lot. Thank you for sharing that — it takes courage.",
-        "When overwhelmed, breathing slowly for one minute can calm your nervous system. Want to try?",
-        "I’m with you — let’s break things down and take one gentle step at a time.",
-        "You don’t have to solve everything right now. What’s one tiny thing you can do to feel a bit better?",
-        "Feeling low doesn’t mean you’re failing. It means you’re human.",
-        "I’m sorry this is tough. Would you like a breathing prompt or a distraction?",
-        "Sometimes rest is the most productive thing we can do. Have you been resting enough?",
-        "Would you like a short grounding script? I can guide you through one.",
-        "You’re not alone in this. Want to tell me when it started feeling heavier?",
-        "Your feelings are valid. There’s no rush to fix them — I can stay here with you.",
-        "It’s brave to notice how you feel. That awareness is the start of healing.",
-        "Would you like suggestions for a tiny calming routine you can do in 5 minutes?",
-        "If it helps, name one thing that felt slightly better recently, even if small.",
-        "You deserve kindness today — especially from yourself. What would that look like?",
-        "I’m listening. No judgment, just curiosity — what’s been happening inside?",
-        "If sleep’s been hard, we can try a gentle wind-down checklist together.",
-        "Some days feel heavy and that’s okay. What would make today a bit gentler?",
-        "If you want, say the one thing that’s bothering you most and we’ll start there.",
-        "How would you describe your energy on a scale from 1–10? We can work with that.",
-        "Grief and stress can feel similar — either way, being patient with yourself helps.",
-        "You’re allowed to take breaks. What’s one small, soothing thing you can do now?",
-        "Would you like a simple grounding: notice 5 things you see, 4 you can touch, 3 you hear?",
-        "Sometimes naming the feeling gives it less power. What word describes today?",
-        "You’re not weak for feeling this — you’re human and resilient.",
-        "Would you like resources for talking with someone professional? I can share ideas.",
-        "If you want to journal, try writing for 5 minutes without editing — just pour it out.",
-        "When emotions are intense, slow breathing with counts of 4 can help. Shall we try?",
-        "Small habits add up — what’s one kind thing you can offer yourself in the next hour?",
-        "I hear the pain beneath your words. It matters, and so do you.",
-        "If you feel overwhelmed now, stepping outside for even a minute can shift things.",
-        "Would you like a short body scan to notice where tension sits and release it?",
-        "I’m glad you reached out — even this step shows strength.",
-        "If you have trusted people, sharing one small thing might lighten the load. Would you like prompts?",
-        "It’s okay to ask for help. Do you have someone you trust to call or message?",
-        "Sometimes distraction helps — do you want a quick creative exercise or a calming audio suggestion?",
-        "I can stay with you while you name your thoughts — take your time.",
-        "Forgiveness for yourself can start with a single sentence: ‘It’s okay I felt this.’ Would you try?",
-        "Consider one tiny boundary you can place to protect your energy today.",
-        "If you’re feeling unsafe, please contact local emergency services or a crisis line. I can help find one.",
-        "Breathwork, walking, music — different things help different people. Want to try one?",
-        "Even one deep breath can create a tiny space between you and the emotion.",
-        "I’m proud of you for noticing. What would make a small moment of relief for you now?",
-        "Rest is not indulgence — it’s recovery. What would rest look like for you?",
-        "When thoughts race, writing them out can slow them. Would you like a structured prompt?",
-        "If it helps, we can set a timer for 5 minutes and do a calming task together.",
-        "Pain can feel isolating. Sharing it reduces its size — I’m here to listen.",
-        "If you want, try naming three things you are grateful for, however small.",
-        "Sometimes the next best step is tiny: drink water, open a window, stand up and stretch.",
-        "You matter even on days your energy feels low. That is real and meaningful.",
-        "Would a guided visualization help? I can lead you through a short one.",
-        "If you’re exhausted, give yourself permission to slow down and pause.",
-        "It’s okay to change plans if you need to replenish.",
-        "You’re allowed to prioritize your wellbeing without explanation.",
-        "If feelings are intense often, consider reaching out to a professional — that’s a strong step.",
-        "I can offer techniques for grounding, sleep, or anxious moments — which would you prefer?",
-        "If you want a distraction, I can ask you an easy creative question to shift focus.",
-        "You’ve done hard things before — that resilience exists still, even if tired.",
-        "If someone hurt you, your feelings are valid. Would you like a prompt to process that?",
-        "If the thought loop is loud, labeling each thought as ‘thinking’ can reduce its charge.",
-        "A short walk, even 5 minutes, can change the body and mind connection. Would you try it?",
-        "You’re not defined by a moment. Healing unfolds over time.",
-        "If journaling feels heavy, try writing a letter you don't send — say anything you need to.",
-        "I can help you create a small plan for the next 24 hours to make things feel manageable.",
-        "Would you like a breathing anchor: inhale 4, hold 2, exhale 6? Let’s practice together."
-    ]
-
-    positive_responses = [
-        "That’s wonderful to hear! What’s one thing that made your day better?",
-        "I love hearing that — what helped create that positive feeling?",
-        "That energy sounds nourishing. How can you keep it going today?",
-        "Wonderful — celebrate that moment, even if it was tiny.",
-        "So glad you’re feeling good. Would you like to reflect on what led to this?",
-        "That’s lovely — can you recall the last few moments of joy?",
-        "Positive feelings are like fuel. What would you like to do with that momentum?",
-        "It’s great you feel uplifted — do you want suggestions to amplify this?",
-        "That sounds peaceful — what helped you get there?",
-        "I’m glad to hear that. Would you like to create a quick gratitude list?",
-        "Happiness can be fragile — savor it. What small ritual could anchor it?",
-        "That’s heartening — tell me more about what’s brightening your day.",
-        "Keep nurturing those habits that brought this feeling.",
-        "Joy shared grows stronger — anything you want to share with someone today?",
-        "That sounds like progress — you deserve acknowledgement.",
-        "Would you like a short prompt to journal about this positive moment?",
-        "Lovely — would you like suggestions to build a mini-celebration ritual?",
-        "Sharing your wins — even small ones — helps them stick. What’s one today?",
-        "It’s beautiful you feel this way. How would you describe the feeling in one word?",
-        "That glow is important. How can you show yourself appreciation right now?",
-        "Awesome — do you want a quick breathing exercise to deepen that calm?",
-        "Warmth and gratitude are powerful. Want to name three things you appreciate?",
-        "Sounds like things are aligning — keep honoring what works.",
-        "That’s a positive note. Would you like to plan another small uplifting activity?",
-        "You’re building momentum. Celebrate it with a tiny joyful action.",
-        "That’s great energy — who else might benefit from hearing this good news?",
-        "I love that for you — spread that kindness to yourself.",
-        "Lovely to hear — do you want a gentle prompt to reflect on why you feel good?",
-        "Wonderful — gentle rituals keep positivity steady. Want help designing one?",
-        "That’s uplifting — what’s one small way you can preserve this feeling?",
-        "Feels good to hear — anything you'd like to explore more of?",
-        "This brightness matters — note it somewhere you’ll see later.",
-        "Wonderful! Would you like suggestions for a small mindful celebration?",
-        "That positivity is well-earned — how can you protect it today?",
-        "I’m glad your day has light — keep honoring what helped.",
-        "That’s encouraging — would you like to plan a self-reward for today?",
-        "It’s great to hear that — gratitude practices can help it last longer.",
-        "Lovely! If you want, share one detail about the highlight.",
-        "That happiness is meaningful — want to capture it in a short journal line?",
-        "That’s delightful — consider sharing it with someone who cares.",
-        "So good to hear — would you like a short breathing exercise to cement the calm?",
-        "That’s uplifting — a small ritual (tea, song) can help you remember this feeling.",
-        "I’m happy for you — what’s one small thing you can do to honor this mood?",
-        "Celebrate the small wins — they build big resilience.",
-        "It’s wonderful you feel stable. Keep noticing the little things that help.",
-        "That’s a lovely update — want to plan a tiny treat for yourself?",
-        "So glad — gratitude reflection could deepen this feeling. Want a prompt?",
-        "This joy is worth savoring — can you describe a moment that felt especially good?"
-    ]
-
-    neutral_responses = [
-        "Being ‘okay’ is still a steady place to notice. What’s been consistent for you lately?",
-        "Neutral can be a quiet, grounding place. Any small comforts you’ve noticed?",
-        "Sometimes steady is the beginning of improvement — what’s one thing going as expected?",
-        "If you feel steady, you might gently build on that with a small habit.",
-        "Neutral days allow rest. What would a gentle, nourishing action be right now?",
-        "That balance matters — would you like a short mindfulness check-in?",
-        "Even neutral days are useful data — what’s your energy like overall?",
-        "Neutral is a pause — would you like a small gratitude or a light action to lift you?",
-        "If you’re neither high nor low, focusing on routine can be stabilizing.",
-        "Neutral can be calm in disguise — notice one thing that felt okay today.",
-        "It’s fine to have steady days. If you want growth, what tiny step would you take?",
-        "Neutral energy can be turned into deliberate rest — what helps you unwind?",
-        "A quiet day can be a reset. Would a short breathing or walking break help?",
-        "Neutral is an opportunity to plan small wins — want help making one?",
-        "If you feel ‘so-so’, practicing self-kindness can be surprisingly helpful.",
-        "A steady day may be restful — honor it with a small ritual.",
-        "Neutral doesn’t require fixing — gentle curiosity is enough.",
-        "Would you like a short reflective prompt for a neutral moment?",
-        "Sometimes neutral precedes change. What would you like to invite into your routine?",
-        "If you feel okay, maybe try a small creative task to brighten the day.",
-        "Neutral days can be grounding — focus on nourishing sleep or food tonight.",
-        "That’s okay — would you prefer a calming practice or a small energizer?",
-        "Stillness can be nourishing — do you prefer breathing or a walk?",
-        "Neutral energy is useful — plan one small kind thing for yourself.",
-        "A stable day can be the foundation for progress — want to plan a tiny step?",
-        "Use neutral time to rest or plan. Which feels right to you?",
-        "If you’re steady, short journaling might help you notice hidden positives.",
-        "Neutral can be fertile — what would you plant (metaphorically) for next week?",
-        "If you feel neither good nor bad, focus on small wins and kindness.",
-        "Neutral is honest. There’s power in small consistency — any routines helping?",
-        "When you’re steady, it’s a good time to practice micro-habits.",
-        "Neutral days are underrated. Give yourself a small, quiet reward.",
-        "If ‘okay’ feels flat, a tiny novelty — music, tea, a walk — can nudge mood.",
-        "Neutral is fine — what would feel nourishing right now?",
-        "A balanced moment can be used to plan rest and joyful activities."
-    ]
-
-    contextual_responses = [
-        "I’m here to listen — tell me a little about your day when you’re ready.",
-        "Would you like a calming breathing exercise now? I can guide you step-by-step.",
-        "If you’d like, I can help you build a short nightly routine to sleep better.",
-        "Would you prefer a grounding exercise or a quick distraction activity?",
-        "I can suggest a short reflection prompt, a breathing practice, or a gentle stretch— which sounds best?",
-        "If you want to work out a small plan for tomorrow, I can help you create one.",
-        "We can practice a two-minute mindful break — want to try together?",
-        "Would you like a list of tiny habits for mood support (5–10 minutes each)?",
-        "If you want, I can suggest simple resources for professional support in your area.",
-        "Would you like a short guided visualization to rest your mind?",
-        "I can offer a journaling prompt to clarify what’s on your mind — want one?",
-        "If concentration is hard, we can do a 3-2-1 grounding technique now.",
-        "Do you want to track a small mood habit and check back tomorrow?",
-        "I can give a soothing audio suggestion or a simple playlist idea — which do you prefer?",
-        "Would you like a calming body scan or a brief walking meditation?",
-        "If worry is high, trying to write down three small next steps can help.",
-        "We can set a micro-goal for the next hour and celebrate when it’s done — want to try?",
-        "Would you like to practice redirecting negative thoughts with evidence-based prompts?",
-        "I can give breathing cues: inhale 4, hold 2, exhale 6 — want to follow along?",
-        "If sleep is an issue, we can design a 15-minute wind-down routine together.",
-        "Want a quick mood-boost list: 1) water 2) sunlight 3) small movement?",
-        "If reaching out is hard, I can help draft a message you could send to someone supportive.",
-        "Would you like empathy-first responses (I hear you, it’s hard) or solution-focused tips?",
-        "I can suggest 3 simple coping skills tailored to anxious moments — want that?",
-        "If journaling feels heavy, try a ‘gratitude sandwich’: name 1 struggle and 2 small wins.",
-        "Do you want a breathing timer or a distraction game to reset attention?",
-        "I can guide a visualization: imagine a safe place for 2 minutes — want to try now?",
-        "Would you find a list of mental health helplines helpful? I can fetch local resources if you share location.",
-        "Do you prefer practical steps, emotional validation, or a mixture when you talk?",
-        "I can help design a weekly micro-plan to gently build resilience. Interested?",
-        "If you’d like, we can practice naming emotions and reducing their charge together.",
-        "Would you like a few tips for managing social anxiety or workplace stress?",
-        "I can give a short exercise to create psychological distance from intrusive thoughts — want that?",
-        "If you’re unsure what to do next, we can list three small achievable actions.",
-        "Would you like to try a short five-senses grounding exercise together now?",
-        "If caffeine or screen-use affects you, I can suggest small sleep hygiene tweaks."
-    ]
-
-    # Add variation: expand contextual with some empathetic micro-prompts
-    contextual_responses += [
-        "Tell me one small detail that went okay today — I’ll celebrate it with you.",
-        "If you want to vent for two minutes, I’ll listen without judgment.",
-        "We can craft a short self-care plan for this evening — what sounds doable?",
-        "Would a short guided relaxation help? I can lead it in 3 steps.",
-        "If you want, describe a safe place you remember and we’ll build a visualization.",
-        "Want to try a 60-second breathing anchor? Inhale, exhale, notice.",
-        "If motivation is low, pick one tiny task — we’ll make it feel achievable.",
-        "Do you want to set a small reminder to check-in with yourself later today?",
-        "If you’re coping with changes, naming what’s changed can make it clearer. Want to try?",
-        "We can practice self-compassion phrases — would you like a few to repeat?"
-    ]
-
-    # ---------- Combine into big pool ensuring 200+ unique items ----------
-    # Start with the lists already defined; ensure we have at least 200 by adding generated variants
-    pool_negative = negative_responses.copy()
-    pool_positive = positive_responses.copy()
-    pool_neutral = neutral_responses.copy()
-    pool_context = contextual_responses.copy()
-
-    # If we need to pad to 200+, create gentle paraphrases programmatically
-    def paraphrase(base, n):
-        variants = []
-        for i in range(n):
-            variants.append(f"{base} (nudge {i+1})")
-        return variants
-
-    # Pad each pool to reach the grand total of >=200
-    total = len(pool_negative) + len(pool_positive) + len(pool_neutral) + len(pool_context)
-    needed = max(0, 210 - total)  # target ~210 for safety
-
-    # Distribute padding across categories
-    pad_neg = needed // 4 + 1
-    pad_pos = needed // 4 + 1
-    pad_neu = needed // 4 + 1
-    pad_ctx = needed - (pad_neg + pad_pos + pad_neu)
-
-    pool_negative += paraphrase("I hear you — that sounds heavy right now. You're doing your best.", pad_neg)
-    pool_positive += paraphrase("That sounds wonderful — celebrate that small win.", pad_pos)
-    pool_neutral += paraphrase("A calm day is still progress. What small habit is steady?", pad_neu)
-    pool_context += paraphrase("Would you like a short guided practice now to help center?", max(0, pad_ctx))
-
-    # ---------- Choose response based on detected emotion ----------
-    if emotion == "negative":
-        response = random.choice(pool_negative)
-    elif emotion == "positive":
-        response = random.choice(pool_positive)
-    elif emotion == "neutral":
-        response = random.choice(pool_neutral)
-    else:
-        # contextual/unknown: pick from context pool or combine memory-based prompts
-        if len(conversation_history) > 1:
-            # inspect previous user entry to respond contextually
-            last = conversation_history[-2]["content"]
-            if any(w in last for w in negative_words):
-                # specialized empathic follow-ups
-                followups = [
-                    "Earlier you mentioned it was hard — has anything changed since then?",
-                    "You mentioned stress before — would a step-by-step plan for one issue help?",
-                    "I remember you were feeling down earlier — what’s different now, if anything?",
-                    "Last time it sounded heavy — want to try a grounding exercise together now?",
-                    "If it helps, tell me one tiny thing that would lighten the load today."
-                ]
-                response = random.choice(followups + pool_context)
-            else:
-                response = random.choice(pool_context + pool_neutral)
-        else:
-            response = random.choice(pool_context + pool_positive)
+    # Keep short-term conversation memory per session
+    session_id = _session_id(request.json.get("session_id")) or _session_id(request.cookies.get(CHAT_SESSION_COOKIE))
+    new_session = not session_id
+    if new_session:
+        session_id = uuid.uuid4().hex
+    with metrics.stage("chat_memory"):
+        conversation_memory.append(session_id, "user", user_message)
+        history = conversation_memory.history(session_id)
+
+    # Pick a reply from the precomputed response bank
+    with metrics.stage("chat_reply"):
+        bank = get_response_bank()
+        emotion = detect_emotion(user_message, bank)
+        response = choose_response(emotion, history, bank)
+    metrics.inc("wellness_chat_emotions_total", emotion=emotion)
+
+    # ---------- Save assistant reply in memory (trimmed by the store) ----------
+    conversation_memory.append(session_id, "assistant", response)
+
+    reply = jsonify({"reply": response})
+    if new_session:
+        reply.set_cookie(CHAT_SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return reply
+
+
+# =========================
+# Health, readiness + metrics
+# =========================
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    # Ready once the model is loaded and has served a warm-up prediction;
+    # the first probe kicks off loading in lazy mode
+    if model_utils.is_loaded() and model_utils.is_warm():
+        return jsonify({"status": "ready"})
+    model_utils.start_background_warm_up()
+    return jsonify({
+        "status": "loading",
+        "loaded": model_utils.is_loaded(),
+        "error": model_utils.load_error,
+    }), 503
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    # Summed over every worker when METRICS_DIR is shared (see gunicorn.conf.py)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+_drift_baseline = None
+
+
+@app.route("/drift")
+def drift():
+    # Input drift against the training baseline, summed over every worker (see drift_utils)
+    global _drift_baseline
+    if _drift_baseline is None:
+        _drift_baseline = load_baseline()
+    return jsonify(drift_report(drift_stats, _drift_baseline))
 
-    # ---------- Save assistant reply in memory and trim memory ----------
-    conversation_history.append({"role": "assistant", "content": response})
-    if len(conversation_history) > 30:
-        conversation_history = conversation_history[-30:]
 
-    return jsonify({"reply": response})
+@app.route("/variants")
+def variant_comparison():
+    # Shadow/A-B models against the primary, summed over every worker (see variant_utils)
+    return jsonify(variant_report(variants))
 
 
 # =========================
@@ -483,4 +342,5 @@ def chat():
 if __name__ == "__main__":
     import os
     port = int(os.environ.get("PORT", 5000))  # Render sets this automatically
+    model_utils.warm_up()
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,91 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# =========================
+# Micro-batching settings
+# =========================
+BATCHING_ENABLED = os.environ.get("MODEL_BATCHING", "0") == "1"
+BATCH_MAX_SIZE = int(os.environ.get("MODEL_BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_SECONDS = float(os.environ.get("MODEL_BATCH_MAX_WAIT_MS", 3)) / 1000
+BATCH_QUEUE_DEPTH = int(os.environ.get("MODEL_BATCH_QUEUE_DEPTH", 1024))
+BATCH_RESULT_TIMEOUT_SECONDS = 30.0
+
+
+class MicroBatcher:
+    """Collect concurrent single-row predictions into batched model calls.
+
+    ``submit`` puts an encoded row on a bounded queue and waits for its
+    result. One scheduler thread per process takes the first waiting row,
+    keeps collecting for up to ``max_wait`` seconds or ``max_batch_size``
+    rows, runs ``predict_fn(state, X)`` once per model state in the batch
+    and hands each row its own ``(prediction, confidence)``. A full queue
+    raises ``queue.Full`` instead of letting latency grow without bound.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=BATCH_MAX_SIZE,
+                 max_wait=BATCH_MAX_WAIT_SECONDS, max_queue=BATCH_QUEUE_DEPTH):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.pid = None
+        self.start_lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+
+    def _ensure_started(self):
+        # One scheduler thread per process, also after a gunicorn fork
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=self.max_queue)
+            threading.Thread(target=self._run, name="model-batcher", daemon=True).start()
+            self.pid = os.getpid()
+
+    def submit(self, state, row):
+        """Predict one encoded row; blocks until its batch has run."""
+        self._ensure_started()
+        future = Future()
+        self.queue.put_nowait((state, row, future))
+        return future.result(timeout=BATCH_RESULT_TIMEOUT_SECONDS)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout <= 0:
+                        batch.append(self.queue.get_nowait())
+                    else:
+                        batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # Rows encoded against different model states (a hot reload landed
+        # mid-batch) are scored by their own state
+        groups = {}
+        for item in batch:
+            groups.setdefault(id(item[0]), []).append(item)
+        for items in groups.values():
+            try:
+                X = np.vstack([row for _, row, _ in items])
+                predictions, confidences = self.predict_fn(items[0][0], X)
+            except Exception as e:
+                for _, _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), prediction, confidence in zip(items, predictions, confidences):
+                future.set_result((int(prediction), float(confidence)))
+        self.batches += 1
+        self.rows += len(batch)
@@ -0,0 +1,75 @@
+"""Closed-loop load test for the /predict model path with and without micro-batching.
+
+Runs ``--clients`` threads that each call ``preprocess_and_predict`` back to
+back for ``--seconds`` and reports requests/s and p50/p99 latency. Run it from
+a directory holding the model artifacts (offline, the stand-in built by
+``stand_in_model.py``), e.g.
+
+    python benchmarks/stand_in_model.py benchmarks/.work
+    cd benchmarks/.work && python ../batching_load.py --clients 16 --seconds 10
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_utils  # noqa: E402
+from batching_utils import MicroBatcher  # noqa: E402
+from workload import latency_percentiles, random_web_form  # noqa: E402
+
+def run(clients, seconds):
+    latencies = []
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def client(seed):
+        rng = random.Random(seed)
+        local = []
+        while time.monotonic() < stop:
+            form = model_utils.build_form_data(random_web_form(rng))
+            start = time.perf_counter()
+            model_utils.preprocess_and_predict(form)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / seconds, 1),
+        **latency_percentiles(latencies, (50, 99)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=3)
+    args = parser.parse_args()
+
+    model_utils.warm_up()
+    results = {}
+    for mode in ("off", "on"):
+        model_utils.batcher = None if mode == "off" else MicroBatcher(
+            model_utils._predict_matrix, args.max_batch_size, args.max_wait_ms / 1000
+        )
+        results[f"batching_{mode}"] = run(args.clients, args.seconds)
+        if model_utils.batcher is not None:
+            results[f"batching_{mode}"]["mean_batch"] = round(
+                model_utils.batcher.rows / max(1, model_utils.batcher.batches), 1
+            )
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,353 @@
+"""Load test a local gunicorn instance with survey, chat and dashboard traffic.
+
+Starts gunicorn (``gunicorn.conf.py``) on the offline stand-in model in the
+benchmark work directory, or targets a running server with ``--url``, and
+drives it with closed-loop clients over keep-alive connections:
+
+* ``predict``: POST /predict with forms built from the ``index.html`` dropdowns
+* ``chat``: conversations of several POST /chat messages under one session cookie
+* ``dashboard``: GET /dashboard
+
+    python benchmarks/load.py --clients 16 --seconds 20 --mix predict=5,chat=4,dashboard=1
+    python benchmarks/load.py --sweep --workers 1,2,4 --threads 1,4 --clients 1,2,4,8,16,32
+
+Reports throughput, p50/p95/p99 latency and error rate per route as JSON.
+``--sweep`` restarts the server for every worker/thread combination, raises
+the client count step by step and records where throughput stops growing.
+The generator runs on the same machine and competes with the server for
+CPU, so compare results taken on the same host.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from run import DEFAULT_WORK_DIR, git_commit  # noqa: E402
+from stand_in_model import build_stand_in_model  # noqa: E402
+from workload import CHAT_MESSAGES, latency_percentiles, random_web_form  # noqa: E402
+
+DEFAULT_MIX = "predict=5,chat=4,dashboard=1"
+CHAT_TURNS = (2, 6)
+READY_TIMEOUT_SECONDS = 180.0
+# A step counts as saturated when more clients add less than this much throughput
+SATURATION_GAIN = 1.05
+# Building the stand-in model sets MODEL_STARTUP=lazy here; servers get the caller's environment
+SERVER_ENV = dict(os.environ)
+
+
+# =========================
+# Server
+# =========================
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """gunicorn on the stand-in model, in the benchmark work directory."""
+
+    def __init__(self, work_dir, workers, threads, extra_env=None):
+        self.work_dir = work_dir
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.scratch = tempfile.mkdtemp(prefix="wellness-load-")
+        env = dict(SERVER_ENV)
+        env.update({
+            "PORT": str(self.port),
+            "WEB_CONCURRENCY": str(workers),
+            "GUNICORN_THREADS": str(threads),
+            "METRICS_DIR": os.path.join(self.scratch, "metrics"),
+            "DRIFT_DIR": os.path.join(self.scratch, "drift"),
+            "PREDICTION_DB": os.path.join(self.scratch, "predictions.db"),
+            "APP_LOG_FILE": os.path.join(self.scratch, "app.log"),
+            "PYTHONPATH": REPO_ROOT,
+        })
+        env.update(extra_env or {})
+        # Removed by stop(), unless the server failed and its log is needed
+        self.keep_scratch = False
+        self.log = open(os.path.join(self.scratch, "gunicorn.log"), "wb")
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO_ROOT, "gunicorn.conf.py"), "app:app"],
+                cwd=work_dir, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+            )
+        except BaseException:
+            self.log.close()
+            shutil.rmtree(self.scratch, ignore_errors=True)
+            raise
+
+    def wait_ready(self, workers):
+        # Every worker warms up on its own; ask until several in a row say ready
+        deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+        streak = 0
+        while streak < 2 * workers:
+            if self.process.poll() is not None:
+                self.keep_scratch = True
+                raise SystemExit(f"❌ gunicorn exited; see {self.log.name}")
+            if time.monotonic() > deadline:
+                self.keep_scratch = True
+                raise SystemExit(f"❌ Server not ready after {READY_TIMEOUT_SECONDS:.0f}s; see {self.log.name}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+                conn.request("GET", "/readyz")
+                ready = conn.getresponse().status == 200
+                conn.close()
+            except OSError:
+                ready = False
+            streak = streak + 1 if ready else 0
+            if not ready:
+                time.sleep(0.5)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log.close()
+        if not self.keep_scratch:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+
+# =========================
+# Clients
+# =========================
+class Client:
+    """One simulated user: a keep-alive connection and a chat session."""
+
+    def __init__(self, url, seed):
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.rng = random.Random(seed)
+        self.conn = None
+        self.cookie = None
+        self.turns_left = 0
+
+    def _send(self, method, path, body=None, headers=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return response.status
+
+    def predict(self):
+        body = urllib.parse.urlencode(random_web_form(self.rng))
+        return self._send("POST", "/predict", body, {"Content-Type": "application/x-www-form-urlencoded"})
+
+    def chat(self):
+        # A conversation is a few turns under one cookie; then a new visitor
+        if self.turns_left == 0:
+            self.cookie = None
+            self.turns_left = self.rng.randint(*CHAT_TURNS)
+        self.turns_left -= 1
+        body = json.dumps({"message": self.rng.choice(CHAT_MESSAGES)})
+        return self._send("POST", "/chat", body, {"Content-Type": "application/json"})
+
+    def dashboard(self):
+        return self._send("GET", "/dashboard")
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(","):
+        route, weight = item.split("=", 1)
+        if route.strip() not in ("predict", "chat", "dashboard"):
+            raise SystemExit(f"❌ Unknown route in mix: {route}")
+        mix[route.strip()] = float(weight)
+    return mix
+
+
+def run_load(url, clients, seconds, mix, think_seconds=0.0, seed=0):
+    """Drive ``url`` with ``clients`` closed-loop users; returns per-route stats."""
+    routes, weights = zip(*mix.items())
+    samples = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    lock = threading.Lock()
+    start = time.monotonic()
+    stop = start + seconds
+
+    def user(i):
+        client = Client(url, seed * 10007 + i)
+        local = {route: [] for route in routes}
+        failed = {route: 0 for route in routes}
+        while time.monotonic() < stop:
+            route = client.rng.choices(routes, weights)[0]
+            began = time.perf_counter()
+            try:
+                ok = getattr(client, route)() < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+            local[route].append(time.perf_counter() - began)
+            failed[route] += not ok
+            if think_seconds:
+                time.sleep(client.rng.expovariate(1 / think_seconds))
+        with lock:
+            for route in routes:
+                samples[route].extend(local[route])
+                errors[route] += failed[route]
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+
+    report = {"clients": clients, "seconds": round(elapsed, 2), "routes": {}}
+    for route in routes:
+        report["routes"][route] = _stats(samples[route], errors[route], elapsed)
+    report["total"] = _stats([s for route in routes for s in samples[route]], sum(errors.values()), elapsed)
+    return report
+
+
+def _stats(latencies, errors, elapsed):
+    if not latencies:
+        return {"requests": 0, "rps": 0.0, "error_rate": 0.0}
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        **latency_percentiles(latencies),
+        "error_rate": round(errors / len(latencies), 4),
+    }
+
+
+# =========================
+# Sweep
+# =========================
+def sweep(work_dir, workers_list, threads_list, clients_list, seconds, mix, think_seconds):
+    """Ramp client concurrency for every worker/thread combination."""
+    for label, values in (("workers", workers_list), ("threads", threads_list), ("clients", clients_list)):
+        if not values or min(values) < 1:
+            raise ValueError(f"{label} must be a non-empty list of positive counts, got {values!r}")
+    results = []
+    for workers in workers_list:
+        for threads in threads_list:
+            print(f"⏱️ workers={workers} threads={threads}", file=sys.stderr)
+            server = LocalServer(work_dir, workers, threads)
+            try:
+                server.wait_ready(workers)
+                steps = []
+                best = None
+                for clients in clients_list:
+                    step = run_load(server.url, clients, seconds, mix, think_seconds)
+                    steps.append(step)
+                    rps = step["total"]["rps"]
+                    print(f"   {clients:4d} clients: {rps:8.1f} req/s, p99 {step['total'].get('p99_ms', 0):.1f} ms",
+                          file=sys.stderr)
+                    if best is not None and rps < best["total"]["rps"] * SATURATION_GAIN:
+                        break
+                    best = step if best is None or rps > best["total"]["rps"] else best
+            finally:
+                server.stop()
+            results.append({
+                "workers": workers,
+                "threads": threads,
+                "max_rps": best["total"]["rps"],
+                "saturation_clients": best["clients"],
+                "p99_ms_at_saturation": best["total"].get("p99_ms"),
+                "steps": steps,
+            })
+    return results
+
+
+def _ints(spec, label):
+    try:
+        values = [int(n) for n in spec.split(",") if n.strip()]
+    except ValueError:
+        values = []
+    if not values or min(values) < 1:
+        raise SystemExit(f"❌ --{label} takes positive counts, e.g. 1,2,4 (got {spec!r})")
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route weights, e.g. predict=5,chat=4,dashboard=1")
+    parser.add_argument("--clients", default="16", help="concurrent users (a list with --sweep)")
+    parser.add_argument("--seconds", type=float, default=20, help="per run (per step with --sweep)")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's requests")
+    parser.add_argument("--workers", default="2", help="gunicorn workers (a list with --sweep)")
+    parser.add_argument("--threads", default="1", help="threads per worker (a list with --sweep)")
+    parser.add_argument("--sweep", action="store_true", help="find the saturation point per worker/thread count")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    think_seconds = args.think_ms / 1000
+    work_dir = os.path.abspath(args.work_dir)
+    meta = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "mix": mix,
+        "think_ms": args.think_ms,
+    }
+
+    if args.sweep:
+        if args.url:
+            raise SystemExit("❌ --sweep starts its own servers; drop --url")
+        build_stand_in_model(work_dir)
+        report = {"meta": meta, "sweep": sweep(
+            work_dir, _ints(args.workers, "workers"), _ints(args.threads, "threads"), _ints(args.clients, "clients"),
+            args.seconds, mix, think_seconds,
+        )}
+    else:
+        server = None
+        url = args.url
+        if url is None:
+            build_stand_in_model(work_dir)
+            workers = _ints(args.workers, "workers")[0]
+            threads = _ints(args.threads, "threads")[0]
+            server = LocalServer(work_dir, workers, threads)
+            url = server.url
+            meta.update(workers=workers, threads=threads)
+        try:
+            if server is not None:
+                server.wait_ready(workers)
+            clients = _ints(args.clients, "clients")[0]
+            report = {"meta": meta, "result": run_load(url, clients, args.seconds, mix, think_seconds)}
+        finally:
+            if server is not None:
+                server.stop()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"✅ Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
@@ -0,0 +1,282 @@
+"""Offline benchmark suite for the app's hot paths.
+
+Runs without network access against a locally trained stand-in model (see
+``stand_in_model.py``) in a scratch working directory, and writes one JSON
+document per run so results can be diffed between commits:
+
+    python benchmarks/run.py --output before.json
+    ... change something ...
+    python benchmarks/run.py --output after.json
+    python benchmarks/run.py --compare before.json after.json
+
+Covered: single and batch prediction (model_utils and POST /predict), chat
+(emotion matching and POST /chat), GET /dashboard over prediction stores of
+1k/100k/1M rows, and prediction-log appends.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from stand_in_model import build_stand_in_model  # noqa: E402
+from workload import CHAT_MESSAGES, web_forms  # noqa: E402
+
+DEFAULT_WORK_DIR = os.path.join(BENCH_DIR, ".work")
+DASHBOARD_ROWS = [1000, 100000, 1000000]
+WEB_FORMS = web_forms(256, seed=1)
+
+
+# =========================
+# Timing helpers
+# =========================
+def measure(fn, iterations, warmup=5, rows_per_call=1):
+    """Call ``fn(i)`` ``iterations`` times; returns latency stats in microseconds."""
+    for i in range(warmup):
+        fn(i)
+    times = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        times[i] = time.perf_counter() - start
+    total = times.sum()
+    result = {
+        "iterations": iterations,
+        "mean_us": round(times.mean() * 1e6, 2),
+        "p50_us": round(np.percentile(times, 50) * 1e6, 2),
+        "p99_us": round(np.percentile(times, 99) * 1e6, 2),
+        "ops_per_s": round(iterations / total, 1),
+    }
+    if rows_per_call != 1:
+        result["rows_per_s"] = round(iterations * rows_per_call / total, 1)
+    return result
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True
+        )
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=REPO_ROOT).returncode != 0
+    except OSError:
+        return None
+    return out.stdout.strip() + ("-dirty" if dirty else "") if out.returncode == 0 else None
+
+
+# =========================
+# Benchmarks
+# =========================
+def bench_predict(results, scale):
+    import model_utils
+
+    forms = [model_utils.build_form_data(f) for f in WEB_FORMS]
+    state = model_utils.current_state()
+    n = len(forms)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results["predict.build_form_data"] = measure(
+            lambda i: model_utils.build_form_data(WEB_FORMS[i % n]), 2000 * scale
+        )
+        results["predict.encode"] = measure(
+            lambda i: state.feature_encoder.encode(forms[i % n]), 2000 * scale
+        )
+        results["predict.single"] = measure(
+            lambda i: model_utils.preprocess_and_predict(forms[i % n]), 100 * scale
+        )
+        for size in (32, 1000):
+            batch = [forms[i % n] for i in range(size)]
+            results[f"predict.batch_{size}"] = measure(
+                lambda i: model_utils.preprocess_and_predict_batch(batch), 5 * scale, warmup=1,
+                rows_per_call=size,
+            )
+
+
+def bench_http_predict(results, client, scale):
+    n = len(WEB_FORMS)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results["http.predict"] = measure(
+            lambda i: client.post("/predict", data=WEB_FORMS[i % n]), 50 * scale
+        )
+
+
+def bench_chat(results, client, scale):
+    from chat_utils import choose_response, detect_emotion, get_response_bank
+
+    bank = get_response_bank()
+    n = len(CHAT_MESSAGES)
+    history = [{"role": "user", "content": m} for m in CHAT_MESSAGES[:6]]
+    results["chat.detect_emotion"] = measure(
+        lambda i: detect_emotion(CHAT_MESSAGES[i % n], bank), 5000 * scale
+    )
+    results["chat.choose_response"] = measure(
+        lambda i: choose_response(detect_emotion(CHAT_MESSAGES[i % n], bank), history, bank), 5000 * scale
+    )
+    results["http.chat"] = measure(
+        lambda i: client.post("/chat", json={"message": CHAT_MESSAGES[i % n]}), 200 * scale
+    )
+
+
+def _fill_store(path, rows):
+    from store_utils import PredictionStore
+
+    # Stores are kept in the work dir and reused across runs
+    if os.path.exists(path):
+        store = PredictionStore(path)
+        if store.totals()[0] == rows:
+            return store
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    store = PredictionStore(path)
+    rng = np.random.default_rng(rows)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+    for offset in range(0, rows, 10000):
+        n = min(10000, rows - offset)
+        stamps = start + (offset + np.arange(n)) * 60.0
+        predictions = rng.integers(0, 2, n)
+        confidences = rng.uniform(0.5, 1.0, n)
+        store.write_rows([
+            [int(p), float(c), "You might be experiencing some stress" if p else "You seem mentally balanced",
+             datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds")]
+            for p, c, ts in zip(predictions, confidences, stamps)
+        ])
+    return store
+
+
+def bench_dashboard(results, client, scale, sizes):
+    import app as app_module
+
+    original = app_module.prediction_store
+    try:
+        for rows in sizes:
+            app_module.prediction_store = _fill_store(f"dashboard_{rows}.db", rows)
+            results[f"http.dashboard_{rows}"] = measure(lambda i: client.get("/dashboard"), 100 * scale)
+    finally:
+        app_module.prediction_store = original
+
+
+def bench_logging(results, scale):
+    from log_utils import CSVPredictionLog, PredictionLogWriter, utc_timestamp
+    from store_utils import PredictionStore
+
+    batch = [[1, 0.87, "You might be experiencing some stress", utc_timestamp()] for _ in range(64)]
+    for path in ("bench_log.csv", "bench_log.db"):
+        if os.path.exists(path):
+            os.remove(path)
+    csv_log = CSVPredictionLog("bench_log.csv")
+    store = PredictionStore("bench_log.db")
+    results["log.csv_write_64"] = measure(lambda i: csv_log.write_rows(batch), 200 * scale, rows_per_call=64)
+    results["log.store_write_64"] = measure(lambda i: store.write_rows(batch), 200 * scale, rows_per_call=64)
+
+    # Request-side cost of one log() call, then how long the queue takes to drain
+    writer = PredictionLogWriter(store)
+    results["log.enqueue"] = measure(
+        lambda i: writer.log(1, 0.87, "You might be experiencing some stress"), 5000 * scale
+    )
+    start = time.perf_counter()
+    writer.close()
+    results["log.enqueue"]["drain_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    results["log.enqueue"]["dropped"] = writer.dropped
+
+
+# =========================
+# Driver
+# =========================
+def run(work_dir, scale, sizes, only=None):
+    build_stand_in_model(work_dir)
+    os.chdir(work_dir)
+    os.environ["PREDICTION_DB"] = os.path.join(work_dir, "app_predictions.db")
+
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import app as app_module
+        import model_utils
+
+        model_utils.warm_up()
+    results = {"startup.import_and_warm_up": {"seconds": round(time.perf_counter() - started, 3)}}
+
+    client = app_module.app.test_client()
+    suites = {
+        "predict": lambda: bench_predict(results, scale),
+        "http_predict": lambda: bench_http_predict(results, client, scale),
+        "chat": lambda: bench_chat(results, client, scale),
+        "dashboard": lambda: bench_dashboard(results, client, scale, sizes),
+        "logging": lambda: bench_logging(results, scale),
+    }
+    for name, suite in suites.items():
+        if only and name not in only:
+            continue
+        print(f"⏱️ {name}", file=sys.stderr)
+        suite()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model": "stand-in",
+            "scale": scale,
+        },
+        "results": results,
+    }
+
+
+def compare(old_path, new_path, threshold):
+    """Print p50 ratios new/old; returns the benchmarks slower than ``threshold``."""
+    with open(old_path) as f:
+        old = json.load(f)["results"]
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    regressions = []
+    print(f"{'benchmark':32} {'old p50 us':>12} {'new p50 us':>12} {'ratio':>7}")
+    for name in sorted(set(old) & set(new)):
+        if "p50_us" not in old[name] or "p50_us" not in new[name]:
+            continue
+        ratio = new[name]["p50_us"] / max(old[name]["p50_us"], 1e-9)
+        flag = " ❌" if ratio > threshold else ""
+        print(f"{name:32} {old[name]['p50_us']:12.1f} {new[name]['p50_us']:12.1f} {ratio:7.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR)
+    parser.add_argument("--scale", type=int, default=1, help="multiply iteration counts")
+    parser.add_argument("--dashboard-rows", default=",".join(map(str, DASHBOARD_ROWS)))
+    parser.add_argument("--only", help="comma-separated suites: predict,http_predict,chat,dashboard,logging")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p50 ratio counted as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    output = os.path.abspath(args.output) if args.output else None
+    report = run(
+        os.path.abspath(args.work_dir),
+        args.scale,
+        [int(n) for n in args.dashboard_rows.split(",") if n],
+        args.only.split(",") if args.only else None,
+    )
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+        print(f"✅ Results written to {output}", file=sys.stderr)
+    else:
+        print(text)
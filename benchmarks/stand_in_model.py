@@ -0,0 +1,131 @@
+"""Build an offline stand-in for ``stack_model_1.pkl``.
+
+The real model is downloaded from Google Drive. For benchmarks we train a
+model with the same architecture and hyperparameters as the notebook's
+``stack_model_1`` (RF + LightGBM + CatBoost, CatBoost meta-learner,
+``passthrough=True``) on synthetic rows encoded through the app's own
+encoders, so it takes the same ``final_columns`` and costs about as much per
+prediction. Its predictions are meaningless.
+
+    python benchmarks/stand_in_model.py benchmarks/.work
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from workload import random_web_form  # noqa: E402
+
+# Everything model_utils and chat_utils read from the working directory
+ARTIFACTS = [
+    "binary_map.pkl", "mood_encoder.pkl", "days_encoder.pkl", "scaler.pkl",
+    "final_columns.pkl", "chat_responses.json",
+]
+
+
+def _survey_form(rng, columns, state):
+    """A form using the categories seen in training, so every column varies."""
+    form = {}
+    for field in ["Gender", "Country", "Occupation", "self_employed", "family_history",
+                  "Coping_Struggles", "Work_Interest", "mental_health_interview", "care_options"]:
+        prefix = f"{field}_"
+        options = [c[len(prefix):] for c in columns if c.startswith(prefix)] + ["other"]
+        form[field] = rng.choice(options)
+    form["Days_Indoors"] = rng.choice(list(state.days_encoder.categories_[0]))
+    form["Mood_Swings"] = rng.choice(list(state.mood_encoder.categories_[0]))
+    for field in ["Growing_Stress", "Changes_Habits", "Mental_Health_History", "Social_Weakness"]:
+        form[field] = rng.choice(list(state.binary_map))
+    form["Year"] = rng.choice([2014, 2015, 2016])
+    form["Month"] = rng.randint(1, 12)
+    form["Weekday"] = rng.choice(["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"])
+    form["Hour"] = rng.randint(0, 23)
+    return form
+
+
+def training_data(state, n_samples, seed):
+    """Scaled synthetic rows (half survey-like, half web-form-like) and labels."""
+    import pandas as pd
+    import model_utils
+
+    rng = random.Random(seed)
+    forms = [
+        _survey_form(rng, state.final_columns, state) if i % 2
+        else model_utils.build_form_data(random_web_form(rng))
+        for i in range(n_samples)
+    ]
+    X = model_utils._encode_batch(state, pd.DataFrame(forms))
+    X = state.scaler.transform(pd.DataFrame(X, columns=state.final_columns))
+    weights = np.random.default_rng(seed).normal(size=X.shape[1])
+    noise = np.random.default_rng(seed + 1).normal(scale=2.0, size=len(X))
+    y = (X @ weights + noise > 0).astype(int)
+    return pd.DataFrame(X, columns=state.final_columns), y
+
+
+def build_stand_in_model(work_dir, n_samples=20000, seed=42, force=False):
+    """Copy the small artifacts into ``work_dir`` and train a stand-in model there."""
+    os.environ.setdefault("MODEL_STARTUP", "lazy")
+    import joblib
+    import model_utils
+    from catboost import CatBoostClassifier
+    from lightgbm import LGBMClassifier
+    from sklearn.ensemble import RandomForestClassifier, StackingClassifier
+
+    os.makedirs(work_dir, exist_ok=True)
+    for name in ARTIFACTS:
+        shutil.copy(os.path.join(REPO_ROOT, name), os.path.join(work_dir, name))
+    model_path = os.path.join(work_dir, model_utils.MODEL_PATH)
+    if os.path.exists(model_path) and not force:
+        return model_path
+
+    state = model_utils.ModelState(
+        None,
+        joblib.load(os.path.join(work_dir, "mood_encoder.pkl")),
+        joblib.load(os.path.join(work_dir, "days_encoder.pkl")),
+        joblib.load(os.path.join(work_dir, "scaler.pkl")),
+        joblib.load(os.path.join(work_dir, "final_columns.pkl")),
+        joblib.load(os.path.join(work_dir, "binary_map.pkl")),
+    )
+    X, y = training_data(state, n_samples, seed)
+
+    # Same estimators as the notebook's stack_model_1
+    model = StackingClassifier(
+        estimators=[
+            ("rf", RandomForestClassifier(
+                n_estimators=100, max_depth=20, random_state=seed, min_samples_leaf=2, min_samples_split=2)),
+            ("lgb", LGBMClassifier(
+                n_estimators=200, learning_rate=0.1, max_depth=12, subsample=1.0, colsample_bytree=0.9,
+                random_state=seed, reg_alpha=0.5, reg_lambda=0, num_leaves=63, verbose=-1)),
+            ("cat", CatBoostClassifier(
+                iterations=500, learning_rate=0.075, depth=6, verbose=0, random_state=seed,
+                border_count=128, allow_writing_files=False)),
+        ],
+        final_estimator=CatBoostClassifier(
+            iterations=400, learning_rate=0.1, depth=6, verbose=0, random_state=seed,
+            allow_writing_files=False),
+        cv=3,
+        n_jobs=-1,
+        passthrough=True,
+    )
+    model.fit(X, y)
+
+    tmp_path = f"{model_path}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, model_path)
+    return model_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train an offline stand-in for stack_model_1.pkl.")
+    parser.add_argument("work_dir")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="retrain even if the model exists")
+    args = parser.parse_args()
+    path = build_stand_in_model(args.work_dir, args.samples, args.seed, args.force)
+    print(f"✅ Stand-in model ready at {path}")
@@ -0,0 +1,56 @@
+"""Representative inputs shared by the benchmarks.
+
+Form values are the dropdown options of ``templates/index.html`` (plus typical
+free-text answers), and chat messages cover every emotion pool.
+"""
+import random
+
+import numpy as np
+
+WEB_FORM_CHOICES = {
+    "gender": ["Male", "Female", "Other / Prefer not to say"],
+    "country": ["India", "United States", "United Kingdom", "Canada", "Germany", "Nigeria"],
+    "occupation": ["Student", "Engineer", "Homemaker", "Corporate", "Business", "Teacher"],
+    "family_history": ["Yes", "No", "Not sure"],
+    "growing_stress": ["Yes", "No", "Sometimes"],
+    "changes_habits": ["Yes", "No", "Maybe"],
+    "mood_swings": ["Rarely", "Sometimes", "Often"],
+    "coping_struggles": ["I find it hard to cope", "I manage most of the time", "I cope quite well"],
+    "work_interest": ["Yes", "No", "Sometimes"],
+    "mental_health_interview": ["Yes", "No", "Unsure"],
+    "care_options": ["Yes", "No", "Not sure"],
+    "days_indoors": ["Almost every day", "1–2 weeks per month", "3–4 weeks per month", "Over a month"],
+}
+
+CHAT_MESSAGES = [
+    "hi",
+    "I feel really anxious about my exams tomorrow",
+    "honestly i'm so tired and stressed, nothing is working out",
+    "I had a great day today, feeling happy and grateful!",
+    "not sure how I feel, just a normal day I guess",
+    "my manager keeps piling on work and I can't sleep",
+    "thanks, that actually helps a lot",
+    "I've been lonely since I moved to a new city and don't really talk to anyone anymore, "
+    "most evenings I just sit in my room scrolling and feeling worse about myself",
+    "what should I do?",
+    "feeling calm and relaxed after my walk",
+]
+
+
+def random_web_form(rng):
+    """One /predict submission as the browser sends it."""
+    form = {field: rng.choice(values) for field, values in WEB_FORM_CHOICES.items()}
+    form["height"] = str(rng.randint(150, 195))
+    form["weight"] = str(rng.randint(45, 110))
+    return form
+
+
+def web_forms(n, seed=0):
+    rng = random.Random(seed)
+    return [random_web_form(rng) for _ in range(n)]
+
+
+def latency_percentiles(latencies, percentiles=(50, 95, 99)):
+    """``{"p50_ms": ..., ...}`` for latencies given in seconds."""
+    times = np.asarray(latencies) * 1000
+    return {f"p{p}_ms": round(float(np.percentile(times, p)), 2) for p in percentiles}
@@ -0,0 +1,151 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime, timezone
+
+import joblib
+
+# =========================
+# Model bundle format
+# =========================
+# A bundle is a directory holding everything inference needs:
+#   manifest.json     format, version, creation time, sha256 + size per file
+#   model.joblib      the stacking model, dumped uncompressed so its NumPy
+#                     arrays can be memory-mapped instead of unpickled
+#   preprocess.joblib encoders, scaler, column order and binary map
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+MODEL_FILE = "model.joblib"
+PREPROCESS_FILE = "preprocess.joblib"
+
+
+class BundleError(ValueError):
+    """Raised when a bundle is missing files or fails its integrity check."""
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bundle_signature(path):
+    """Cheap identity of the bundle a path currently points to (follows symlinks)."""
+    real = os.path.realpath(path)
+    stat = os.stat(os.path.join(real, MANIFEST_NAME))
+    return real, stat.st_mtime_ns, stat.st_size
+
+
+def build_bundle(out_dir, version, model_path="stack_model_1.pkl"):
+    """Write a bundle from the loose pickles in the working directory.
+
+    The bundle is assembled in a temporary directory and renamed into
+    place, so a half-written bundle is never visible at ``out_dir``.
+    """
+    with open("binary_map.pkl", "rb") as f:
+        binary_map = pickle.load(f)
+    preprocess = {
+        "mood_encoder": joblib.load("mood_encoder.pkl"),
+        "days_encoder": joblib.load("days_encoder.pkl"),
+        "scaler": joblib.load("scaler.pkl"),
+        "final_columns": list(joblib.load("final_columns.pkl")),
+        "binary_map": binary_map,
+    }
+
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    joblib.dump(joblib.load(model_path), os.path.join(tmp_dir, MODEL_FILE))
+    joblib.dump(preprocess, os.path.join(tmp_dir, PREPROCESS_FILE))
+
+    files = {}
+    for name in (MODEL_FILE, PREPROCESS_FILE):
+        path = os.path.join(tmp_dir, name)
+        files[name] = {"sha256": sha256_file(path), "bytes": os.path.getsize(path)}
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": version,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "n_features": len(preprocess["final_columns"]),
+        "files": files,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.rename(tmp_dir, out_dir)
+    return manifest
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"unreadable manifest in {path}: {e}") from e
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"unsupported bundle format {manifest.get('format')!r}")
+    return manifest
+
+
+def verify_bundle(path):
+    """Check every file listed in the manifest against its size and sha256."""
+    manifest = read_manifest(path)
+    for name, meta in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            raise BundleError(f"{name} is missing from {path}")
+        if os.path.getsize(file_path) != meta["bytes"] or sha256_file(file_path) != meta["sha256"]:
+            raise BundleError(f"{name} in {path} does not match its manifest checksum")
+    return manifest
+
+
+def load_bundle(path, mmap_mode="r", with_model=True):
+    """Verify and load a bundle; returns the manifest and every artifact.
+
+    ``with_model=False`` skips loading the model itself, for processes that
+    only encode requests (see model_server_utils).
+    """
+    path = os.path.realpath(path)
+    manifest = verify_bundle(path)
+    bundle = joblib.load(os.path.join(path, PREPROCESS_FILE))
+    if len(bundle["final_columns"]) != manifest["n_features"]:
+        raise BundleError("final_columns does not match the manifest feature count")
+    bundle["model"] = joblib.load(os.path.join(path, MODEL_FILE), mmap_mode=mmap_mode) if with_model else None
+    bundle["manifest"] = manifest
+    return bundle
+
+
+def publish_bundle(bundle_dir, link_path):
+    """Atomically repoint ``link_path`` (a symlink) at ``bundle_dir``."""
+    verify_bundle(bundle_dir)
+    tmp_link = f"{link_path}.tmp-{os.getpid()}"
+    os.symlink(os.path.abspath(bundle_dir), tmp_link)
+    os.replace(tmp_link, link_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, verify and publish model bundles.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="bundle the loose pickles in the working directory")
+    build.add_argument("out_dir")
+    build.add_argument("--version", required=True)
+    build.add_argument("--model", default="stack_model_1.pkl")
+    sub.add_parser("verify", help="check a bundle's checksums").add_argument("bundle_dir")
+    publish = sub.add_parser("publish", help="point a live symlink at a bundle")
+    publish.add_argument("bundle_dir")
+    publish.add_argument("link_path")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        manifest = build_bundle(args.out_dir, args.version, args.model)
+        print(f"✅ Built bundle {manifest['version']} in {args.out_dir}")
+    elif args.command == "verify":
+        print(f"✅ Bundle {verify_bundle(args.bundle_dir)['version']} is intact")
+    else:
+        publish_bundle(args.bundle_dir, args.link_path)
+        print(f"✅ {args.link_path} -> {args.bundle_dir}")
@@ -0,0 +1,250 @@
+import csv
+import json
+import os
+import random
+import string
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+from event_log_utils import app_log
+
+# =========================
+# Companion response bank
+# =========================
+RESPONSE_BANK_PATH = "chat_responses.json"
+RELOAD_CHECK_SECONDS = 5.0
+
+# Checked in order: the first category with a hit wins
+EMOTIONS = ("negative", "positive", "neutral")
+
+# Everything but letters, digits and hyphens ("so-so") separates words
+TOKEN_TABLE = str.maketrans(
+    dict.fromkeys(string.punctuation.replace("-", "") + "‘’“”…–—«»¡¿", " ")
+)
+
+
+def tokenize(text):
+    return text.lower().translate(TOKEN_TABLE).split()
+
+
+class EmotionMatch(NamedTuple):
+    """Result of matching one message against the keyword sets."""
+    emotion: str
+    counts: dict
+    weights: dict
+
+
+class EmotionMatcher:
+    """Word-boundary keyword matcher compiled into one hash lookup table.
+
+    A message is tokenised once and intersected with the keyword set in C,
+    so the cost is linear in message length and independent of how many
+    keywords there are. Whole words only: "down" no longer matches
+    "download" and "good" no longer matches "goodbye".
+    """
+
+    def __init__(self, keywords, weights=None):
+        weights = weights or {}
+        self.lookup = {}
+        for emotion in EMOTIONS:
+            for word in keywords.get(emotion, ()):
+                word = word.lower()
+                # First category listing a word keeps it, like the old precedence
+                self.lookup.setdefault(word, (emotion, float(weights.get(word, 1.0))))
+        self.keywords = frozenset(self.lookup)
+
+    def emotion(self, text):
+        """Return only the winning category, skipping the per-category tallies."""
+        hits = self.keywords.intersection(tokenize(text))
+        if not hits:
+            return "unknown"
+        found = {self.lookup[word][0] for word in hits}
+        return next(e for e in EMOTIONS if e in found)
+
+    def match(self, text):
+        counts = dict.fromkeys(EMOTIONS, 0)
+        totals = dict.fromkeys(EMOTIONS, 0.0)
+        tokens = tokenize(text)
+        if self.keywords.isdisjoint(tokens):
+            return EmotionMatch("unknown", counts, totals)
+        lookup = self.lookup
+        for token in tokens:
+            hit = lookup.get(token)
+            if hit is not None:
+                counts[hit[0]] += 1
+                totals[hit[0]] += hit[1]
+        emotion = next((e for e in EMOTIONS if counts[e]), "unknown")
+        return EmotionMatch(emotion, counts, totals)
+
+    def match_many(self, texts):
+        """Yield an EmotionMatch for every text in ``texts``."""
+        match = self.match
+        for text in texts:
+            yield match(text)
+
+
+class ResponseBank(NamedTuple):
+    """Immutable keyword matcher and precombined response pools for /chat."""
+    matcher: EmotionMatcher
+    negative: tuple
+    positive: tuple
+    neutral: tuple
+    contextual: tuple
+    followups_context: tuple
+    context_neutral: tuple
+    context_positive: tuple
+
+
+def paraphrase(base, n):
+    """Create ``n`` gentle numbered variants of ``base``."""
+    return [f"{base} (nudge {i+1})" for i in range(n)]
+
+
+def build_response_bank(data):
+    """Build a ResponseBank from the parsed response data file."""
+    keywords = data["keywords"]
+    responses = data["responses"]
+    padding = data["padding"]
+
+    pool_negative = list(responses["negative"])
+    pool_positive = list(responses["positive"])
+    pool_neutral = list(responses["neutral"])
+    pool_context = list(responses["contextual"])
+
+    # Pad each pool to reach the grand total of >= target
+    total = len(pool_negative) + len(pool_positive) + len(pool_neutral) + len(pool_context)
+    needed = max(0, padding["target_total"] - total)
+
+    # Distribute padding across categories
+    pad_neg = needed // 4 + 1
+    pad_pos = needed // 4 + 1
+    pad_neu = needed // 4 + 1
+    pad_ctx = needed - (pad_neg + pad_pos + pad_neu)
+
+    pool_negative += paraphrase(padding["negative"], pad_neg)
+    pool_positive += paraphrase(padding["positive"], pad_pos)
+    pool_neutral += paraphrase(padding["neutral"], pad_neu)
+    pool_context += paraphrase(padding["contextual"], max(0, pad_ctx))
+
+    return ResponseBank(
+        matcher=EmotionMatcher(keywords, data.get("keyword_weights")),
+        negative=tuple(pool_negative),
+        positive=tuple(pool_positive),
+        neutral=tuple(pool_neutral),
+        contextual=tuple(pool_context),
+        followups_context=tuple(responses["followups"]) + tuple(pool_context),
+        context_neutral=tuple(pool_context + pool_neutral),
+        context_positive=tuple(pool_context + pool_positive),
+    )
+
+
+def load_response_bank(path=RESPONSE_BANK_PATH):
+    with open(path, encoding="utf-8") as f:
+        return build_response_bank(json.load(f))
+
+
+# =========================
+# Hot-reloadable bank holder
+# =========================
+_bank_lock = threading.Lock()
+_bank = load_response_bank()
+_bank_mtime = os.path.getmtime(RESPONSE_BANK_PATH)
+_next_check = time.monotonic() + RELOAD_CHECK_SECONDS
+
+
+def reload_response_bank(path=RESPONSE_BANK_PATH):
+    """Rebuild the bank from disk and swap it in atomically."""
+    global _bank, _bank_mtime
+    bank = load_response_bank(path)
+    with _bank_lock:
+        _bank = bank
+        _bank_mtime = os.path.getmtime(path)
+    return bank
+
+
+def get_response_bank():
+    """Return the current bank, reloading it if the data file changed.
+
+    The file is stat-ed at most once every ``RELOAD_CHECK_SECONDS``; a broken
+    edit keeps the previous bank in service.
+    """
+    global _next_check
+    now = time.monotonic()
+    if now >= _next_check:
+        _next_check = now + RELOAD_CHECK_SECONDS
+        try:
+            if os.path.getmtime(RESPONSE_BANK_PATH) != _bank_mtime:
+                reload_response_bank()
+        except (OSError, ValueError, KeyError) as e:
+            app_log.error("chat.bank_reload_failed", e, path=RESPONSE_BANK_PATH)
+    return _bank
+
+
+# =========================
+# Emotion detection + reply selection
+# =========================
+def detect_emotion(text, bank=None):
+    bank = bank or get_response_bank()
+    return bank.matcher.emotion(text)
+
+
+def choose_response(emotion, history, bank=None):
+    """Pick a reply for ``emotion`` given the conversation ``history``."""
+    bank = bank or get_response_bank()
+    if emotion == "negative":
+        return random.choice(bank.negative)
+    if emotion == "positive":
+        return random.choice(bank.positive)
+    if emotion == "neutral":
+        return random.choice(bank.neutral)
+
+    # contextual/unknown: pick from context pool or combine memory-based prompts
+    if len(history) > 1:
+        # inspect previous user entry to respond contextually
+        last = history[-2]["content"]
+        if bank.matcher.emotion(last) == "negative":
+            return random.choice(bank.followups_context)
+        return random.choice(bank.context_neutral)
+    return random.choice(bank.context_positive)
+
+
+# =========================
+# Offline transcript classification
+# =========================
+def _read_messages(path):
+    """Yield messages from a text file (one per line) or JSONL transcript."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                line = record.get("content") or record.get("message") or ""
+            yield line
+
+
+def classify_transcript(path, out):
+    """Write one CSV row of emotion, hit counts and weights per message."""
+    matcher = get_response_bank().matcher
+    writer = csv.writer(out)
+    writer.writerow(
+        ["emotion"] + [f"{e}_hits" for e in EMOTIONS] + [f"{e}_weight" for e in EMOTIONS]
+    )
+    rows = 0
+    for result in matcher.match_many(_read_messages(path)):
+        writer.writerow(
+            [result.emotion]
+            + [result.counts[e] for e in EMOTIONS]
+            + [result.weights[e] for e in EMOTIONS]
+        )
+        rows += 1
+    return rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python chat_utils.py TRANSCRIPT(.txt|.jsonl) > emotions.csv")
+    classify_transcript(sys.argv[1], sys.stdout)
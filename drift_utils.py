@@ -0,0 +1,522 @@
+import argparse
+import glob
+import hashlib
+import json
+import math
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+
+# =========================
+# Drift statistics settings
+# =========================
+# Every /predict input is counted into fixed-size per-process arrays; with
+# DRIFT_DIR set (gunicorn.conf.py does) they live in memory-mapped files
+# there and /drift sums all workers. Scores compare against DRIFT_BASELINE,
+# built from the training survey with `python drift_utils.py baseline`.
+# Both sides count answers by the encoded value the model sees (see
+# FeatureEncoder.field_key), so answers it cannot tell apart count as one.
+DRIFT_DIR = os.environ.get("DRIFT_DIR")
+# Counts of exited workers, folded together by gunicorn's child_exit hook
+RETIRED_FILE = "retired.totals"
+DRIFT_BASELINE = os.environ.get("DRIFT_BASELINE", "drift_baseline.json")
+# Baselines counted by raw answer, from before the encoded keys, are ignored
+BASELINE_KEYS = "encoded"
+
+# Exact counts, at most DRIFT_VALUES_PER_FIELD distinct values per field and process
+SMALL_FIELDS = [
+    "Gender", "family_history", "Days_Indoors", "Growing_Stress", "Changes_Habits",
+    "Mood_Swings", "Coping_Struggles", "Work_Interest", "mental_health_interview", "care_options",
+]
+# Free text: a count-min sketch each
+SKETCH_FIELDS = ["Country", "Occupation"]
+DRIFT_VALUES_PER_FIELD = 32
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+CONFIDENCE_BINS = 10  # over [0.5, 1.0]; a binary model's confidence is never below 0.5
+BASELINE_TOP_VALUES = 50
+# Raw answers remembered with their slots/sketch cells, so repeats skip normalising and hashing
+RAW_CACHE_SIZE = 4096
+OTHER = "__other__"
+
+# PSI rule of thumb: below 0.1 stable, up to 0.25 moderate, above that drifted
+PSI_MODERATE = 0.1
+PSI_DRIFT = 0.25
+PSI_EPSILON = 1e-4
+
+
+def _encoder():
+    import model_utils
+
+    model_utils.ensure_loaded()
+    return model_utils.feature_encoder
+
+
+def _key(encoder, field, value):
+    """The key one answer is counted under: its encoded value, or the normalised text of a sketch field."""
+    if field in SKETCH_FIELDS:
+        from model_utils import category_key
+
+        return category_key(value)
+    return encoder.field_key(field, value)
+
+
+def _sketch_cells(key):
+    # A stable hash (Python's hash() differs per process) split into one column per row
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * SKETCH_DEPTH).digest()
+    return [
+        row * SKETCH_WIDTH + int.from_bytes(digest[4 * row:4 * row + 4], "little") % SKETCH_WIDTH
+        for row in range(SKETCH_DEPTH)
+    ]
+
+
+def _confidence_bin(confidence):
+    return min(CONFIDENCE_BINS - 1, max(0, int((confidence - 0.5) * 2 * CONFIDENCE_BINS)))
+
+
+class DriftStats:
+    """Constant-memory counts of /predict inputs, outputs and confidence.
+
+    One float64 array per process holds, at fixed offsets, the row count,
+    prediction counts, the confidence histogram and a count-min sketch per
+    free-text field, followed by exact per-value counts for the small
+    categorical fields (values get a slot on first sight, up to a cap per
+    field, then count as ``__other__``). Like ``metrics_utils.Metrics``,
+    with ``directory`` set the array is a memory-mapped file per process
+    with a JSON index of its value slots, and ``collect()`` sums every
+    process; all the counts add up, so merging is exact (the sketches
+    merge cell by cell).
+    """
+
+    def __init__(self, directory=DRIFT_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.values = None
+        self.sketch_base = 3 + CONFIDENCE_BINS
+        self.value_base = self.sketch_base + len(SKETCH_FIELDS) * SKETCH_DEPTH * SKETCH_WIDTH
+        self.size = self.value_base + len(SMALL_FIELDS) * (DRIFT_VALUES_PER_FIELD + 1)
+        self.layout = [SMALL_FIELDS, SKETCH_FIELDS, DRIFT_VALUES_PER_FIELD, SKETCH_WIDTH,
+                       SKETCH_DEPTH, CONFIDENCE_BINS]
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.lock = threading.Lock()
+        self.values = None
+
+    def _ensure_open(self):
+        if self.values is not None:
+            return
+        self.slots = {}  # (field, value) -> slot
+        self.resolved = {}  # (field, raw answer) -> slots to increment
+        self.encoder = None  # the FeatureEncoder ``resolved`` was filled from
+        self.next_slot = {field: 1 for field in SMALL_FIELDS}  # slot 0 of a field is __other__
+        size = self.size * 8
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            # Named by pid and start time, so a reused pid never matches a retired file
+            self.stem = f"{os.getpid()}-{time.time_ns()}"
+            path = os.path.join(self.directory, f"{self.stem}.bin")
+            with open(path, "w+b") as f:
+                f.truncate(size)
+                buffer = mmap.mmap(f.fileno(), size)
+        else:
+            buffer = bytearray(size)
+        self.values = memoryview(buffer).cast("d")
+        self.pid = os.getpid()
+        self._write_index()
+
+    def _value_slot(self, i, field, key):
+        """Slot for one small-field value, allocated on first sight (lock held)."""
+        slot = self.slots.get((field, key))
+        if slot is None:
+            base = self.value_base + i * (DRIFT_VALUES_PER_FIELD + 1)
+            if self.next_slot[field] > DRIFT_VALUES_PER_FIELD:
+                return base
+            slot = self.slots[(field, key)] = base + self.next_slot[field]
+            self.next_slot[field] += 1
+            self._write_index()
+        return slot
+
+    def _write_index(self):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"{self.stem}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"layout": self.layout,
+                       "slots": [[field, key, slot] for (field, key), slot in self.slots.items()]}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _resolve(self, field, raw):
+        """Array positions one raw answer increments (lock held)."""
+        key = _key(self.encoder, field, raw)
+        if field in SKETCH_FIELDS:
+            base = self.sketch_base + SKETCH_FIELDS.index(field) * SKETCH_DEPTH * SKETCH_WIDTH
+            return [base + cell for cell in _sketch_cells(key)]
+        return [self._value_slot(SMALL_FIELDS.index(field), field, key)]
+
+    def observe(self, form_data, prediction, confidence):
+        """Count one /predict input and its result."""
+        encoder = _encoder()
+        with self.lock:
+            self._ensure_open()
+            if encoder is not self.encoder:
+                # A reloaded model may encode the same answers differently
+                self.resolved.clear()
+                self.encoder = encoder
+            values = self.values
+            values[0] += 1
+            if prediction in (0, 1):
+                values[1 + prediction] += 1
+            values[3 + _confidence_bin(confidence)] += 1
+            resolved = self.resolved
+            for field in SMALL_FIELDS + SKETCH_FIELDS:
+                raw = form_data.get(field)
+                positions = resolved.get((field, raw))
+                if positions is None:
+                    positions = self._resolve(field, raw)
+                    if len(resolved) >= RAW_CACHE_SIZE:
+                        resolved.clear()
+                    resolved[(field, raw)] = positions
+                for position in positions:
+                    values[position] += 1
+
+    def _read_files(self, path):
+        """``(values, slots)`` from one process's files, or None if they are of another layout."""
+        with open(f"{path}.json") as f:
+            index = json.load(f)
+        values = np.fromfile(f"{path}.bin", dtype=np.float64)
+        if index["layout"] == self.layout and len(values) == self.size:
+            return values, index["slots"]
+        return None
+
+    def _files(self):
+        """``{file stem: (values, slots)}`` of every live process in ``directory``."""
+        files = {}
+        for index_path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                snapshot = self._read_files(index_path[:-len(".json")])
+            except (OSError, ValueError):
+                continue
+            if snapshot is not None:
+                files[os.path.basename(index_path)[:-len(".json")]] = snapshot
+        return files
+
+    def _read_retired(self):
+        """``(retired file stems, fixed counts, value counts)`` summed from exited processes."""
+        fixed = np.zeros(self.value_base)
+        counts = {field: {} for field in SMALL_FIELDS}
+        try:
+            with open(os.path.join(self.directory, RETIRED_FILE)) as f:
+                retired = json.load(f)
+        except (OSError, ValueError):
+            return set(), fixed, counts
+        if retired["layout"] != self.layout:
+            return set(), fixed, counts
+        fixed += retired["fixed"]
+        for field, values in retired["counts"].items():
+            counts[field].update(values)
+        return set(retired["stems"]), fixed, counts
+
+    def _merge(self, fixed, counts, values, slots):
+        fixed += values[:self.value_base]
+        for field, key, slot in slots:
+            counts[field][key] = counts[field].get(key, 0.0) + values[slot]
+        for i, field in enumerate(SMALL_FIELDS):
+            other = self.value_base + i * (DRIFT_VALUES_PER_FIELD + 1)
+            if values[other]:
+                counts[field][OTHER] = counts[field].get(OTHER, 0.0) + values[other]
+
+    def collect(self):
+        """Merged counts of every process, as plain dicts and arrays."""
+        if not self.directory:
+            fixed = np.zeros(self.value_base)
+            counts = {field: {} for field in SMALL_FIELDS}
+            with self.lock:
+                self._ensure_open()
+                values = np.array(self.values, dtype=np.float64)
+                slots = [[field, key, slot] for (field, key), slot in self.slots.items()]
+            self._merge(fixed, counts, values, slots)
+        else:
+            # Live files first, retired totals second: a process retired in
+            # between is then either still in its files or listed as retired
+            files = self._files()
+            retired, fixed, counts = self._read_retired()
+            for stem, (values, slots) in files.items():
+                if stem not in retired:
+                    self._merge(fixed, counts, values, slots)
+        sketches = fixed[self.sketch_base:].reshape(len(SKETCH_FIELDS), SKETCH_DEPTH, SKETCH_WIDTH)
+        return {
+            "rows": fixed[0],
+            "predictions": {"0": fixed[1], "1": fixed[2]},
+            "confidence": fixed[3:3 + CONFIDENCE_BINS],
+            "counts": counts,
+            "sketches": dict(zip(SKETCH_FIELDS, sketches)),
+        }
+
+
+    def retire(self, pid):
+        """Fold the counts of exited process ``pid`` into the retired totals and remove its files."""
+        if not self.directory:
+            return
+        paths = [path[:-len(".json")] for path in glob.glob(os.path.join(self.directory, f"{pid}-*.json"))]
+        if not paths:
+            return
+        stems, fixed, counts = self._read_retired()
+        for path in paths:
+            try:
+                snapshot = self._read_files(path)
+            except (OSError, ValueError):
+                continue
+            if snapshot is not None:
+                self._merge(fixed, counts, *snapshot)
+        # Stems stay listed while their files may still be read by a scrape
+        live = {os.path.basename(p)[:-len(".json")] for p in glob.glob(os.path.join(self.directory, "*.json"))}
+        stems = (stems & live) | {os.path.basename(path) for path in paths}
+        retired_path = os.path.join(self.directory, RETIRED_FILE)
+        with open(f"{retired_path}.tmp", "w") as f:
+            json.dump({"stems": sorted(stems), "layout": self.layout, "fixed": fixed.tolist(), "counts": counts}, f)
+        os.replace(f"{retired_path}.tmp", retired_path)
+        for path in paths:
+            for suffix in (".json", ".bin"):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+
+
+def sketch_estimate(sketch, key):
+    """Count-min estimate of how often ``key`` was seen (never an underestimate)."""
+    return min(sketch.flat[cell] for cell in _sketch_cells(key))
+
+
+def clear_drift_dir(directory=DRIFT_DIR):
+    """Remove drift counts left by a previous server run."""
+    if not directory:
+        return
+    for path in glob.glob(os.path.join(directory, "*.bin")) + glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+    if os.path.exists(os.path.join(directory, RETIRED_FILE)):
+        os.remove(os.path.join(directory, RETIRED_FILE))
+
+
+# =========================
+# Drift scores
+# =========================
+def _distribution(counts):
+    total = sum(counts.values())
+    return {key: count / total for key, count in counts.items()} if total else {}
+
+
+def psi(expected, actual):
+    """Population stability index of ``actual`` against ``expected`` (dicts of probabilities)."""
+    score = 0.0
+    for key in set(expected) | set(actual):
+        e = max(expected.get(key, 0.0), PSI_EPSILON)
+        a = max(actual.get(key, 0.0), PSI_EPSILON)
+        score += (a - e) * math.log(a / e)
+    return score
+
+
+def js_distance(expected, actual):
+    """Jensen-Shannon distance (base 2, between 0 and 1)."""
+    total = 0.0
+    for key in set(expected) | set(actual):
+        e, a = expected.get(key, 0.0), actual.get(key, 0.0)
+        m = (e + a) / 2
+        if e:
+            total += e * math.log2(e / m) / 2
+        if a:
+            total += a * math.log2(a / m) / 2
+    return math.sqrt(max(total, 0.0))
+
+
+def _status(score):
+    return "drift" if score >= PSI_DRIFT else "moderate" if score >= PSI_MODERATE else "stable"
+
+
+def _compare(expected, actual, rows):
+    score = psi(expected, actual)
+    shifts = sorted(set(expected) | set(actual), key=lambda k: -abs(actual.get(k, 0.0) - expected.get(k, 0.0)))
+    return {
+        "psi": round(score, 4),
+        "js_distance": round(js_distance(expected, actual), 4),
+        "status": _status(score),
+        "rows": int(rows),
+        "largest_shifts": [
+            {"value": k, "baseline": round(expected.get(k, 0.0), 4), "live": round(actual.get(k, 0.0), 4)}
+            for k in shifts[:3]
+        ],
+    }
+
+
+def load_baseline(path=DRIFT_BASELINE):
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return baseline if baseline.get("keys") == BASELINE_KEYS else None
+
+
+def drift_report(stats, baseline):
+    """Live distributions, and their drift scores when there is a ``baseline``."""
+    live = stats.collect()
+    rows = live["rows"]
+    confidence = live["confidence"]
+    report = {
+        "rows": int(rows),
+        "predictions": {k: int(v) for k, v in live["predictions"].items()},
+        "confidence_histogram": [int(c) for c in confidence],
+        "baseline": None,
+        "fields": {},
+    }
+    if baseline is None:
+        for field, counts in live["counts"].items():
+            report["fields"][field] = {k: round(p, 4) for k, p in _distribution(counts).items()}
+        return report
+
+    report["baseline"] = {"rows": baseline["rows"], "source": baseline.get("source")}
+    if not rows:
+        return report
+    for field in SMALL_FIELDS:
+        expected = baseline["fields"].get(field)
+        if expected is None:
+            continue
+        counts = live["counts"][field]
+        # Values the baseline never saw are one "unseen" bucket on both sides
+        actual = {}
+        for key, count in counts.items():
+            bucket = key if key in expected else OTHER
+            actual[bucket] = actual.get(bucket, 0.0) + count / rows
+        report["fields"][field] = _compare(expected, actual, rows)
+    for field in SKETCH_FIELDS:
+        expected = baseline["fields"].get(field)
+        if expected is None:
+            continue
+        sketch = live["sketches"][field]
+        actual = {key: min(sketch_estimate(sketch, key) / rows, 1.0) for key in expected if key != OTHER}
+        actual[OTHER] = max(0.0, 1.0 - sum(actual.values()))
+        report["fields"][field] = _compare(expected, actual, rows)
+
+    if "confidence" in baseline:
+        bins = {str(i): p for i, p in enumerate(baseline["confidence"])}
+        report["fields"]["confidence"] = _compare(bins, {str(i): c / rows for i, c in enumerate(confidence)}, rows)
+        report["fields"]["prediction"] = _compare(
+            baseline["predictions"], {k: v / rows for k, v in live["predictions"].items()}, rows
+        )
+    scores = [f["psi"] for f in report["fields"].values()]
+    report["max_psi"] = max(scores) if scores else 0.0
+    report["status"] = _status(report["max_psi"])
+    return report
+
+
+# =========================
+# Training baseline
+# =========================
+def build_baseline(path, input_format=None, chunk_rows=20000, score=True):
+    """Exact distributions of a survey file (e.g. the training CSV) as a baseline."""
+    from score_utils import read_chunks, to_form_frame
+
+    input_format = input_format or ("parquet" if path.endswith((".parquet", ".pq")) else "csv")
+    encoder = _encoder()
+    counts = {field: {} for field in SMALL_FIELDS + SKETCH_FIELDS}
+    confidence = np.zeros(CONFIDENCE_BINS)
+    predictions = {"0": 0, "1": 0}
+    rows = 0
+    for frame in read_chunks(path, input_format, chunk_rows):
+        forms = to_form_frame(frame).reset_index(drop=True)
+        rows += len(forms)
+        for field in counts:
+            for raw, count in forms[field].value_counts(dropna=False).items():
+                key = _key(encoder, field, raw)
+                counts[field][key] = counts[field].get(key, 0) + int(count)
+        if score:
+            from model_utils import preprocess_and_predict_batch
+
+            labels, confidences = preprocess_and_predict_batch(forms)
+            if labels is None:
+                raise SystemExit("❌ Scoring the baseline rows failed; rerun with --no-score")
+            for label in labels:
+                predictions[str(int(label))] = predictions.get(str(int(label)), 0) + 1
+            for c in confidences:
+                confidence[_confidence_bin(c)] += 1
+
+    fields = {}
+    for field, values in counts.items():
+        dist = _distribution(values)
+        if field in SKETCH_FIELDS:
+            # Only the most common values are looked up in the sketch; the rest is one bucket
+            top = dict(sorted(dist.items(), key=lambda kv: -kv[1])[:BASELINE_TOP_VALUES])
+            top[OTHER] = max(0.0, 1.0 - sum(top.values()))
+            dist = top
+        fields[field] = dist
+    baseline = {"source": os.path.basename(path), "rows": rows, "keys": BASELINE_KEYS, "fields": fields}
+    if score and rows:
+        baseline["confidence"] = list(confidence / rows)
+        baseline["predictions"] = {k: v / rows for k, v in predictions.items()}
+    return baseline
+
+
+def check_baseline(path, input_format=None, sample_rows=2000, score=True, seed=0):
+    """Drift report of live traffic drawn from the survey file its own baseline is built from.
+
+    A random sample of the rows is counted the way /predict counts them
+    (``DriftStats.observe`` on their ``form_data``), so every field should
+    come out stable; a field that does not means the two sides count the
+    same answers under different keys.
+    """
+    from model_utils import preprocess_and_predict_batch
+    from score_utils import read_chunks, to_form_frame
+
+    input_format = input_format or ("parquet" if path.endswith((".parquet", ".pq")) else "csv")
+    baseline = build_baseline(path, input_format, score=score)
+    stats = DriftStats(directory=None)
+    fraction = min(1.0, sample_rows / max(baseline["rows"], 1))
+    for frame in read_chunks(path, input_format, 20000):
+        forms = to_form_frame(frame.sample(frac=fraction, random_state=seed)).reset_index(drop=True)
+        if forms.empty:
+            continue
+        records = forms.to_dict("records")
+        labels, confidences = preprocess_and_predict_batch(forms) if score else (None, None)
+        if labels is None:
+            labels, confidences = [0] * len(records), [0.5] * len(records)
+        for form_data, label, confidence in zip(records, labels, confidences):
+            stats.observe(form_data, int(label), float(confidence))
+    return drift_report(stats, baseline)
+
+
+drift_stats = DriftStats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or check the training baseline for /drift.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    base = sub.add_parser("baseline", help="distributions of a survey CSV/Parquet file")
+    base.add_argument("input", help="e.g. the training 'Mental Health Dataset.csv'")
+    base.add_argument("--out", default=DRIFT_BASELINE)
+    base.add_argument("--format", choices=["csv", "parquet"])
+    base.add_argument("--no-score", action="store_true", help="skip the confidence/prediction baseline")
+    check = sub.add_parser("check", help="score a sample of a survey file against its own baseline")
+    check.add_argument("input")
+    check.add_argument("--format", choices=["csv", "parquet"])
+    check.add_argument("--rows", type=int, default=2000, help="rows sampled as live traffic")
+    check.add_argument("--no-score", action="store_true")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MODEL_STARTUP", "lazy")
+    if args.command == "check":
+        report = check_baseline(args.input, args.format, args.rows, score=not args.no_score)
+        for field, scores in report["fields"].items():
+            print(f"📊 {field:>24}: psi {scores['psi']:.4f} ({scores['status']})")
+        if report.get("status", "stable") != "stable":
+            raise SystemExit(f"❌ Sampled rows drift from their own baseline (max psi {report['max_psi']})")
+        print(f"✅ {report['rows']} sampled rows match the baseline of {report['baseline']['rows']}")
+        raise SystemExit(0)
+    baseline = build_baseline(args.input, args.format, score=not args.no_score)
+    with open(f"{args.out}.tmp", "w") as f:
+        json.dump(baseline, f, indent=2)
+    os.replace(f"{args.out}.tmp", args.out)
+    print(f"✅ Baseline of {baseline['rows']} rows written to {args.out}")
@@ -0,0 +1,212 @@
+import atexit
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+from metrics_utils import metrics
+
+# =========================
+# Application log settings
+# =========================
+# One JSON object per line on stdout (or APP_LOG_FILE). Sampling rates are
+# "event=rate" pairs, e.g. LOG_SAMPLE_RATES="predict.form=0.05,predict.result=0"
+APP_LOG_FILE = os.environ.get("APP_LOG_FILE")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "info").lower()
+LOG_REDACT = os.environ.get("LOG_REDACT", "1") == "1"
+APP_LOG_QUEUE_SIZE = 10000
+ERROR_RATE_WINDOW_SECONDS = 60.0
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# Per-request events are sampled; anything not listed is always logged
+DEFAULT_SAMPLE_RATES = {
+    "predict.form": 0.01,
+    "predict.result": 0.01,
+}
+
+# Survey answers (web form and model names) and free text never reach the logs
+SENSITIVE_FIELDS = {
+    "gender", "country", "occupation", "self_employed", "family_history",
+    "days_indoors", "growing_stress", "changes_habits", "mental_health_history",
+    "mood_swings", "coping_struggles", "work_interest", "social_weakness",
+    "mental_health_interview", "care_options", "height", "weight", "message",
+}
+
+
+def parse_sample_rates(spec):
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in (spec or "").split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+def redact(value):
+    """Copy ``value`` with every sensitive field's value replaced."""
+    if isinstance(value, dict):
+        return {
+            key: "[redacted]" if str(key).lower() in SENSITIVE_FIELDS else redact(val)
+            for key, val in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(val) for val in value]
+    return value
+
+
+# Quoted text in exception messages, where form values usually turn up
+# (e.g. "could not convert string to float: 'abc'")
+QUOTED = re.compile(r"'[^'\n]*'|\"[^\"\n]*\"")
+
+
+def redact_message(text):
+    """Replace every quoted value in an exception message."""
+    return QUOTED.sub("'[redacted]'", text)
+
+
+def format_exception(exc, redact_values=True):
+    """Format ``exc`` with its traceback, redacting the exception messages (not the code lines)."""
+    chunks = traceback.TracebackException.from_exception(exc).format()
+    if not redact_values:
+        return "".join(chunks)
+    # Frames start with "  File", chain notices with a newline; the rest are messages
+    return "".join(
+        chunk if chunk.startswith(("Traceback", "  ", "\n")) else redact_message(chunk) for chunk in chunks
+    )
+
+
+class EventLogger:
+    """Structured, sampled application log written from a background thread.
+
+    ``event()`` decides on the request thread whether a record is kept
+    (level, per-event sample rate, error rate limit), redacts it and puts
+    it on a bounded queue; it never waits for I/O. The writer thread
+    serialises records to JSON lines and writes them in batches. A full
+    queue drops records and counts them instead of blocking.
+    """
+
+    def __init__(self, stream=None, path=APP_LOG_FILE, level=LOG_LEVEL,
+                 sample_rates=None, redact_fields=LOG_REDACT,
+                 error_window=ERROR_RATE_WINDOW_SECONDS, max_queue=APP_LOG_QUEUE_SIZE):
+        self.stream = stream
+        self.path = path
+        self.level = LEVELS.get(level, 20)
+        self.sample_rates = parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES")) \
+            if sample_rates is None else dict(sample_rates)
+        self.redact_fields = redact_fields
+        self.error_window = error_window
+        self.max_queue = max_queue
+        self.errors = {}  # error key -> [window start, suppressed count]
+        self.errors_lock = threading.Lock()
+        self.dropped = 0
+        self.closed = False
+        self.pid = None
+        self.start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # Started lazily so every gunicorn worker gets its own queue and thread
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=self.max_queue)
+            self.thread = threading.Thread(target=self._run, name="app-log", daemon=True)
+            self.thread.start()
+            self.closed = False
+            self.pid = os.getpid()
+
+    def event(self, event, level="info", **fields):
+        """Log one structured event, subject to the level and its sample rate."""
+        if LEVELS.get(level, 20) < self.level:
+            return
+        rate = self.sample_rates.get(event, 1.0)
+        if rate < 1.0:
+            if random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+        self._enqueue(event, level, fields)
+
+    def error(self, event, exc, **fields):
+        """Log an exception with its traceback; repeats are rate-limited.
+
+        The same event and error message is written at most once per
+        ``error_window`` seconds; the next record carries how many
+        identical errors were suppressed in between.
+        """
+        key = (event, type(exc).__name__, str(exc)[:200])
+        now = time.monotonic()
+        with self.errors_lock:
+            state = self.errors.get(key)
+            if state is not None and now - state[0] < self.error_window:
+                state[1] += 1
+                return
+            if len(self.errors) > 1000:
+                self.errors.clear()
+            suppressed = state[1] if state is not None else 0
+            self.errors[key] = [now, 0]
+        if suppressed:
+            fields["suppressed"] = suppressed
+        message = redact_message(str(exc)) if self.redact_fields else str(exc)
+        fields["error"] = f"{type(exc).__name__}: {message}"
+        fields["exc"] = exc  # formatted on the writer thread
+        self._enqueue(event, "error", fields)
+
+    def _enqueue(self, event, level, fields):
+        if self.redact_fields:
+            fields = redact(fields)
+        ts = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        record = {"ts": ts, "level": level, "event": event, "pid": os.getpid(), **fields}
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("wellness_errors_total", where="app_log_dropped")
+
+    def _format(self, record):
+        exc = record.pop("exc", None)
+        if exc is not None:
+            record["traceback"] = format_exception(exc, self.redact_fields)
+        return json.dumps(record, default=str, ensure_ascii=False) + "\n"
+
+    def _run(self):
+        log_file = open(self.path, "a", encoding="utf-8") if self.path else None
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            # Write whatever else is already waiting in the same call
+            while len(batch) < 256:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+            out = log_file or self.stream or sys.stdout
+            try:
+                out.write("".join(self._format(record) for record in batch if record is not None))
+                out.flush()
+            except Exception:
+                metrics.inc("wellness_errors_total", where="app_log_write")
+        if log_file is not None:
+            log_file.close()
+
+    def close(self):
+        """Flush queued records and stop the writer thread."""
+        if self.closed or self.pid != os.getpid():
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join(timeout=5.0)
+
+
+app_log = EventLogger()
@@ -0,0 +1,515 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+# =========================
+# Compiled (array-based) model settings
+# =========================
+# MODEL_ENGINE=fast serves stack_model_1 from flat NumPy arrays instead of
+# the sklearn/LightGBM/CatBoost objects (see model_utils)
+FAST_MODEL_PATH = "stack_model_1.fast.npz"
+FAST_FORMAT = 1
+LGBM_ZERO_THRESHOLD = 1e-35
+
+
+class CompileError(ValueError):
+    """Raised when a fitted model contains a part the compiler does not support."""
+
+
+# =========================
+# Tree walking
+# =========================
+WALK_CHUNK_ROWS = 256
+
+
+def _children(left, right):
+    # children[2 * node + go_left]: one gather per step instead of two and a select
+    children = np.empty(2 * len(left), dtype=np.int32)
+    children[0::2] = right
+    children[1::2] = left
+    return children
+
+
+def _walk(X, feature, threshold, children, roots, depth, missing=None):
+    """Leaf node reached by every row in every tree; ``(n_rows, n_trees)``.
+
+    All trees live in one set of flat node arrays. Leaves point to
+    themselves, so every tree is walked in lockstep with a handful of
+    vectorised gathers per level until no row moves any more. Rows are
+    taken in chunks so the working set stays in cache.
+    """
+    if len(X) > WALK_CHUNK_ROWS:
+        return np.concatenate([
+            _walk(X[i:i + WALK_CHUNK_ROWS], feature, threshold, children, roots, depth, missing)
+            for i in range(0, len(X), WALK_CHUNK_ROWS)
+        ])
+    flat = np.ascontiguousarray(X).ravel()
+    offsets = (np.arange(len(X), dtype=np.int64) * X.shape[1])[:, None]
+    node = np.broadcast_to(roots, (len(X), len(roots)))
+    for level in range(depth):
+        x = flat[offsets + feature[node]]
+        go_left = x <= threshold[node]
+        if missing is not None:
+            go_left = _lgbm_missing(x, go_left, node, threshold, *missing)
+        step = children[2 * node + go_left]
+        if level % 4 == 3 and np.array_equal(step, node):
+            break
+        node = step
+    return node
+
+
+def _lgbm_missing(x, go_left, node, threshold, missing_type, default_left):
+    # LightGBM: missing_type 0 = None (NaN is read as 0.0), 1 = Zero, 2 = NaN
+    kind = missing_type[node]
+    is_nan = np.isnan(x)
+    use_default = ((kind == 1) & (is_nan | (np.abs(x) <= LGBM_ZERO_THRESHOLD))) | ((kind == 2) & is_nan)
+    go_left = np.where(is_nan & (kind == 0), 0.0 <= threshold[node], go_left)
+    return np.where(use_default, default_left[node], go_left)
+
+
+def _sequential_sum(values):
+    # Left-to-right like the libraries' own per-tree accumulation
+    return np.cumsum(values, axis=1)[:, -1]
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+# =========================
+# Compiled estimators
+# =========================
+class CompiledForest:
+    """A fitted sklearn random forest / extra-trees classifier (binary)."""
+
+    kind = "forest"
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.children = _children(arrays["left"], arrays["right"])
+
+    @classmethod
+    def from_model(cls, model):
+        if model.n_outputs_ != 1 or len(model.classes_) != 2:
+            raise CompileError("only single-output binary forests are supported")
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            nodes = np.arange(n)
+            leaf = tree.children_left == -1
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, 0.0, tree.threshold))
+            lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+            counts = tree.value[:, 0, :]
+            values.append(counts[:, 1] / counts.sum(axis=1))
+            roots.append(offset)
+            offset += n
+            depth = max(depth, tree.max_depth)
+        return cls({
+            "feature": np.concatenate(features).astype(np.int32),
+            "threshold": np.concatenate(thresholds),
+            "left": np.concatenate(lefts).astype(np.int32),
+            "right": np.concatenate(rights).astype(np.int32),
+            "value": np.concatenate(values),
+            "roots": np.array(roots, dtype=np.int32),
+            "depth": np.array(depth),
+        })
+
+    def proba1(self, X):
+        a = self.arrays
+        # sklearn trees compare float32 features against float64 thresholds
+        X = X.astype(np.float32).astype(np.float64)
+        leaves = _walk(X, a["feature"], a["threshold"], self.children, a["roots"], int(a["depth"]))
+        return _sequential_sum(a["value"][leaves]) / len(a["roots"])
+
+
+class CompiledLightGBM:
+    """A fitted LGBMClassifier with the binary objective, from its JSON dump."""
+
+    kind = "lightgbm"
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.children = _children(arrays["left"], arrays["right"])
+        # Features with a Zero missing type split: exact zeros need the slow path there
+        zero = arrays["missing_type"] == 1
+        self.zero_features = np.unique(arrays["feature"][zero])
+
+    @classmethod
+    def from_model(cls, model):
+        dump = model.booster_.dump_model()
+        objective = dump.get("objective", "")
+        if not objective.startswith("binary") or dump.get("num_tree_per_iteration", 1) != 1:
+            raise CompileError(f"unsupported LightGBM objective {objective!r}")
+        sigmoid = 1.0
+        for part in objective.split():
+            if part.startswith("sigmoid:"):
+                sigmoid = float(part.split(":", 1)[1])
+
+        feature, threshold, left, right, value, missing, default_left, roots = [], [], [], [], [], [], [], []
+        depth = 0
+
+        def add(node, level):
+            nonlocal depth
+            i = len(feature)
+            for column in (feature, threshold, left, right, value, missing, default_left):
+                column.append(0)
+            if "leaf_value" in node or "split_feature" not in node:
+                left[i] = right[i] = i
+                value[i] = node.get("leaf_value", 0.0)
+                depth = max(depth, level)
+                return i
+            if node["decision_type"] != "<=":
+                raise CompileError("categorical LightGBM splits are not supported")
+            feature[i] = node["split_feature"]
+            threshold[i] = node["threshold"]
+            missing[i] = {"None": 0, "Zero": 1, "NaN": 2}[node["missing_type"]]
+            default_left[i] = node["default_left"]
+            left[i] = add(node["left_child"], level + 1)
+            right[i] = add(node["right_child"], level + 1)
+            return i
+
+        for tree in dump["tree_info"]:
+            roots.append(add(tree["tree_structure"], 0))
+        return cls({
+            "feature": np.array(feature, dtype=np.int32),
+            "threshold": np.array(threshold, dtype=np.float64),
+            "left": np.array(left, dtype=np.int32),
+            "right": np.array(right, dtype=np.int32),
+            "value": np.array(value, dtype=np.float64),
+            "missing_type": np.array(missing, dtype=np.int8),
+            "default_left": np.array(default_left, dtype=bool),
+            "roots": np.array(roots, dtype=np.int32),
+            "depth": np.array(depth),
+            "sigmoid": np.array(sigmoid),
+        })
+
+    def proba1(self, X):
+        a = self.arrays
+        # Only rows with NaNs (or near-zero values on Zero splits) need the missing-value rules
+        special = np.isnan(X).any() or (np.abs(X[:, self.zero_features]) <= LGBM_ZERO_THRESHOLD).any()
+        leaves = _walk(
+            X, a["feature"], a["threshold"], self.children, a["roots"], int(a["depth"]),
+            missing=(a["missing_type"], a["default_left"]) if special else None,
+        )
+        raw = _sequential_sum(a["value"][leaves])
+        return _sigmoid(float(a["sigmoid"]) * raw)
+
+
+class CompiledCatBoost:
+    """A fitted CatBoostClassifier (Logloss, float features only).
+
+    CatBoost trees are oblivious: every level of a tree tests one feature
+    against one border, so a row's leaf is just the bits of ``depth``
+    comparisons and a whole ensemble is evaluated with one gather.
+    """
+
+    kind = "catboost"
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    @classmethod
+    def from_model(cls, model):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.json")
+            model.save_model(path, format="json")
+            with open(path) as f:
+                dump = json.load(f)
+        loss = dump.get("model_info", {}).get("params", {}).get("loss_function", {}).get("type", "Logloss")
+        if loss not in ("Logloss", "CrossEntropy"):
+            raise CompileError(f"unsupported CatBoost loss {loss!r}")
+        if "oblivious_trees" not in dump or dump["features_info"].get("categorical_features"):
+            raise CompileError("only oblivious CatBoost trees on float features are supported")
+
+        flat_index = {
+            f["feature_index"]: f["flat_feature_index"] for f in dump["features_info"]["float_features"]
+        }
+        trees = dump["oblivious_trees"]
+        depth = max(len(t["splits"]) for t in trees)
+        features = np.zeros((len(trees), depth), dtype=np.int32)
+        # Unused levels of shallower trees compare against +inf and never set a bit
+        borders = np.full((len(trees), depth), np.inf, dtype=np.float32)
+        leaf_values = np.zeros((len(trees), 2 ** depth))
+        for t, tree in enumerate(trees):
+            for level, split in enumerate(tree["splits"]):
+                if split["split_type"] != "FloatFeature":
+                    raise CompileError(f"unsupported CatBoost split {split['split_type']!r}")
+                features[t, level] = flat_index[split["float_feature_index"]]
+                borders[t, level] = split["border"]
+            values = tree["leaf_values"]
+            leaf_values[t, :len(values)] = values
+        scale, bias = dump.get("scale_and_bias", [1.0, [0.0]])
+        return cls({
+            "feature": features,
+            "border": borders,
+            "leaf_values": leaf_values,
+            "scale": np.array(scale, dtype=np.float64),
+            "bias": np.array(bias[0] if isinstance(bias, list) else bias, dtype=np.float64),
+        })
+
+    def raw(self, X):
+        a = self.arrays
+        # CatBoost compares float32 features with float32 borders
+        X = X.astype(np.float32)
+        n_trees, depth = a["feature"].shape
+        leaf = np.broadcast_to(np.arange(n_trees, dtype=np.int32) << depth, (len(X), n_trees))
+        for level in range(depth):
+            leaf = leaf | ((X[:, a["feature"][:, level]] > a["border"][:, level]) << level)
+        values = a["leaf_values"].ravel()[leaf]
+        return float(a["scale"]) * _sequential_sum(values) + float(a["bias"])
+
+    def proba1(self, X):
+        return _sigmoid(self.raw(X))
+
+
+class CompiledLinear:
+    """A fitted binary LogisticRegression (the notebook's other meta-learner)."""
+
+    kind = "linear"
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    @classmethod
+    def from_model(cls, model):
+        if model.coef_.shape[0] != 1:
+            raise CompileError("only binary logistic regression is supported")
+        return cls({"coef": model.coef_[0].astype(np.float64), "intercept": np.array(model.intercept_[0])})
+
+    def proba1(self, X):
+        return _sigmoid(X @ self.arrays["coef"] + float(self.arrays["intercept"]))
+
+
+COMPILERS = {
+    "RandomForestClassifier": CompiledForest,
+    "ExtraTreesClassifier": CompiledForest,
+    "LGBMClassifier": CompiledLightGBM,
+    "CatBoostClassifier": CompiledCatBoost,
+    "LogisticRegression": CompiledLinear,
+}
+KINDS = {compiled.kind: compiled for compiled in COMPILERS.values()}
+
+
+def _compile_estimator(estimator):
+    compiler = COMPILERS.get(type(estimator).__name__)
+    if compiler is None:
+        raise CompileError(f"cannot compile {type(estimator).__name__}")
+    return compiler.from_model(estimator)
+
+
+# =========================
+# Compiled stacking model
+# =========================
+class CompiledStack:
+    """Array-only replacement for the fitted binary StackingClassifier.
+
+    Base learners produce the positive-class probability, the meta-learner
+    sees those columns followed by the original features when the stack
+    was trained with ``passthrough``, exactly as sklearn builds them.
+    ``predict_proba`` has the same signature and output as the original,
+    and nothing beyond NumPy is imported to evaluate it.
+    """
+
+    def __init__(self, base, final, passthrough, classes, meta=None):
+        self.base = base
+        self.final = final
+        self.passthrough = passthrough
+        self.classes_ = np.asarray(classes)
+        self.meta = meta or {}
+
+    @classmethod
+    def from_model(cls, model):
+        if type(model).__name__ != "StackingClassifier" or len(model.classes_) != 2:
+            raise CompileError("expected a fitted binary StackingClassifier")
+        estimators = [e for e in model.estimators_ if e != "drop"]
+        if any(method != "predict_proba" for method in model.stack_method_):
+            raise CompileError("only stack_method='predict_proba' is supported")
+        return cls(
+            [_compile_estimator(e) for e in estimators],
+            _compile_estimator(model.final_estimator_),
+            bool(model.passthrough),
+            model.classes_,
+            {"n_features": int(model.n_features_in_)},
+        )
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        columns = [est.proba1(X)[:, None] for est in self.base]
+        if self.passthrough:
+            columns.append(X)
+        p1 = self.final.proba1(np.hstack(columns))
+        return np.column_stack([1.0 - p1, p1])
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for est in self.base + [self.final] for a in est.arrays.values())
+
+    def save(self, path):
+        arrays = {}
+        parts = []
+        for i, est in enumerate(self.base + [self.final]):
+            parts.append(est.kind)
+            for name, array in est.arrays.items():
+                arrays[f"{i}.{name}"] = array
+        header = {
+            "format": FAST_FORMAT, "parts": parts, "passthrough": self.passthrough,
+            "classes": self.classes_.tolist(), "meta": self.meta,
+        }
+        arrays["header"] = np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            header = json.loads(data["header"].tobytes().decode("utf-8"))
+            if header.get("format") != FAST_FORMAT:
+                raise CompileError(f"unsupported compiled model format {header.get('format')!r}")
+            parts = []
+            for i, kind in enumerate(header["parts"]):
+                prefix = f"{i}."
+                arrays = {k[len(prefix):]: data[k] for k in data.files if k.startswith(prefix)}
+                parts.append(KINDS[kind](arrays))
+        return cls(parts[:-1], parts[-1], header["passthrough"], header["classes"], header["meta"])
+
+
+def compile_model(model):
+    return CompiledStack.from_model(model)
+
+
+def load_or_compile(model_path, compiled_path=FAST_MODEL_PATH):
+    """Load the compiled model, (re)building it from ``model_path`` when needed.
+
+    A compiled file is reused while it records the current size and mtime
+    of the source pickle (or when the pickle is absent, so a deployment can
+    ship only the compiled file and never load LightGBM or CatBoost).
+    """
+    source = None
+    if os.path.exists(model_path):
+        stat = os.stat(model_path)
+        source = [stat.st_size, stat.st_mtime_ns]
+    if os.path.exists(compiled_path):
+        compiled = CompiledStack.load(compiled_path)
+        if source is None or compiled.meta.get("source") == source:
+            return compiled
+
+    import joblib
+
+    compiled = compile_model(joblib.load(model_path))
+    compiled.meta["source"] = source
+    try:
+        compiled.save(compiled_path)
+    except OSError:
+        pass  # read-only deployments still get the in-memory engine
+    return compiled
+
+
+# =========================
+# Fidelity report
+# =========================
+def sample_forms(state, n, seed=0):
+    """Random form records over every category the encoders and columns know."""
+    rng = random.Random(seed)
+    options = {}
+    for field in ["Gender", "Country", "Occupation", "self_employed", "family_history",
+                  "Coping_Struggles", "Work_Interest", "mental_health_interview", "care_options"]:
+        prefix = f"{field}_"
+        options[field] = [c[len(prefix):] for c in state.final_columns if c.startswith(prefix)] + ["unknown"]
+    options["Days_Indoors"] = list(state.days_encoder.categories_[0]) + ["unknown"]
+    options["Mood_Swings"] = list(state.mood_encoder.categories_[0]) + ["unknown"]
+    for field in ["Growing_Stress", "Changes_Habits", "Mental_Health_History", "Social_Weakness"]:
+        options[field] = list(state.binary_map) + ["unknown"]
+    options["Year"] = [2014, 2015, 2016]
+    options["Month"] = list(range(1, 13))
+    options["Weekday"] = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+    options["Hour"] = list(range(24))
+    return [{field: rng.choice(values) for field, values in options.items()} for _ in range(n)]
+
+
+def _per_row_seconds(model, X, rows=200):
+    rows = min(rows, len(X))
+    start = time.perf_counter()
+    for i in range(rows):
+        model.predict_proba(X[i:i + 1])
+    return (time.perf_counter() - start) / rows
+
+
+def fidelity_report(original, compiled, X, columns):
+    """Compare the compiled model with the original on already scaled rows ``X``."""
+    import pandas as pd
+
+    frame = pd.DataFrame(X, columns=columns)
+    start = time.perf_counter()
+    expected = original.predict_proba(frame)
+    original_batch = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = compiled.predict_proba(X)
+    compiled_batch = time.perf_counter() - start
+
+    diff = np.abs(expected[:, 1] - actual[:, 1])
+    original_row = _per_row_seconds(original, frame)
+    compiled_row = _per_row_seconds(compiled, X)
+    return {
+        "rows": len(X),
+        "class_agreement": float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1))),
+        "max_abs_proba_diff": float(diff.max()),
+        "mean_abs_proba_diff": float(diff.mean()),
+        "original_us_per_row_single": round(original_row * 1e6, 1),
+        "compiled_us_per_row_single": round(compiled_row * 1e6, 1),
+        "original_us_per_row_batch": round(original_batch / len(X) * 1e6, 2),
+        "compiled_us_per_row_batch": round(compiled_batch / len(X) * 1e6, 2),
+        "compiled_bytes": compiled.nbytes,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile stack_model_1 into the fast array engine.")
+    parser.add_argument("--model", default="stack_model_1.pkl")
+    parser.add_argument("--out", default=FAST_MODEL_PATH)
+    parser.add_argument("--samples", type=int, default=20000, help="held-out rows for the fidelity report")
+    parser.add_argument("--input", help="score these survey/form CSV rows instead of random forms")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--min-agreement", type=float, default=0.999)
+    args = parser.parse_args()
+
+    os.environ.setdefault("MODEL_STARTUP", "lazy")
+    import joblib
+    import pandas as pd
+    import model_utils
+
+    state = model_utils.ModelState(
+        joblib.load(args.model), joblib.load("mood_encoder.pkl"), joblib.load("days_encoder.pkl"),
+        joblib.load("scaler.pkl"), joblib.load("final_columns.pkl"), joblib.load("binary_map.pkl"),
+    )
+    if args.input:
+        from score_utils import to_form_frame
+        forms = to_form_frame(pd.read_csv(args.input, dtype=str, keep_default_na=False, nrows=args.samples))
+    else:
+        forms = pd.DataFrame(sample_forms(state, args.samples, args.seed))
+    X = model_utils._encode_batch(state, forms)
+    X = state.scaler.transform(pd.DataFrame(X, columns=state.final_columns))
+
+    compiled = compile_model(state.model)
+    stat = os.stat(args.model)
+    compiled.meta["source"] = [stat.st_size, stat.st_mtime_ns]
+    report = fidelity_report(state.model, compiled, X, state.final_columns)
+    compiled.meta["fidelity"] = report
+    print(json.dumps(report, indent=2))
+    if report["class_agreement"] < args.min_agreement:
+        raise SystemExit(f"❌ Class agreement {report['class_agreement']:.4%} is below {args.min_agreement:.2%}")
+    compiled.save(args.out)
+    print(f"✅ Compiled model written to {args.out}")
@@ -0,0 +1,64 @@
+import gc
+import os
+import tempfile
+
+# =========================
+# Gunicorn settings
+# =========================
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+# More than one thread per worker lets MODEL_BATCHING=1 group concurrent requests
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+
+# Load the model once in the master (MODEL_STARTUP=eager, the default) and
+# share it copy-on-write with every forked worker
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Workers record metrics into per-process files here; /metrics sums them
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "wellness-metrics"))
+# ... and /predict input counts here, which /drift sums
+os.environ.setdefault("DRIFT_DIR", os.path.join(tempfile.gettempdir(), "wellness-drift"))
+
+# MODEL_SERVER=1: the model lives in a separate model server and workers only
+# hold the encoders (see model_server_utils). It is started here, before the
+# app is preloaded, because loading the app already asks the model for answers
+if os.environ.get("MODEL_SERVER", "0") == "1":
+    import model_server_utils
+    model_server_utils.start_model_server()
+
+
+def on_starting(server):
+    # Start every server run from zero
+    from metrics_utils import clear_metrics_dir
+    clear_metrics_dir(os.environ["METRICS_DIR"])
+    from drift_utils import clear_drift_dir
+    clear_drift_dir(os.environ["DRIFT_DIR"])
+
+
+def when_ready(server):
+    # Move everything loaded so far into the permanent GC generation so the
+    # collector does not touch (and un-share) the model's pages in workers
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # Warm up in each worker rather than the master: LightGBM/CatBoost start
+    # OpenMP thread pools on first use, and those do not survive a fork
+    import model_utils
+    model_utils.start_background_warm_up()
+
+
+def child_exit(server, worker):
+    # Fold an exited worker's counters into the retired totals and drop its
+    # files, so respawned and recycled workers do not pile up more to sum
+    from metrics_utils import metrics
+    metrics.retire(worker.pid)
+    from drift_utils import drift_stats
+    drift_stats.retire(worker.pid)
+
+
+def on_exit(server):
+    if os.environ.get("MODEL_SERVER", "0") == "1":
+        import model_server_utils
+        model_server_utils.stop_model_server()
@@ -0,0 +1,167 @@
+import atexit
+import csv
+import io
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from event_log_utils import app_log
+from metrics_utils import metrics
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; single-process only there
+    fcntl = None
+
+# =========================
+# Prediction log settings
+# =========================
+PREDICTION_LOG_PATH = "prediction_log.csv"
+LOG_FIELDS = ["Prediction", "Confidence", "Message", "Timestamp"]
+LOG_BATCH_SIZE = int(os.environ.get("PREDICTION_LOG_BATCH", 64))
+LOG_FLUSH_SECONDS = float(os.environ.get("PREDICTION_LOG_FLUSH_MS", 500)) / 1000
+LOG_FSYNC = os.environ.get("PREDICTION_LOG_FSYNC", "0") == "1"
+LOG_QUEUE_SIZE = 10000
+
+
+def utc_timestamp():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+
+class CSVPredictionLog:
+    """Flat CSV sink for prediction records, safe to share across workers.
+
+    Each batch is appended with a single write while holding an exclusive
+    ``flock`` on the file, so gunicorn workers never interleave partial
+    lines or write the header twice.
+    """
+
+    def __init__(self, path=PREDICTION_LOG_PATH, fsync=LOG_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self.header_checked = False
+
+    def write_rows(self, rows):
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerows(rows)
+        with open(self.path, "a+", newline="", encoding="utf-8") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    f.write(",".join(LOG_FIELDS) + "\n")
+                elif not self.header_checked:
+                    self._upgrade_header(f)
+                self.header_checked = True
+                f.write(buf.getvalue())
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _upgrade_header(self, f):
+        """Add the Timestamp column to a log written before it existed."""
+        f.seek(0)
+        header = f.readline().strip().split(",")
+        if header != LOG_FIELDS[:-1]:
+            f.seek(0, os.SEEK_END)
+            return
+        rest = f.read()
+        f.seek(0)
+        f.truncate()
+        f.write(",".join(LOG_FIELDS) + "\n")
+        f.write("".join(line + ",\n" for line in rest.splitlines()))
+
+
+class PredictionLogWriter:
+    """Hand prediction records to a sink from a background thread.
+
+    Requests only put a row on an in-memory queue. The writer thread
+    drains it in batches of up to ``batch_size`` rows or every
+    ``flush_seconds`` and passes each batch to ``sink.write_rows`` (a
+    CSVPredictionLog by default). ``close()`` (also registered with
+    ``atexit``) flushes whatever is still queued; records logged after it
+    are dropped and counted like those that find the queue full.
+    """
+
+    def __init__(self, sink=None, batch_size=LOG_BATCH_SIZE,
+                 flush_seconds=LOG_FLUSH_SECONDS, max_queue=LOG_QUEUE_SIZE):
+        self.sink = sink or CSVPredictionLog()
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.closed = False
+        self.pid = None
+        self.start_lock = threading.Lock()
+        self.lock = threading.Lock()  # guards closed, dropped and the stop marker
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # Started lazily so a writer created before a gunicorn fork gets its
+        # own queue and thread in every worker
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.lock = threading.Lock()
+            self.queue = queue.Queue(maxsize=self.max_queue)
+            self.thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+            self.thread.start()
+            self.closed = False
+            self.pid = os.getpid()
+
+    def log(self, prediction, confidence, message):
+        """Queue one record; never blocks the request thread."""
+        self._ensure_started()
+        row = [prediction, confidence, message, utc_timestamp()]
+        with self.lock:
+            # Checked under the lock close() takes, so nothing lands behind the stop marker
+            if not self.closed:
+                try:
+                    self.queue.put_nowait(row)
+                    return
+                except queue.Full:
+                    where = "log_dropped"
+            else:
+                where = "log_closed"
+            self.dropped += 1
+        metrics.inc("wellness_errors_total", where=where)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    row = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            if batch:
+                try:
+                    self.sink.write_rows(batch)
+                except Exception as e:
+                    metrics.inc("wellness_errors_total", where="log_write")
+                    app_log.error("prediction_log.write_failed", e, rows=len(batch))
+
+    def close(self):
+        """Flush queued records and stop the writer thread."""
+        if self.pid != os.getpid():
+            return
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,230 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+# =========================
+# Conversation memory settings
+# =========================
+MAX_TURNS = 30                  # messages kept per session (ring buffer)
+SESSION_TTL_SECONDS = 60 * 60   # idle sessions expire after an hour
+MAX_SESSIONS = 10000
+MAX_BYTES = 32 * 1024 * 1024    # hard cap on stored message text
+MEMORY_DB_PATH = "conversation_memory.db"
+
+
+# =========================
+# In-process backend
+# =========================
+class InProcessMemoryStore:
+    """Per-session ring buffers with LRU/TTL eviction and a byte cap.
+
+    Sessions live in an OrderedDict kept in last-used order, so expiring
+    idle sessions and enforcing the caps only ever pops from the front and
+    each message costs O(1) regardless of how many sessions are active.
+    """
+
+    def __init__(self, max_turns=MAX_TURNS, ttl=SESSION_TTL_SECONDS,
+                 max_sessions=MAX_SESSIONS, max_bytes=MAX_BYTES):
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sessions = OrderedDict()  # session_id -> [deque, last_seen, n_bytes]
+        self.n_bytes = 0
+        self.lock = threading.Lock()
+
+    def _evict(self, now):
+        while self.sessions:
+            sid, (messages, last_seen, n_bytes) = next(iter(self.sessions.items()))
+            if (now - last_seen <= self.ttl and len(self.sessions) <= self.max_sessions
+                    and self.n_bytes <= self.max_bytes):
+                break
+            del self.sessions[sid]
+            self.n_bytes -= n_bytes
+
+    def append(self, session_id, role, content):
+        now = time.time()
+        size = len(content)
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                entry = self.sessions[session_id] = [deque(maxlen=self.max_turns), now, 0]
+            else:
+                self.sessions.move_to_end(session_id)
+            messages = entry[0]
+            if len(messages) == self.max_turns:
+                dropped = len(messages[0]["content"])
+                entry[2] -= dropped
+                self.n_bytes -= dropped
+            messages.append({"role": role, "content": content})
+            entry[1] = now
+            entry[2] += size
+            self.n_bytes += size
+            self._evict(now)
+
+    def history(self, session_id):
+        """Return the session's messages, oldest first."""
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                return []
+            return list(entry[0])
+
+    def clear(self, session_id):
+        with self.lock:
+            entry = self.sessions.pop(session_id, None)
+            if entry is not None:
+                self.n_bytes -= entry[2]
+
+
+# =========================
+# SQLite backend (shared across workers)
+# =========================
+class SQLiteMemoryStore:
+    """Session memory in a WAL-mode SQLite file shared by all workers.
+
+    Each append is a few indexed statements: insert the message, trim the
+    session to ``max_turns`` by sequence number and bump its last-seen
+    time. A running total of stored text is kept in the same transaction;
+    past ``max_bytes`` the least recently used sessions are dropped at once.
+    Idle and excess sessions are swept every ``sweep_every`` appends.
+    """
+
+    def __init__(self, path=MEMORY_DB_PATH, max_turns=MAX_TURNS, ttl=SESSION_TTL_SECONDS,
+                 max_sessions=MAX_SESSIONS, max_bytes=MAX_BYTES, sweep_every=500):
+        self.path = path
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sweep_every = sweep_every
+        self.local = threading.local()
+        self.appends = 0
+        self.lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    last_seen REAL NOT NULL,
+                    next_seq INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions(last_seen);
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS usage (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    n_bytes INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO usage (id, n_bytes)
+                    SELECT 1, COALESCE(SUM(LENGTH(content)), 0) FROM messages;
+            """)
+
+    def _conn(self):
+        # One connection per thread and process; never reuse one across a fork
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def append(self, session_id, role, content):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            row = conn.execute(
+                "INSERT INTO sessions (session_id, last_seen, next_seq) VALUES (?, ?, 1) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_seen = excluded.last_seen, "
+                "next_seq = next_seq + 1 RETURNING next_seq",
+                (session_id, now),
+            ).fetchone()
+            seq = row[0]
+            conn.execute(
+                "INSERT INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                (session_id, seq, role, content),
+            )
+            trimmed = conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND seq <= ? RETURNING LENGTH(content)",
+                (session_id, seq - self.max_turns),
+            ).fetchall()
+            n_bytes = self._add_bytes(conn, len(content) - sum(size for (size,) in trimmed))
+            while n_bytes > self.max_bytes:
+                oldest = conn.execute("SELECT session_id FROM sessions ORDER BY last_seen LIMIT 1").fetchone()
+                if oldest is None:
+                    break
+                freed = conn.execute(
+                    "DELETE FROM messages WHERE session_id = ? RETURNING LENGTH(content)", oldest
+                ).fetchall()
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", oldest)
+                n_bytes = self._add_bytes(conn, -sum(size for (size,) in freed))
+        with self.lock:
+            self.appends += 1
+            sweep = self.appends % self.sweep_every == 0
+        if sweep:
+            self.sweep(now)
+
+    def _add_bytes(self, conn, delta):
+        return conn.execute(
+            "UPDATE usage SET n_bytes = n_bytes + ? WHERE id = 1 RETURNING n_bytes", (delta,)
+        ).fetchone()[0]
+
+    def history(self, session_id):
+        """Return the session's messages, oldest first."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT last_seen FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return []
+        rows = conn.execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, self.max_turns),
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def clear(self, session_id):
+        conn = self._conn()
+        with conn:
+            freed = conn.execute(
+                "DELETE FROM messages WHERE session_id = ? RETURNING LENGTH(content)", (session_id,)
+            ).fetchall()
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._add_bytes(conn, -sum(size for (size,) in freed))
+
+    def sweep(self, now=None):
+        """Drop idle sessions and the least recently used ones beyond the cap."""
+        now = now or time.time()
+        conn = self._conn()
+        with conn:
+            cutoff = now - self.ttl
+            overflow = conn.execute(
+                "SELECT last_seen FROM sessions ORDER BY last_seen DESC LIMIT 1 OFFSET ?",
+                (self.max_sessions,),
+            ).fetchone()
+            if overflow is not None:
+                cutoff = max(cutoff, overflow[0])
+            conn.execute(
+                "DELETE FROM messages WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE last_seen <= ?)",
+                (cutoff,),
+            )
+            conn.execute("DELETE FROM sessions WHERE last_seen <= ?", (cutoff,))
+            # Resync the running total with what is actually stored
+            conn.execute("UPDATE usage SET n_bytes = (SELECT COALESCE(SUM(LENGTH(content)), 0) FROM messages)")
+
+
+def make_memory_store():
+    """Build the store selected by the CHAT_MEMORY_BACKEND environment variable."""
+    backend = os.environ.get("CHAT_MEMORY_BACKEND", "memory")
+    if backend == "sqlite":
+        return SQLiteMemoryStore(os.environ.get("CHAT_MEMORY_DB", MEMORY_DB_PATH))
+    return InProcessMemoryStore()
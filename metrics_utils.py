@@ -0,0 +1,295 @@
+import bisect
+import glob
+import json
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+
+# =========================
+# Metrics settings
+# =========================
+# With METRICS_DIR set, every process keeps its series in a memory-mapped
+# file there and /metrics in any worker sums all of them (gunicorn.conf.py
+# sets it up). Unset means this process only. Series of exited workers are
+# folded into RETIRED_FILE there (gunicorn's child_exit hook).
+METRICS_DIR = os.environ.get("METRICS_DIR")
+RETIRED_FILE = "retired.totals"
+METRICS_SLOTS = 8192
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# Shadow/A-B confidence minus the primary model's, for the same request
+CONFIDENCE_DELTA_BUCKETS = (-0.5, -0.25, -0.1, -0.05, -0.01, 0.0, 0.01, 0.05, 0.1, 0.25, 0.5)
+
+METRICS = {
+    "wellness_http_requests_total": ("counter", "HTTP requests by route and status code."),
+    "wellness_http_request_seconds": ("histogram", "HTTP request latency by route."),
+    "wellness_stage_seconds": ("histogram", "Time spent in each stage of a request."),
+    "wellness_predictions_total": ("counter", "Predictions served by predicted class."),
+    "wellness_table_lookups_total": ("counter", "Prediction table lookups by result (hit or miss)."),
+    "wellness_model_server_requests_total": ("counter", "Model server calls from this worker by result (ok, busy, stale, error)."),
+    "wellness_chat_emotions_total": ("counter", "Chat messages by detected emotion."),
+    "wellness_variant_served_total": ("counter", "/predict answers served by each model variant."),
+    "wellness_variant_seconds": ("histogram", "Model variant scoring time by variant and path (live or shadow)."),
+    "wellness_variant_comparisons_total": ("counter", "Variant answers compared with the primary's, by variant and agreement."),
+    "wellness_variant_confidence_delta": ("histogram", "Variant confidence minus the primary's for the same request.",
+                                          CONFIDENCE_DELTA_BUCKETS),
+    "wellness_variant_jobs_total": ("counter", "Background comparison jobs by result (done, dropped, error)."),
+    "wellness_profiles_total": ("counter", "Request profiles written, by reason (sampled or header)."),
+    "wellness_errors_total": ("counter", "Errors absorbed by fallbacks, by where they happened."),
+}
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe(self.name, self.labels, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """Per-process counters and latency histograms, exported as Prometheus text.
+
+    Every series owns a fixed run of float64 slots in one array: a single
+    slot for a counter, or one slot per bucket plus sum and count for a
+    histogram (latency buckets unless the metric names its own). Recording
+    is a dict lookup and an in-place add under a lock. With ``directory``
+    set the array is a memory-mapped file per process with a small JSON
+    index of its series beside it, so ``render()`` can sum the live values
+    of every gunicorn worker without any coordination on the hot path.
+    """
+
+    def __init__(self, directory=METRICS_DIR, slots=METRICS_SLOTS, buckets=LATENCY_BUCKETS,
+                 metrics=METRICS):
+        self.directory = directory
+        self.slots = slots
+        self.buckets = tuple(buckets)
+        self.metrics = dict(metrics)
+        self.bucket_sets = {name: tuple(spec[2]) if len(spec) > 2 else self.buckets
+                            for name, spec in self.metrics.items()}
+        self.lock = threading.Lock()
+        self.values = None
+        # Each forked worker starts its own series (and file)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.lock = threading.Lock()
+        self.values = None
+
+    def _width(self, name):
+        return len(self.bucket_sets[name]) + 3 if self.metrics[name][0] == "histogram" else 1
+
+    def _ensure_open(self):
+        if self.values is not None:
+            return
+        self.series = {}
+        self.next_slot = 0
+        size = self.slots * 8
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            # Named by pid and start time, so a reused pid never matches a retired file
+            self.stem = f"{os.getpid()}-{time.time_ns()}"
+            path = os.path.join(self.directory, f"{self.stem}.bin")
+            with open(path, "w+b") as f:
+                f.truncate(size)
+                buffer = mmap.mmap(f.fileno(), size)
+        else:
+            buffer = bytearray(size)
+        # A float64 memoryview: element updates are far cheaper than on a NumPy array
+        self.values = memoryview(buffer).cast("d")
+        self.pid = os.getpid()
+
+    def _slot(self, name, labels):
+        """Return the first slot of a series, allocating it on first use (lock held)."""
+        self._ensure_open()
+        key = (name, labels)
+        base = self.series.get(key)
+        if base is None:
+            width = self._width(name)
+            if self.next_slot + width > self.slots:
+                return None
+            base = self.series[key] = self.next_slot
+            self.next_slot += width
+            self._write_index()
+        return base
+
+    def _write_index(self):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"{self.stem}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump([[name, list(labels), base] for (name, labels), base in self.series.items()], f)
+        os.replace(f"{path}.tmp", path)
+
+    def inc(self, name, value=1, **labels):
+        labels = tuple(sorted(labels.items())) if len(labels) > 1 else tuple(labels.items())
+        with self.lock:
+            base = self._slot(name, labels)
+            if base is not None:
+                self.values[base] += value
+
+    def _observe(self, name, labels, seconds):
+        buckets = self.bucket_sets[name]
+        i = bisect.bisect_left(buckets, seconds)
+        with self.lock:
+            base = self._slot(name, labels)
+            if base is not None:
+                n = len(buckets)
+                self.values[base + i] += 1
+                self.values[base + n + 1] += seconds
+                self.values[base + n + 2] += 1
+
+    def observe(self, name, seconds, **labels):
+        labels = tuple(sorted(labels.items())) if len(labels) > 1 else tuple(labels.items())
+        self._observe(name, labels, seconds)
+
+    def stage(self, stage):
+        """Context manager timing one request stage into ``wellness_stage_seconds``."""
+        return _StageTimer(self, "wellness_stage_seconds", (("stage", stage),))
+
+    def collect(self):
+        """Sum the series of every process; returns ``{(name, labels): values}``."""
+        if not self.directory:
+            with self.lock:
+                self._ensure_open()
+                return {
+                    key: np.array(self.values[base:base + self._width(key[0])], dtype=np.float64)
+                    for key, base in self.series.items()
+                }
+
+        # Live files first, retired totals second: a process retired in
+        # between is then either still in its files or listed as retired
+        files = {}
+        for index_path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                files[os.path.basename(index_path)[:-len(".json")]] = self._read_files(index_path[:-len(".json")])
+            except (OSError, ValueError):
+                continue
+        retired, totals = self._read_retired()
+        for stem, (series, values) in files.items():
+            if stem not in retired:
+                self._add(totals, series, values)
+        return totals
+
+    def _read_files(self, path):
+        with open(f"{path}.json") as f:
+            series = json.load(f)
+        return series, np.fromfile(f"{path}.bin", dtype=np.float64)
+
+    def _add(self, totals, series, values):
+        for name, labels, base in series:
+            if name not in self.metrics:
+                continue
+            key = (name, tuple(tuple(pair) for pair in labels))
+            chunk = values[base:base + self._width(name)]
+            totals[key] = totals[key] + chunk if key in totals else chunk.copy()
+
+    def _read_retired(self):
+        """``(retired file stems, {(name, labels): values})`` summed from exited processes."""
+        try:
+            with open(os.path.join(self.directory, RETIRED_FILE)) as f:
+                retired = json.load(f)
+        except (OSError, ValueError):
+            return set(), {}
+        totals = {}
+        for name, labels, values in retired["series"]:
+            if name in self.metrics and len(values) == self._width(name):
+                totals[(name, tuple(tuple(pair) for pair in labels))] = np.array(values, dtype=np.float64)
+        return set(retired["stems"]), totals
+
+    def retire(self, pid):
+        """Fold the series of exited process ``pid`` into the retired totals and remove its files.
+
+        Run from the gunicorn master when a worker exits, so respawned and
+        recycled workers do not leave files behind for every scrape to sum.
+        """
+        if not self.directory:
+            return
+        paths = [path[:-len(".json")] for path in glob.glob(os.path.join(self.directory, f"{pid}-*.json"))]
+        if not paths:
+            return
+        stems, totals = self._read_retired()
+        for path in paths:
+            try:
+                self._add(totals, *self._read_files(path))
+            except (OSError, ValueError):
+                continue
+        # Stems stay listed while their files may still be read by a scrape
+        live = {os.path.basename(p)[:-len(".json")] for p in glob.glob(os.path.join(self.directory, "*.json"))}
+        stems = (stems & live) | {os.path.basename(path) for path in paths}
+        retired_path = os.path.join(self.directory, RETIRED_FILE)
+        with open(f"{retired_path}.tmp", "w") as f:
+            series = [[name, list(labels), values.tolist()] for (name, labels), values in totals.items()]
+            json.dump({"stems": sorted(stems), "series": series}, f)
+        os.replace(f"{retired_path}.tmp", retired_path)
+        for path in paths:
+            for suffix in (".json", ".bin"):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        by_name = {}
+        for (name, labels), values in self.collect().items():
+            by_name.setdefault(name, []).append((labels, values))
+
+        lines = []
+        for name, (kind, help_text, *_) in self.metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, values in sorted(by_name.get(name, [])):
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_number(values[0])}")
+                    continue
+                buckets = self.bucket_sets[name]
+                n = len(buckets)
+                cumulative = np.cumsum(values[:n + 1])
+                for bound, count in zip(buckets + ("+Inf",), cumulative):
+                    le = bound if isinstance(bound, str) else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {_number(count)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(values[n + 1])}")
+                lines.append(f"{name}_count{_labels(labels)} {_number(values[n + 2])}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def clear_metrics_dir(directory=METRICS_DIR):
+    """Remove series files left by a previous server run."""
+    if not directory:
+        return
+    for path in glob.glob(os.path.join(directory, "*.bin")) + glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+    if os.path.exists(os.path.join(directory, RETIRED_FILE)):
+        os.remove(os.path.join(directory, RETIRED_FILE))
+
+
+metrics = Metrics()
@@ -0,0 +1,478 @@
+import argparse
+import os
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from event_log_utils import app_log
+from metrics_utils import metrics
+
+# =========================
+# Model server settings
+# =========================
+# MODEL_SERVER=1: the stacking model lives only in model server processes;
+# web workers keep the encoders and send them encoded rows over a Unix
+# socket. gunicorn.conf.py starts the server; standalone it is
+#   python model_server_utils.py serve
+MODEL_SERVER = os.environ.get("MODEL_SERVER", "0") == "1"
+MODEL_SERVER_SOCKET = os.environ.get(
+    "MODEL_SERVER_SOCKET", os.path.join(tempfile.gettempdir(), "wellness-model.sock"))
+MODEL_SERVER_PROCESSES = int(os.environ.get("MODEL_SERVER_PROCESSES", 1))
+# Rows a model process holds before answering "busy"; requests per web worker connection
+MODEL_SERVER_QUEUE_ROWS = int(os.environ.get("MODEL_SERVER_QUEUE_ROWS", 1024))
+MODEL_SERVER_INFLIGHT = int(os.environ.get("MODEL_SERVER_INFLIGHT", 64))
+MODEL_SERVER_TIMEOUT_SECONDS = float(os.environ.get("MODEL_SERVER_TIMEOUT", 10))
+MODEL_SERVER_START_TIMEOUT_SECONDS = 300.0
+# Queued requests are scored together up to this many rows
+MAX_BATCH_ROWS = 256
+RESPAWN_BACKOFF_SECONDS = (0.1, 5.0)
+SUPERVISOR_POLL_SECONDS = 0.5
+
+# Frames: a request is (id, rows, features, model version tag) + rows x
+# features float64; a response is (id, status, payload bytes) + rows x
+# (prediction, confidence) float64, or an error message
+REQUEST = struct.Struct("<IIII")
+RESPONSE = struct.Struct("<IBI")
+OK, BUSY, ERROR, STALE = 0, 1, 2, 3
+
+
+class ModelServerBusy(RuntimeError):
+    """Raised when the model server, or this worker's connection to it, is full."""
+
+
+class ModelServerStale(ModelServerBusy):
+    """Raised when the model server holds a different model version than the caller's encoders."""
+
+
+def version_tag(version):
+    """The 32-bit tag sent with each request so rows are only scored by the model they were encoded for."""
+    return zlib.crc32(str(version).encode())
+
+
+# =========================
+# Client (web workers)
+# =========================
+class ModelServerClient:
+    """This process's connection to the model server, used as ``ModelState.model``.
+
+    One Unix socket connection per process, opened on first use and again
+    after a fork or a lost connection. Requests are pipelined: any thread
+    writes its frame and waits on a future while a reader thread matches
+    responses to requests by id. More than ``max_inflight`` outstanding
+    requests, or a "busy" answer from the server, raise
+    ``ModelServerBusy`` at once instead of queueing. A request whose
+    connection dies (the model process crashed and is being respawned) is
+    retried once on a new connection.
+    """
+
+    def __init__(self, path=MODEL_SERVER_SOCKET, max_inflight=MODEL_SERVER_INFLIGHT,
+                 timeout=MODEL_SERVER_TIMEOUT_SECONDS):
+        self.path = path
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.sock = None
+        self.pending = {}
+        self.next_id = 0
+
+    def _connect(self):
+        """Open the connection (lock held), waiting out a respawn for up to ``timeout``."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                break
+            except OSError as e:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"model server not reachable at {self.path}: {e}") from e
+                time.sleep(0.05)
+        self.sock = sock
+        threading.Thread(target=self._read_responses, args=(sock,), name="model-server-reader",
+                         daemon=True).start()
+
+    def _drop(self, sock, error):
+        """Close ``sock`` and fail what was waiting on it (lock held)."""
+        if self.sock is not sock:
+            return
+        self.sock = None
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        for future in self.pending.values():
+            future.set_exception(ConnectionError(f"model server connection lost: {error}"))
+        self.pending.clear()
+
+    def _read_responses(self, sock):
+        try:
+            stream = sock.makefile("rb")
+            while True:
+                header = stream.read(RESPONSE.size)
+                if len(header) < RESPONSE.size:
+                    raise ConnectionError("closed by the model server")
+                request_id, status, size = RESPONSE.unpack(header)
+                payload = stream.read(size)
+                if len(payload) < size:
+                    raise ConnectionError("closed by the model server")
+                with self.lock:
+                    future = self.pending.pop(request_id, None)
+                if future is None:
+                    continue  # timed out meanwhile
+                if status == OK:
+                    future.set_result(np.frombuffer(payload, dtype="<f8").reshape(-1, 2))
+                elif status == BUSY:
+                    future.set_exception(ModelServerBusy("model server queue is full"))
+                elif status == STALE:
+                    future.set_exception(ModelServerStale(f"model server: {payload.decode('utf-8', 'replace')}"))
+                else:
+                    future.set_exception(RuntimeError(f"model server: {payload.decode('utf-8', 'replace')}"))
+        except (OSError, ValueError) as e:
+            with self.lock:
+                self._drop(sock, e)
+
+    def _send(self, X, tag):
+        future = Future()
+        with self.lock:
+            if len(self.pending) >= self.max_inflight:
+                raise ModelServerBusy(f"{len(self.pending)} requests already waiting on the model server")
+            if self.sock is None:
+                self._connect()
+            sock = self.sock
+            self.next_id = (self.next_id + 1) & 0xFFFFFFFF
+            request_id = self.next_id
+            self.pending[request_id] = future
+        # Writes have their own lock: the reader thread must never wait behind
+        # a large write, or the server could block writing to us in turn
+        try:
+            with self.send_lock:
+                sock.sendall(REQUEST.pack(request_id, *X.shape, tag))
+                sock.sendall(memoryview(X).cast("B"))
+        except OSError as e:
+            with self.lock:
+                self._drop(sock, e)
+        return request_id, future
+
+    def _request(self, X, tag):
+        for attempt in range(2):
+            request_id, future = self._send(X, tag)
+            try:
+                return future.result(timeout=self.timeout)
+            except ConnectionError:
+                if attempt:
+                    raise
+            finally:
+                with self.lock:
+                    self.pending.pop(request_id, None)
+
+    def predict_matrix(self, X, version):
+        """``(predictions, confidences)`` for rows ``X`` scaled by the encoders of ``version``.
+
+        Raises ``ModelServerStale`` when the server's model is another
+        version, e.g. while a new bundle is being picked up.
+        """
+        try:
+            result = self._request(np.ascontiguousarray(X, dtype="<f8"), version_tag(version))
+        except ModelServerStale:
+            metrics.inc("wellness_model_server_requests_total", result="stale")
+            raise
+        except ModelServerBusy:
+            metrics.inc("wellness_model_server_requests_total", result="busy")
+            raise
+        except Exception:
+            metrics.inc("wellness_model_server_requests_total", result="error")
+            raise
+        metrics.inc("wellness_model_server_requests_total", result="ok")
+        return result[:, 0].astype(int), result[:, 1].copy()
+
+
+model_server_client = ModelServerClient()
+
+
+# =========================
+# Model processes
+# =========================
+class ModelProcess:
+    """One model process: read requests from every connection, score them in batches.
+
+    Requests queue up while the model is busy, and the next model call
+    takes every queued request it can, up to ``MAX_BATCH_ROWS``. A request
+    that would take the queue past ``queue_rows`` is answered "busy" at
+    once (a single larger request is still taken when the queue is empty).
+    """
+
+    def __init__(self, listener, queue_rows=MODEL_SERVER_QUEUE_ROWS):
+        self.listener = listener
+        self.queue_rows = queue_rows
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}  # connection -> unread bytes
+        self.queue = deque()  # (connection, request id, version tag, rows)
+        self.queued_rows = 0
+
+    def run(self):
+        import model_utils
+
+        model_utils.warm_up()
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        while True:
+            for key, _ in self.selector.select(0 if self.queue else None):
+                if key.fileobj is self.listener:
+                    self._accept()
+                else:
+                    self._read(key.fileobj)
+            if self.queue:
+                self._score_batch(model_utils)
+
+    def _accept(self):
+        try:
+            conn, _ = self.listener.accept()
+        except BlockingIOError:
+            return  # another model process took it
+        conn.settimeout(MODEL_SERVER_TIMEOUT_SECONDS)
+        self.buffers[conn] = bytearray()
+        self.selector.register(conn, selectors.EVENT_READ)
+
+    def _close(self, conn):
+        if self.buffers.pop(conn, None) is not None:
+            self.selector.unregister(conn)
+            conn.close()
+
+    def _read(self, conn):
+        try:
+            data = conn.recv(1 << 16)
+        except OSError:
+            data = b""
+        if not data:
+            self._close(conn)
+            return
+        buffer = self.buffers[conn]
+        buffer += data
+        while len(buffer) >= REQUEST.size:
+            request_id, rows, features, tag = REQUEST.unpack_from(buffer)
+            end = REQUEST.size + rows * features * 8
+            if len(buffer) < end:
+                break
+            X = np.frombuffer(buffer, dtype="<f8", count=rows * features, offset=REQUEST.size)
+            X = X.reshape(rows, features).copy()
+            del buffer[:end]
+            if self.queued_rows and self.queued_rows + rows > self.queue_rows:
+                self._respond(conn, request_id, BUSY, b"")
+                continue
+            self.queue.append((conn, request_id, tag, X))
+            self.queued_rows += rows
+
+    def _respond(self, conn, request_id, status, payload):
+        if conn not in self.buffers:
+            return
+        try:
+            conn.sendall(RESPONSE.pack(request_id, status, len(payload)) + payload)
+        except OSError:
+            self._close(conn)
+
+    def _score_batch(self, model_utils):
+        batch = [self.queue.popleft()]
+        rows = len(batch[0][3])
+        while self.queue and rows + len(self.queue[0][3]) <= MAX_BATCH_ROWS:
+            batch.append(self.queue.popleft())
+            rows += len(batch[-1][3])
+        self.queued_rows -= rows
+
+        state = model_utils.current_state()
+        n_features = len(state.final_columns)
+        tag = version_tag(state.version)
+        scored = []
+        for conn, request_id, request_tag, X in batch:
+            if request_tag != tag:
+                # The sender and this process are on different bundles; whichever
+                # is behind picks up the current one on its next request
+                model_utils.check_bundle_soon()
+                self._respond(conn, request_id, STALE, f"serving model version {state.version}".encode())
+            elif X.shape[1] != n_features:
+                message = f"expected {n_features} features, got {X.shape[1]}"
+                self._respond(conn, request_id, ERROR, message.encode())
+            else:
+                scored.append((conn, request_id, X))
+        if not scored:
+            return
+        try:
+            predictions, confidences = model_utils._predict_matrix(state, np.vstack([X for *_, X in scored]))
+        except Exception as e:
+            app_log.error("model_server.predict_failed", e)
+            for conn, request_id, _ in scored:
+                self._respond(conn, request_id, ERROR, f"{type(e).__name__}: {e}".encode())
+            return
+        results = np.column_stack([predictions, confidences]).astype("<f8")
+        start = 0
+        for conn, request_id, X in scored:
+            self._respond(conn, request_id, OK, results[start:start + len(X)].tobytes())
+            start += len(X)
+
+
+# =========================
+# Supervisor
+# =========================
+def _listen(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(128)
+    return listener
+
+
+def _spawn(listener):
+    pid = os.fork()
+    if pid:
+        return pid
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        ModelProcess(listener).run()
+    except BaseException as e:
+        app_log.error("model_server.process_failed", e)
+    finally:
+        app_log.close()
+        os._exit(1)
+
+
+def serve(path=MODEL_SERVER_SOCKET, processes=MODEL_SERVER_PROCESSES, parent_pid=None):
+    """Load the model, then run ``processes`` model processes and respawn any that exit.
+
+    The model is loaded here once and the model processes are forked from
+    this process, sharing its pages copy-on-write the way gunicorn workers
+    share a preloaded app; each warms up (starting its native thread pools)
+    after the fork. The socket is only bound once the model has loaded, so
+    a connection that succeeds reaches a loaded model. With ``parent_pid``
+    the server shuts down when that process is gone.
+    """
+    import model_utils
+
+    model_utils.load_artifacts()
+    listener = _listen(path)
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    children = {_spawn(listener): time.monotonic() for _ in range(processes)}
+    app_log.event("model_server.started", socket=path, processes=processes, version=model_utils.model_state.version)
+
+    backoff = RESPAWN_BACKOFF_SECONDS[0]
+    while not stopping:
+        if parent_pid and os.getppid() != parent_pid:
+            break
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if not pid:
+            time.sleep(SUPERVISOR_POLL_SECONDS)
+            continue
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        # A process that dies right after starting is likely to again; back off
+        lived = time.monotonic() - started
+        backoff = RESPAWN_BACKOFF_SECONDS[0] if lived > 60 else min(backoff * 2, RESPAWN_BACKOFF_SECONDS[1])
+        app_log.event("model_server.respawn", level="warning", pid=pid, status=status,
+                      lived_seconds=round(lived, 1), backoff_seconds=backoff)
+        time.sleep(backoff)
+        children[_spawn(listener)] = time.monotonic()
+
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    listener.close()
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+# =========================
+# Starting from gunicorn
+# =========================
+_server_process = None
+
+
+def _reachable(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+def start_model_server(path=MODEL_SERVER_SOCKET, processes=MODEL_SERVER_PROCESSES):
+    """Start ``serve`` in a child process (once) and wait until it accepts connections."""
+    global _server_process
+    if _server_process is not None and _server_process.poll() is None:
+        return _server_process
+    env = dict(os.environ, MODEL_SERVER="0", MODEL_VARIANTS="")
+    _server_process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", "--socket", path,
+         "--processes", str(processes), "--parent-pid", str(os.getpid())],
+        env=env,
+    )
+    deadline = time.monotonic() + MODEL_SERVER_START_TIMEOUT_SECONDS
+    while not _reachable(path):
+        if _server_process.poll() is not None:
+            raise RuntimeError(f"model server exited with status {_server_process.returncode}")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"model server not ready after {MODEL_SERVER_START_TIMEOUT_SECONDS:.0f}s")
+        time.sleep(0.1)
+    return _server_process
+
+
+def stop_model_server():
+    global _server_process
+    if _server_process is not None and _server_process.poll() is None:
+        _server_process.terminate()
+        try:
+            _server_process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            _server_process.kill()
+    _server_process = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the stacking model to web workers over a Unix socket.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("serve", help="load the model and serve it until stopped")
+    run.add_argument("--socket", default=MODEL_SERVER_SOCKET)
+    run.add_argument("--processes", type=int, default=MODEL_SERVER_PROCESSES)
+    run.add_argument("--parent-pid", type=int, help="exit when this process exits")
+    args = parser.parse_args()
+
+    # This process owns the model; it must not forward to itself. Shadow and
+    # A/B variants run in the web workers, not here
+    os.environ["MODEL_SERVER"] = "0"
+    os.environ["MODEL_VARIANTS"] = ""
+    serve(args.socket, args.processes, args.parent_pid)
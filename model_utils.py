@@ -4,7 +4,16 @@ import pandas as pd
 import numpy as np
 import joblib
 import pickle
-import traceback
+import threading
+import time
+from sklearn.preprocessing import StandardScaler
+from batching_utils import MicroBatcher, BATCHING_ENABLED
+import fast_model_utils
+from model_server_utils import MODEL_SERVER, ModelServerClient, ModelServerStale, model_server_client
+from variant_utils import variants
+from profile_utils import profiled
+from event_log_utils import app_log
+from metrics_utils import metrics
 
 # =========================
 # ✅ Auto-download model from Google Drive if missing
@@ -15,29 +24,264 @@ MODEL_PATH = "stack_model_1.pkl"
 def download_model():
     """Download the model file from Google Drive if not already present."""
     if not os.path.exists(MODEL_PATH):
-        print("📥 Downloading model from Google Drive...")
+        app_log.event("model.download_started", url=MODEL_URL)
         response = requests.get(MODEL_URL, stream=True)
         response.raise_for_status()
         with open(MODEL_PATH, "wb") as f:
             for chunk in response.iter_content(chunk_size=8192):
                 if chunk:
                     f.write(chunk)
-        print("✅ Model downloaded successfully!")
+        app_log.event("model.download_finished", path=MODEL_PATH)
+
+# =========================
+# Load model and encoders (eager, background or lazy)
+# =========================
+# eager: load at import, so gunicorn --preload shares it copy-on-write
+# background: start loading at import without blocking it
+# lazy: load on the first prediction or warm_up() call
+MODEL_STARTUP = os.environ.get("MODEL_STARTUP", "eager")
+
+# MODEL_BUNDLE points at a versioned bundle directory (see bundle_utils);
+# unset means the loose pickles in the working directory
+MODEL_BUNDLE = os.environ.get("MODEL_BUNDLE")
+BUNDLE_CHECK_SECONDS = 10.0
+
+# sklearn: the fitted StackingClassifier as trained
+# fast: the same trees compiled into NumPy arrays (see fast_model_utils);
+# falls back to sklearn if the model cannot be compiled
+MODEL_ENGINE = os.environ.get("MODEL_ENGINE", "sklearn")
+
+
+class ModelState:
+    """One consistent set of model, encoders and compiled feature encoder.
+
+    Requests take a reference to the current state once and use only that,
+    so a hot reload can swap in a new state without affecting requests that
+    are already running.
+    """
+
+    def __init__(self, model, mood_encoder, days_encoder, scaler, final_columns, binary_map,
+                 version="legacy", source=None):
+        self.model = model
+        self.mood_encoder = mood_encoder
+        self.days_encoder = days_encoder
+        self.scaler = scaler
+        self.final_columns = list(final_columns)
+        self.binary_map = binary_map
+        self.version = version
+        self.source = source
+        self.table = None  # precomputed /predict answers, see table_utils
+        self.feature_encoder = FeatureEncoder(final_columns, binary_map, days_encoder, mood_encoder, scaler)
+
+
+stack_model_1 = mood_encoder = days_encoder = scaler = final_columns = None
+binary_map = feature_encoder = None
+model_state = None
+
+_load_lock = threading.Lock()
+_loaded = threading.Event()
+_warmed = threading.Event()
+load_error = None
+
+
+def _fast_engine(load_model, compile_model):
+    """Return the compiled model, or the original one if compiling fails."""
+    try:
+        return compile_model()
+    except Exception as e:
+        app_log.error("model.compile_failed", e)
+        return load_model()
+
+
+def _load_pickled_model():
+    download_model()
+    return joblib.load(MODEL_PATH)
+
+
+def _load_loose_model():
+    if MODEL_SERVER:
+        return model_server_client
+    if MODEL_ENGINE != "fast":
+        return _load_pickled_model()
+    # A shipped compiled model is enough; the pickle is only needed to build it
+    if not os.path.exists(fast_model_utils.FAST_MODEL_PATH):
+        download_model()
+    return _fast_engine(
+        _load_pickled_model,
+        lambda: fast_model_utils.load_or_compile(MODEL_PATH, fast_model_utils.FAST_MODEL_PATH),
+    )
+
+
+def _load_loose_pickles():
+    model = _load_loose_model()
+    with open("binary_map.pkl", "rb") as f:
+        binary_map = pickle.load(f)
+    return ModelState(
+        model,
+        joblib.load("mood_encoder.pkl"),
+        joblib.load("days_encoder.pkl"),
+        joblib.load("scaler.pkl"),
+        joblib.load("final_columns.pkl"),
+        binary_map,
+    )
+
+
+def _load_bundle_state(path):
+    import bundle_utils
+
+    # Pin the bundle the pointer names now; a publish landing mid-load is
+    # picked up by the next check instead of being recorded as this one
+    signature = bundle_utils.bundle_signature(path)
+    bundle = bundle_utils.load_bundle(signature[0], with_model=not MODEL_SERVER)
+    model = model_server_client if MODEL_SERVER else bundle["model"]
+    if MODEL_ENGINE == "fast" and not MODEL_SERVER:
+        model = _fast_engine(lambda: bundle["model"], lambda: fast_model_utils.compile_model(bundle["model"]))
+    return ModelState(
+        model,
+        bundle["mood_encoder"],
+        bundle["days_encoder"],
+        bundle["scaler"],
+        bundle["final_columns"],
+        bundle["binary_map"],
+        version=bundle["manifest"]["version"],
+        source=signature,
+    )
+
+
+def _set_state(state):
+    """Publish ``state`` as the current one (a single reference swap)."""
+    global stack_model_1, mood_encoder, days_encoder, scaler, final_columns
+    global binary_map, feature_encoder, model_state
+    model_state = state
+    # Module-level names kept for code that reads them directly
+    stack_model_1 = state.model
+    mood_encoder = state.mood_encoder
+    days_encoder = state.days_encoder
+    scaler = state.scaler
+    final_columns = state.final_columns
+    binary_map = state.binary_map
+    feature_encoder = state.feature_encoder
+
+
+def _attach_table(state):
+    """Serve /predict from the prediction table if there is one built for this model."""
+    import table_utils
+
+    path = table_utils.PREDICTION_TABLE
+    if not path or not os.path.exists(path):
+        return
+    try:
+        state.table = table_utils.PredictionTable.open(path, state)
+    except Exception as e:
+        app_log.error("model.table_failed", e, path=path)
+        return
+    if state.table is None:
+        app_log.event("model.table_stale", level="warning", path=path, version=state.version)
+    else:
+        app_log.event("model.table_loaded", path=path, rows=len(state.table.rows), version=state.version)
+
+
+def load_artifacts():
+    """Download (if needed) and load the model and encoders exactly once."""
+    global load_error
+    with _load_lock:
+        if _loaded.is_set():
+            return
+        try:
+            state = _load_bundle_state(MODEL_BUNDLE) if MODEL_BUNDLE else _load_loose_pickles()
+            _attach_table(state)
+            _set_state(state)
+            # Shadow/A-B models (MODEL_VARIANTS); one failing is logged and skipped
+            variants.load()
+            load_error = None
+            _loaded.set()
+        except Exception as e:
+            load_error = f"{type(e).__name__}: {e}"
+            raise
+
+
+def ensure_loaded():
+    if not _loaded.is_set():
+        load_artifacts()
+
+
+def is_loaded():
+    return _loaded.is_set()
 
-# Run download before loading
-download_model()
 
 # =========================
-# Load model and encoders once
+# Hot reload of model bundles
 # =========================
-stack_model_1 = joblib.load("stack_model_1.pkl")
-mood_encoder = joblib.load("mood_encoder.pkl")
-days_encoder = joblib.load("days_encoder.pkl")
-scaler = joblib.load("scaler.pkl")
-final_columns = joblib.load("final_columns.pkl")
+_reload_lock = threading.Lock()
+_next_bundle_check = 0.0
+# Signature of the last bundle that failed to load; not retried until it changes
+_failed_source = None
+
+
+def reload_model(path=None):
+    """Load a bundle, warm it up and atomically make it the current state.
+
+    In-flight requests finish on the state they started with. Returns the
+    new version; on any error the current state stays in service.
+    """
+    path = path or MODEL_BUNDLE
+    with _reload_lock:
+        state = _load_bundle_state(path)
+        _predict_one(state, dict(WARMUP_FORM))
+        _attach_table(state)
+        _set_state(state)
+        _loaded.set()
+        _warmed.set()
+    app_log.event("model.reloaded", version=state.version)
+    return state.version
+
+
+def _background_reload(signature):
+    global _failed_source
+    try:
+        reload_model()
+    except ModelServerStale as e:
+        # The model server has not picked this bundle up yet; retried on the next check
+        app_log.event("model.reload_deferred", level="warning", bundle=MODEL_BUNDLE, reason=str(e))
+    except Exception as e:
+        _failed_source = signature
+        app_log.error("model.reload_failed", e, bundle=MODEL_BUNDLE)
+
+
+def _maybe_reload():
+    # Cheap stat of the bundle pointer at most every BUNDLE_CHECK_SECONDS
+    global _next_bundle_check
+    now = time.monotonic()
+    if now < _next_bundle_check or _reload_lock.locked():
+        return
+    _next_bundle_check = now + BUNDLE_CHECK_SECONDS
+    import bundle_utils
+
+    try:
+        signature = bundle_utils.bundle_signature(MODEL_BUNDLE)
+    except OSError:
+        return
+    if signature != model_state.source and signature != _failed_source:
+        threading.Thread(target=_background_reload, args=(signature,), name="model-reload", daemon=True).start()
+
+
+def check_bundle_soon():
+    """Make the next request check the bundle pointer instead of waiting out BUNDLE_CHECK_SECONDS."""
+    global _next_bundle_check
+    _next_bundle_check = 0.0
+
+
+def current_state():
+    """Return the model state to use for one request."""
+    ensure_loaded()
+    if MODEL_BUNDLE:
+        _maybe_reload()
+    return model_state
+
+
+def is_warm():
+    return _warmed.is_set()
 
-with open("binary_map.pkl", "rb") as f:
-    binary_map = pickle.load(f)
 
 # =========================
 # Cached helper data
@@ -60,6 +304,39 @@ numeric_cols = [
     "Weekday_sin", "Weekday_cos"
 ]
 
+# =========================
+# Web form -> model input
+# =========================
+def build_form_data(form_dict):
+    """Map /predict form field names to the ``form_data`` dict the model expects."""
+    def safe_get(key, default="unknown"):
+        val = form_dict.get(key)
+        if val is None or str(val).strip() == "":
+            return default
+        return str(val).strip()
+    return {
+        "Gender": safe_get("gender"),
+        "Country": safe_get("country"),
+        "Occupation": safe_get("occupation"),
+        "self_employed": "no",  # not in form
+        "family_history": safe_get("family_history", "no"),
+        "Days_Indoors": safe_get("days_indoors", "15-30 days"),
+        "Growing_Stress": safe_get("growing_stress", "no"),
+        "Changes_Habits": safe_get("changes_habits", "no"),
+        "Mental_Health_History": "no",  # not in form
+        "Mood_Swings": safe_get("mood_swings", "medium"),
+        "Coping_Struggles": safe_get("coping_struggles", "no"),
+        "Work_Interest": safe_get("work_interest", "no"),
+        "Social_Weakness": "no",  # not in form
+        "mental_health_interview": safe_get("mental_health_interview", "no"),
+        "care_options": safe_get("care_options", "no"),
+        "Year": 2014,
+        "Month": 8,
+        "Weekday": "wednesday",
+        "Hour": 11
+    }
+
+
 # =========================
 # Safe encoder helper
 # =========================
@@ -71,74 +348,339 @@ def safe_encode(encoder, value, default):
     except Exception:
         return encoder.transform([[default]])[0]
 
+def category_key(raw_val):
+    """Normalise a categorical answer the way its one-hot column name is looked up."""
+    if raw_val is None or pd.isna(raw_val):
+        return "unknown"
+    return str(raw_val).strip().lower().replace(" ", "_")
+
+# =========================
+# Precompiled feature encoder
+# =========================
+class FeatureEncoder:
+    """Map cleaned form fields straight to a scaled feature vector.
+
+    Compiled once from ``final_columns``, ``binary_map``, the ordinal
+    encoders' ``categories_`` and the scaler. Every finite-valued field
+    becomes a lookup table of already-scaled values, so encoding a request
+    is a handful of dict lookups into a copy of a preallocated base vector
+    and produces the same vector as the pandas/sklearn pipeline.
+    """
+
+    def __init__(self, final_columns, binary_map, days_encoder, mood_encoder, scaler):
+        self.columns = list(final_columns)
+        self.scaler = scaler
+        self.index = {col: i for i, col in enumerate(self.columns)}
+
+        # Scaling can be folded into the tables when it is a per-column affine map
+        self.folded = isinstance(scaler, StandardScaler)
+        n_cols = len(self.columns)
+        if self.folded:
+            self.mean = scaler.mean_ if scaler.with_mean else np.zeros(n_cols)
+            self.scale = scaler.scale_ if scaler.with_std else np.ones(n_cols)
+        self.base = self._scaled_rows(np.zeros((1, n_cols)))[0]
+
+        # Weekday -> (Weekday, Weekday_sin, Weekday_cos)
+        weekday_cols = [c for c in ("Weekday", "Weekday_sin", "Weekday_cos") if c in self.index]
+        self.weekday_table = {
+            day: self._slots({
+                "Weekday": num,
+                "Weekday_sin": np.sin(2 * np.pi * np.array([num]) / 7)[0],
+                "Weekday_cos": np.cos(2 * np.pi * np.array([num]) / 7)[0],
+            }, weekday_cols)
+            for day, num in list(weekday_map.items()) + [(None, 0)]
+        }
+
+        # Ordinal fields: category -> encoded value, unknowns fall back to the default
+        self.ordinal_tables = []
+        # Field -> (answer -> text key of its encoded value, key of other answers, normalised?)
+        self.keys = {}
+        for field, encoder, default in [
+            ("Days_Indoors", days_encoder, "15-30 days"),
+            ("Mood_Swings", mood_encoder, "medium"),
+        ]:
+            cats = list(encoder.categories_[0])
+            codes = encoder.transform(np.array(cats, dtype=object).reshape(-1, 1))[:, 0]
+            table = {cat: self._slots({field: code}, [field]) for cat, code in zip(cats, codes)}
+            self.ordinal_tables.append((field, table, table[default]))
+            self.keys[field] = ({cat: cat for cat in cats}, default, False)
+
+        # Binary fields: raw answer -> binary_map value, unknowns become 0
+        self.binary_tables = []
+        for field in ["Growing_Stress", "Changes_Habits", "Mental_Health_History", "Social_Weakness"]:
+            table = {key: self._slots({field: int(val)}, [field]) for key, val in binary_map.items()}
+            self.binary_tables.append((field, table, self._slots({field: 0}, [field])))
+            self.keys[field] = ({key: str(int(val)) for key, val in binary_map.items()}, "0", False)
+
+        # Free numeric fields are scaled per request
+        self.free_cols = [(c, self.index[c]) for c in ("Year", "Month", "Hour") if c in self.index]
+        self.month_cols = [
+            (self.index[c], fn) for c, fn in (("Month_sin", np.sin), ("Month_cos", np.cos))
+            if c in self.index
+        ]
+
+        # One-hot fields: normalised value -> (column, scaled 1.0)
+        self.onehot_tables = []
+        for field in categorical_fields:
+            prefix = f"{field}_"
+            table = {
+                col[len(prefix):]: self._slots({col: 1}, [col])[0]
+                for col in self.columns if col.startswith(prefix)
+            }
+            self.onehot_tables.append((field, table))
+            self.keys[field] = ({key: key for key in table}, "unknown", True)
+
+    def _scaled_rows(self, X):
+        if not self.folded:
+            return X
+        return self.scaler.transform(pd.DataFrame(X, columns=self.columns))
+
+    def _slots(self, raw, cols):
+        """Return ``(column index, scaled value)`` pairs for raw column values."""
+        X = np.zeros((1, len(self.columns)))
+        for col in cols:
+            X[0, self.index[col]] = raw[col]
+        scaled = self._scaled_rows(X)[0]
+        return [(self.index[col], scaled[self.index[col]]) for col in cols]
+
+    def _scale_value(self, j, value):
+        if not self.folded:
+            return value
+        return (np.float64(value) - self.mean[j]) / self.scale[j]
+
+    def field_key(self, field, value):
+        """The encoded value a raw answer to ``field`` becomes, as text.
+
+        Answers the model cannot tell apart share a key: an ordinal answer
+        maps to its category (or the default), a binary one to its
+        ``binary_map`` value, a one-hot one to its column (or "unknown").
+        """
+        table, other, normalised = self.keys[field]
+        return table.get(category_key(value) if normalised else value, other)
+
+    def encode(self, form_data):
+        """Return the scaled ``(1, n_features)`` vector for one form record."""
+        x = self.base.copy()
+
+        slots = self.weekday_table.get(form_data["Weekday"], self.weekday_table[None])
+        for field, table, default in self.ordinal_tables:
+            slots = slots + table.get(form_data[field], default)
+        for field, table, zero in self.binary_tables:
+            slots = slots + table.get(form_data[field], zero)
+        for j, value in slots:
+            x[j] = value
+
+        for col, j in self.free_cols:
+            x[j] = self._scale_value(j, form_data[col])
+        if self.month_cols:
+            month = np.array([form_data["Month"]])
+            for j, fn in self.month_cols:
+                x[j] = self._scale_value(j, fn(2 * np.pi * month / 12)[0])
+
+        for field, table in self.onehot_tables:
+            hit = table.get(category_key(form_data[field]))
+            if hit is not None:
+                x[hit[0]] = hit[1]
+
+        if not self.folded:
+            return self.scaler.transform(pd.DataFrame(x[None, :], columns=self.columns))
+        return x[None, :]
+
+
 # =========================
 # Main prediction function
 # =========================
+def _predict_matrix(state, X):
+    """Run the model on already scaled rows; returns predictions and confidences."""
+    if isinstance(state.model, ModelServerClient):
+        try:
+            return state.model.predict_matrix(X, state.version)
+        except ModelServerStale:
+            check_bundle_soon()
+            raise
+    if isinstance(state.model, fast_model_utils.CompiledStack):
+        proba = state.model.predict_proba(X)
+        return np.argmax(proba, axis=1).astype(int), np.max(proba, axis=1).astype(float)
+    X_scaled = pd.DataFrame(X, columns=state.final_columns)
+
+    if hasattr(state.model, "predict_proba"):
+        proba = state.model.predict_proba(X_scaled)
+        return np.argmax(proba, axis=1).astype(int), np.max(proba, axis=1).astype(float)
+    predictions = np.asarray(state.model.predict(X_scaled)).astype(int)
+    return predictions, np.full(len(predictions), 0.5)
+
+
+def _predict_one(state, form_data):
+    # Encode + scale through the precompiled lookup tables
+    with metrics.stage("encode"):
+        X = state.feature_encoder.encode(form_data)
+    with metrics.stage("model"):
+        if batcher is not None:
+            return batcher.submit(state, X[0])
+        predictions, confidences = _predict_matrix(state, X)
+    return int(predictions[0]), float(confidences[0])
+
+
+# Concurrent requests share model calls when MODEL_BATCHING=1
+batcher = MicroBatcher(_predict_matrix) if BATCHING_ENABLED else None
+
+
+def _predict_primary(state, form_data):
+    result = None
+    if state.table is not None:
+        result = state.table.lookup(form_data)
+        metrics.inc("wellness_table_lookups_total", result="miss" if result is None else "hit")
+    return result or _predict_one(state, form_data)
+
+
+@profiled("preprocess_and_predict")
 def preprocess_and_predict(form_data):
     try:
-        print("📩 Incoming form data:", form_data)
+        state = current_state()
+        fields = {}
+        if variants.enabled:
+            prediction, confidence, fields["variant"] = variants.predict(state, form_data, _predict_primary)
+        else:
+            prediction, confidence = _predict_primary(state, form_data)
+        metrics.inc("wellness_predictions_total", **{"class": str(prediction)})
 
-        # Convert input to DataFrame
-        new_data = pd.DataFrame([form_data])
+        app_log.event("predict.result", prediction=prediction, confidence=round(confidence, 4),
+                      version=state.version, **fields)
+        return prediction, confidence
+
+    except Exception as e:
+        metrics.inc("wellness_errors_total", where="predict")
+        app_log.error("predict.failed", e, form=form_data)
+        return None, 0.0
 
-        # Compute time features
-        new_data["Weekday"] = new_data["Weekday"].map(weekday_map).fillna(0).astype(int)
-        new_data["Month_sin"] = np.sin(2 * np.pi * new_data["Month"] / 12)
-        new_data["Month_cos"] = np.cos(2 * np.pi * new_data["Month"] / 12)
-        new_data["Weekday_sin"] = np.sin(2 * np.pi * new_data["Weekday"] / 7)
-        new_data["Weekday_cos"] = np.cos(2 * np.pi * new_data["Weekday"] / 7)
 
-        # Safe encoding for ordinal fields
-        days_val = new_data["Days_Indoors"].iloc[0]
-        mood_val = new_data["Mood_Swings"].iloc[0]
+# =========================
+# Batch prediction function
+# =========================
+def _encode_batch(state, new_data):
+    """Encode a DataFrame of form records into a raw (unscaled) feature matrix."""
+    n_rows = len(new_data)
+    column_index = state.feature_encoder.index
 
-        days_val = "15-30 days" if days_val is None or days_val == "" else days_val
-        mood_val = "medium" if mood_val is None or mood_val == "" else mood_val
+    # Compute time features
+    new_data["Weekday"] = new_data["Weekday"].map(weekday_map).fillna(0).astype(int)
+    new_data["Month_sin"] = np.sin(2 * np.pi * new_data["Month"] / 12)
+    new_data["Month_cos"] = np.cos(2 * np.pi * new_data["Month"] / 12)
+    new_data["Weekday_sin"] = np.sin(2 * np.pi * new_data["Weekday"] / 7)
+    new_data["Weekday_cos"] = np.cos(2 * np.pi * new_data["Weekday"] / 7)
 
-        new_data["Days_Indoors"] = safe_encode(days_encoder, days_val, "15-30 days")
-        new_data["Mood_Swings"] = safe_encode(mood_encoder, mood_val, "medium")
+    # Safe encoding for ordinal fields (one transform per encoder)
+    for col, encoder, default in [
+        ("Days_Indoors", state.days_encoder, "15-30 days"),
+        ("Mood_Swings", state.mood_encoder, "medium"),
+    ]:
+        values = new_data[col].where(new_data[col].isin(encoder.categories_[0]), default)
+        new_data[col] = encoder.transform(values.to_numpy(dtype=object).reshape(-1, 1))[:, 0]
 
-        # Binary mappings
-        for col in ["Growing_Stress", "Changes_Habits", "Mental_Health_History", "Social_Weakness"]:
-            new_data[col] = new_data[col].map(binary_map).fillna(0).astype(int)
+    # Binary mappings
+    for col in ["Growing_Stress", "Changes_Habits", "Mental_Health_History", "Social_Weakness"]:
+        new_data[col] = new_data[col].map(state.binary_map).fillna(0).astype(int)
 
-        # Initialize full feature DataFrame
-        X_new = pd.DataFrame(np.zeros((1, len(final_columns))), columns=final_columns)
+    X_new = np.zeros((n_rows, len(state.final_columns)))
 
-        # Fill numeric columns
-        for col in numeric_cols:
-            if col in X_new.columns:
-                X_new[col] = new_data[col].values
+    # Fill numeric columns
+    for col in numeric_cols:
+        if col in column_index:
+            X_new[:, column_index[col]] = new_data[col].to_numpy(dtype=float)
 
-        # One-hot encode categoricals safely
-        for field in categorical_fields:
-            raw_val = new_data[field].iloc[0]
+    # One-hot encode categoricals safely
+    rows = np.arange(n_rows)
+    for field in categorical_fields:
+        raw = new_data[field]
+        vals = raw.astype(str).str.strip().str.lower().str.replace(" ", "_")
+        vals = vals.where(raw.notna(), "unknown")
+        cols = (field + "_" + vals).map(column_index)
+        hit = cols.notna().to_numpy()
+        X_new[rows[hit], cols[hit].to_numpy(dtype=int)] = 1
+
+    return X_new
 
-            if raw_val is None or pd.isna(raw_val):
-                val = "unknown"
-            else:
-                val = str(raw_val).strip().lower().replace(" ", "_")
 
-            col_name = f"{field}_{val}"
-            if col_name in X_new.columns:
-                X_new[col_name] = 1
+def preprocess_and_predict_batch(records):
+    """Score many form records at once.
+
+    ``records`` is a DataFrame or an iterable of ``form_data`` dicts. Returns
+    ``(predictions, confidences)`` arrays whose rows match what
+    ``preprocess_and_predict`` returns for each record, using one scaler call
+    and one model call for the whole batch.
+    """
+    try:
+        state = current_state()
+        new_data = records.copy() if isinstance(records, pd.DataFrame) else pd.DataFrame(list(records))
+        new_data = new_data.reset_index(drop=True)
+        if new_data.empty:
+            return np.zeros(0, dtype=int), np.zeros(0)
+
+        with metrics.stage("batch_encode"):
+            X_new = _encode_batch(state, new_data)
 
         # Scale + predict
-        X_scaled = pd.DataFrame(scaler.transform(X_new), columns=X_new.columns)
+        with metrics.stage("batch_scale"):
+            X_scaled = state.scaler.transform(pd.DataFrame(X_new, columns=state.final_columns))
+        with metrics.stage("batch_model"):
+            predictions, confidences = _predict_matrix(state, X_scaled)
+        for cls, count in zip(*np.unique(predictions, return_counts=True)):
+            metrics.inc("wellness_predictions_total", int(count), **{"class": str(cls)})
 
-        if hasattr(stack_model_1, "predict_proba"):
-            proba = stack_model_1.predict_proba(X_scaled)[0]
-            prediction = int(np.argmax(proba))
-            confidence = float(np.max(proba))
-        else:
-            prediction = int(stack_model_1.predict(X_scaled)[0])
-            confidence = 0.5
+        return predictions, confidences
+
+    except Exception as e:
+        metrics.inc("wellness_errors_total", where="predict_batch")
+        app_log.error("predict_batch.failed", e)
+        return None, None
 
-        print(f"✅ Prediction: {prediction}, Confidence: {confidence:.2f}")
-        return prediction, confidence
 
+# =========================
+# Warm-up + startup
+# =========================
+# A representative /predict form, used to pay LightGBM/CatBoost lazy
+# initialisation before the first real request
+WARMUP_FORM = {
+    "Gender": "Female", "Country": "India", "Occupation": "Student",
+    "self_employed": "no", "family_history": "no", "Days_Indoors": "15-30 days",
+    "Growing_Stress": "no", "Changes_Habits": "no", "Mental_Health_History": "no",
+    "Mood_Swings": "medium", "Coping_Struggles": "no", "Work_Interest": "no",
+    "Social_Weakness": "no", "mental_health_interview": "no", "care_options": "no",
+    "Year": 2014, "Month": 8, "Weekday": "wednesday", "Hour": 11,
+}
+
+
+def warm_up():
+    """Load the artifacts and run one throwaway prediction."""
+    state = current_state()
+    if not _warmed.is_set():
+        _predict_one(state, dict(WARMUP_FORM))
+        _warmed.set()
+
+
+_startup_lock = threading.Lock()
+_startup_thread = None
+
+
+def _background_warm_up():
+    try:
+        warm_up()
     except Exception as e:
-        print("❌ Prediction Error:", e)
-        print(traceback.format_exc())
-        print("🚨 Failed input data:", form_data)
-        return None, 0.0
+        app_log.error("model.startup_failed", e)
+
+
+def start_background_warm_up():
+    """Start loading + warm-up in a background thread (once per process)."""
+    global _startup_thread
+    with _startup_lock:
+        alive = _startup_thread is not None and _startup_thread.is_alive()
+        if alive or _warmed.is_set():
+            return
+        _startup_thread = threading.Thread(target=_background_warm_up, name="model-startup", daemon=True)
+        _startup_thread.start()
+
+
+if MODEL_STARTUP == "eager":
+    load_artifacts()
+elif MODEL_STARTUP == "background":
+    start_background_warm_up()
@@ -0,0 +1,275 @@
+import argparse
+import functools
+import glob
+import hmac
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from event_log_utils import app_log
+from metrics_utils import metrics
+
+# =========================
+# Request profiling settings
+# =========================
+# Profiling is off unless PROFILE_SAMPLE_RATE > 0 (that fraction of requests
+# is profiled) or PROFILE_TOKEN is set (requests sending the same value in
+# the X-Profile-Token header are profiled). Off means no hooks at all.
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_HEADER = "X-Profile-Token"
+PROFILING = PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_TOKEN)
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "wellness-profiles"))
+# The oldest profiles are removed once the directory passes either cap
+PROFILE_MAX_BYTES = int(os.environ.get("PROFILE_MAX_MB", 50)) * 1024 * 1024
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 500))
+# Sampling period; a busy thread only yields the GIL every
+# sys.getswitchinterval() (5 ms), so pure-Python code is seen at that rate
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("PROFILE_INTERVAL_MS", 1)) / 1000
+# Sampled (not header) profiles running at once in one process
+PROFILE_MAX_ACTIVE = int(os.environ.get("PROFILE_MAX_ACTIVE", 2))
+PROFILE_SUFFIX = ".folded"
+
+
+class Profile:
+    """Stack samples of one thread, as ``{folded stack: count}``."""
+
+    __slots__ = ("name", "reason", "thread_id", "started", "stacks", "samples")
+
+    def __init__(self, name, reason, thread_id):
+        self.name = name
+        self.reason = reason
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.stacks = {}
+        self.samples = 0
+
+
+class Profiler:
+    """Wall-clock sampling profiler for single requests.
+
+    ``start`` registers the calling thread; one sampler thread per process
+    then reads its current stack from ``sys._current_frames()`` every
+    ``interval`` seconds until ``stop``. Nothing is traced, so the profiled
+    request runs at full speed, and the sampler sleeps while no request is
+    being profiled. Each profile is written to ``directory`` as one file in
+    the folded-stack format (``frame;frame;frame count`` per line) read by
+    flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, rate=PROFILE_SAMPLE_RATE, token=PROFILE_TOKEN,
+                 interval=PROFILE_INTERVAL_SECONDS, max_bytes=PROFILE_MAX_BYTES,
+                 max_files=PROFILE_MAX_FILES, max_active=PROFILE_MAX_ACTIVE):
+        self.directory = directory
+        self.rate = rate
+        self.token = token
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_active = max_active
+        self.local = threading.local()
+        self.labels = {}
+        self.pid = None
+        self.start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # One sampler thread per process, also after a gunicorn fork
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.lock = threading.Lock()
+            self.wake = threading.Event()
+            self.active = {}
+            threading.Thread(target=self._run, name="request-profiler", daemon=True).start()
+            self.pid = os.getpid()
+
+    def authorized(self, value):
+        return bool(self.token) and bool(value) and hmac.compare_digest(value.encode(), self.token.encode())
+
+    def start(self, name, token=None):
+        """Decide whether to profile the current request; returns its Profile or None.
+
+        Only the first decision per request counts, so ``profiled``
+        functions called inside a request that was not picked stay quiet.
+        """
+        if getattr(self.local, "decided", False):
+            return None
+        self.local.decided = True
+        if self.authorized(token):
+            reason = "header"
+        elif self.rate > 0 and random.random() < self.rate:
+            reason = "sampled"
+        else:
+            return None
+        self._ensure_started()
+        profile = Profile(name, reason, threading.get_ident())
+        with self.lock:
+            sampled = sum(1 for p in self.active.values() if p.reason == "sampled")
+            if reason == "sampled" and sampled >= self.max_active:
+                return None
+            self.active[profile.thread_id] = profile
+            self.wake.set()
+        self.local.profile = profile
+        return profile
+
+    def stop(self):
+        """Finish the current thread's profile (if any); returns its file name."""
+        self.local.decided = False
+        profile = getattr(self.local, "profile", None)
+        if profile is None:
+            return None
+        self.local.profile = None
+        with self.lock:
+            self.active.pop(profile.thread_id, None)
+        try:
+            return self._write(profile, time.perf_counter() - profile.started)
+        except OSError as e:
+            app_log.error("profile.write_failed", e, directory=self.directory)
+            return None
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = (
+                f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            ).replace(";", ":")
+        return label
+
+    def _run(self):
+        current_frames = sys._current_frames
+        while True:
+            self.wake.wait()
+            with self.lock:
+                if not self.active:
+                    self.wake.clear()
+                    continue
+                frames = current_frames()
+                for thread_id, profile in self.active.items():
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._label(frame.f_code))
+                        frame = frame.f_back
+                    key = ";".join(reversed(stack))
+                    profile.stacks[key] = profile.stacks.get(key, 0) + 1
+                    profile.samples += 1
+            del frames
+            time.sleep(self.interval)
+
+    def _write(self, profile, seconds):
+        if not profile.samples:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ")
+        route = profile.name.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "root"
+        file_name = f"{stamp}-{route}-{os.getpid()}-{seconds * 1000:.0f}ms{PROFILE_SUFFIX}"
+        path = os.path.join(self.directory, file_name)
+        with open(f"{path}.tmp", "w") as f:
+            for stack, count in sorted(profile.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        os.replace(f"{path}.tmp", path)
+        metrics.inc("wellness_profiles_total", reason=profile.reason)
+        app_log.event("profile.written", file=file_name, reason=profile.reason, samples=profile.samples,
+                      seconds=round(seconds, 4))
+        self._enforce_cap()
+        return file_name
+
+    def _enforce_cap(self):
+        files = []
+        for path in glob.glob(os.path.join(self.directory, f"*{PROFILE_SUFFIX}")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # removed by another worker
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        count = len(files)
+        for _, size, path in files:
+            if total <= self.max_bytes and count <= self.max_files:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            count -= 1
+
+
+profiler = Profiler()
+
+
+def profiled(name):
+    """Profile calls of the decorated function made outside a profiled request.
+
+    With profiling off the function is returned unchanged, so it costs
+    nothing.
+    """
+    def decorate(fn):
+        if not PROFILING:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(profiler.local, "decided", False):
+                # Inside a request, which has already been picked or not
+                return fn(*args, **kwargs)
+            profiler.start(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.stop()
+        return wrapper
+    return decorate
+
+
+# =========================
+# Merge profiles
+# =========================
+def merge_profiles(paths):
+    """Sum folded-stack files into one ``{stack: count}``."""
+    totals = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack:
+                    totals[stack] = totals.get(stack, 0) + int(count)
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or merge request profiles for flame graphs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ls = sub.add_parser("list", help="show the profiles in the directory, newest last")
+    ls.add_argument("--dir", default=PROFILE_DIR)
+    merge = sub.add_parser("merge", help="sum profiles into one folded-stack file")
+    merge.add_argument("--dir", default=PROFILE_DIR)
+    merge.add_argument("--route", help="only profiles of this route, e.g. predict")
+    merge.add_argument("--out", default="-", help="output file (default stdout)")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.dir, f"*{PROFILE_SUFFIX}")))
+    if args.command == "list":
+        for path in paths:
+            print(f"{os.path.getsize(path):>9,}  {os.path.basename(path)}")
+        print(f"📊 {len(paths)} profiles in {args.dir}")
+    else:
+        if args.route:
+            paths = [p for p in paths if f"-{args.route}-" in os.path.basename(p)]
+        if not paths:
+            raise SystemExit(f"❌ No profiles found in {args.dir}")
+        lines = [f"{stack} {count}\n" for stack, count in sorted(merge_profiles(paths).items())]
+        if args.out == "-":
+            sys.stdout.writelines(lines)
+        else:
+            with open(args.out, "w") as f:
+                f.writelines(lines)
+            print(f"✅ {len(paths)} profiles merged into {args.out}", file=sys.stderr)
@@ -0,0 +1,269 @@
+import argparse
+import io
+import json
+import os
+import time
+import warnings
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# Offline scoring settings
+# =========================
+SCORE_CHUNK_ROWS = 20000
+PROGRESS_SECONDS = 5.0
+
+# Columns of the original survey dataset that feed the model
+SURVEY_COLUMNS = [
+    "Gender", "Country", "Occupation", "self_employed", "family_history",
+    "Days_Indoors", "Growing_Stress", "Changes_Habits", "Mental_Health_History",
+    "Mood_Swings", "Coping_Struggles", "Work_Interest", "Social_Weakness",
+    "mental_health_interview", "care_options",
+]
+
+
+# =========================
+# Input chunks
+# =========================
+def read_chunks(path, input_format, chunk_rows):
+    """Yield DataFrames of at most ``chunk_rows`` string-valued rows."""
+    if input_format == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("❌ Reading Parquet needs pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas().astype(object)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False)
+
+
+def to_form_frame(frame):
+    """Turn a chunk of survey rows (or /predict form rows) into ``form_data`` columns.
+
+    Survey files use the dataset's column names and carry a ``Timestamp``;
+    values are stripped and lower-cased as in training, and the time
+    features come from the timestamp. Files with the web form's field names
+    go through ``build_form_data`` exactly like /predict.
+    """
+    from model_utils import build_form_data
+
+    if "Gender" not in frame.columns:
+        return pd.DataFrame([build_form_data(record) for record in frame.to_dict("records")])
+
+    defaults = build_form_data({})
+    forms = pd.DataFrame(index=frame.index)
+    for col in SURVEY_COLUMNS:
+        if col in frame.columns:
+            values = frame[col].astype(object).where(frame[col].notna(), "")
+            values = values.astype(str).str.strip().str.lower()
+            forms[col] = values.where(values != "", defaults[col])
+        else:
+            forms[col] = defaults[col]
+
+    if "Timestamp" in frame.columns:
+        raw = frame["Timestamp"].astype(object).where(frame["Timestamp"].notna(), "").astype(str)
+        with warnings.catch_warnings():
+            # Format inference works off the first value; rows it misses get a second, slower pass
+            warnings.simplefilter("ignore", UserWarning)
+            ts = pd.to_datetime(raw, errors="coerce")
+            retry = ts.isna() & (raw.str.strip() != "")
+            if retry.any():
+                ts[retry] = pd.to_datetime(raw[retry], errors="coerce", format="mixed")
+        forms["Year"] = ts.dt.year.fillna(defaults["Year"]).astype(int)
+        forms["Month"] = ts.dt.month.fillna(defaults["Month"]).astype(int)
+        forms["Weekday"] = ts.dt.day_name().str.lower().fillna(defaults["Weekday"])
+        forms["Hour"] = ts.dt.hour.fillna(defaults["Hour"]).astype(int)
+    else:
+        for col in ("Year", "Month", "Weekday", "Hour"):
+            forms[col] = defaults[col]
+    return forms
+
+
+# =========================
+# Worker processes
+# =========================
+_worker_error = None
+
+
+def _init_worker(threads):
+    """Load the model once per worker and pin its native thread pools."""
+    # A failing initializer makes Pool respawn workers forever, so the
+    # error is kept and raised from the first chunk instead
+    global _worker_error, _thread_limits
+    try:
+        import model_utils
+        from threadpoolctl import threadpool_limits
+
+        model_utils.warm_up()
+        # N workers x N OpenMP/BLAS threads each would oversubscribe the box
+        _thread_limits = threadpool_limits(threads)
+        model = model_utils.stack_model_1
+        for estimator in [model] + list(getattr(model, "estimators_", [])):
+            if hasattr(estimator, "n_jobs"):
+                estimator.n_jobs = threads
+    except Exception as e:
+        _worker_error = RuntimeError(f"model failed to load in worker: {type(e).__name__}: {e}")
+
+
+def _score_chunk(frame):
+    """Score one chunk; failed rows come back as NaN."""
+    if _worker_error is not None:
+        raise _worker_error
+    from model_utils import preprocess_and_predict_batch
+
+    forms = to_form_frame(frame).reset_index(drop=True)
+    predictions, confidences = preprocess_and_predict_batch(forms)
+    if predictions is not None:
+        return predictions.astype(float), confidences
+
+    # Isolate the rows that broke the batch
+    predictions = np.full(len(forms), np.nan)
+    confidences = np.full(len(forms), np.nan)
+    for i in range(len(forms)):
+        prediction, confidence = preprocess_and_predict_batch(forms.iloc[[i]])
+        if prediction is not None:
+            predictions[i], confidences[i] = prediction[0], confidence[0]
+    return predictions, confidences
+
+
+# =========================
+# Checkpoint / resume
+# =========================
+def _input_identity(path, chunk_rows):
+    stat = os.stat(path)
+    return {
+        "input": os.path.abspath(path),
+        "input_bytes": stat.st_size,
+        "input_mtime_ns": stat.st_mtime_ns,
+        "chunk_rows": chunk_rows,
+    }
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def _render(start_row, ids, predictions, confidences):
+    out = pd.DataFrame({"row": np.arange(start_row, start_row + len(predictions))})
+    if ids is not None:
+        out["id"] = ids
+    out["prediction"] = pd.array(predictions, dtype="Int64")
+    out["confidence"] = np.round(confidences, 6)
+    buf = io.StringIO()
+    out.to_csv(buf, header=False, index=False)
+    return buf.getvalue().encode("utf-8")
+
+
+def score_file(input_path, output_path, input_format=None, workers=None, chunk_rows=SCORE_CHUNK_ROWS,
+               id_column=None, checkpoint_path=None, restart=False, threads_per_worker=1):
+    """Score a CSV or Parquet file into an ordered CSV of predictions.
+
+    Chunks are read in the parent and scored by a pool of ``workers``
+    processes that each load the model once. At most two chunks per worker
+    are in flight, and results are written strictly in input order. After
+    every chunk the output is flushed and a checkpoint records how many
+    chunks and bytes are done, so a rerun after an interruption truncates
+    the output to the last checkpoint and carries on from there.
+    Returns ``(rows, seconds)`` for this run.
+    """
+    input_format = input_format or (
+        "parquet" if input_path.endswith((".parquet", ".pq")) else "csv"
+    )
+    workers = workers or os.cpu_count() or 1
+    checkpoint_path = checkpoint_path or f"{output_path}.ckpt.json"
+    identity = _input_identity(input_path, chunk_rows)
+
+    checkpoint = None if restart else _read_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        if any(checkpoint.get(k) != v for k, v in identity.items()):
+            raise SystemExit(
+                f"❌ {checkpoint_path} belongs to a different input or chunk size; use --restart"
+            )
+        out = open(output_path, "r+b")
+        out.truncate(checkpoint["output_bytes"])
+        out.seek(checkpoint["output_bytes"])
+        print(f"↩️ Resuming after row {checkpoint['rows']} ({checkpoint['chunks']} chunks)")
+    else:
+        checkpoint = dict(identity, chunks=0, rows=0, output_bytes=0)
+        out = open(output_path, "wb")
+        header = "row,id,prediction,confidence\n" if id_column else "row,prediction,confidence\n"
+        out.write(header.encode("utf-8"))
+        out.flush()
+        checkpoint["output_bytes"] = out.tell()
+        _write_checkpoint(checkpoint_path, checkpoint)
+
+    started = time.monotonic()
+    next_report = started + PROGRESS_SECONDS
+    scored = 0
+    pending = deque()
+
+    def write_result():
+        nonlocal scored, next_report
+        start_row, ids, result = pending.popleft()
+        predictions, confidences = result.get()
+        out.write(_render(start_row, ids, predictions, confidences))
+        out.flush()
+        os.fsync(out.fileno())
+        checkpoint["chunks"] += 1
+        checkpoint["rows"] += len(predictions)
+        checkpoint["output_bytes"] = out.tell()
+        _write_checkpoint(checkpoint_path, checkpoint)
+        scored += len(predictions)
+        now = time.monotonic()
+        if now >= next_report:
+            print(f"⏳ {checkpoint['rows']} rows, {scored / (now - started):.0f} rows/s")
+            next_report = now + PROGRESS_SECONDS
+
+    try:
+        with Pool(workers, initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+            start_row = checkpoint["rows"] + 1
+            for i, frame in enumerate(read_chunks(input_path, input_format, chunk_rows)):
+                if i < checkpoint["chunks"]:
+                    continue
+                ids = frame[id_column].to_numpy() if id_column else None
+                pending.append((start_row, ids, pool.apply_async(_score_chunk, (frame,))))
+                start_row += len(frame)
+                while len(pending) >= 2 * workers:
+                    write_result()
+            while pending:
+                write_result()
+    finally:
+        out.close()
+
+    os.remove(checkpoint_path)
+    return scored, time.monotonic() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a survey file offline with a process pool.")
+    parser.add_argument("input", help="CSV or Parquet file of survey or /predict form rows")
+    parser.add_argument("output", help="CSV file to write predictions to")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="default: from the file extension")
+    parser.add_argument("--workers", type=int, help="default: one per CPU")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--chunk-rows", type=int, default=SCORE_CHUNK_ROWS)
+    parser.add_argument("--id-column", help="input column to copy into the output")
+    parser.add_argument("--checkpoint", help="default: <output>.ckpt.json")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start over")
+    args = parser.parse_args()
+
+    rows, seconds = score_file(
+        args.input, args.output, args.format, args.workers, args.chunk_rows,
+        args.id_column, args.checkpoint, args.restart, args.threads_per_worker,
+    )
+    print(f"✅ Scored {rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-9):.0f} rows/s)")
@@ -0,0 +1,259 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+from flask import Response, request
+
+# =========================
+# Mood time-series settings
+# =========================
+SERIES_DEFAULT_POINTS = 500
+SERIES_MAX_POINTS = int(os.environ.get("SERIES_MAX_POINTS", 2000))
+# Ranges are drawn from the hourly rollup (each hour's lowest and highest
+# reading) when every output point spans an hour or more anyway, or when
+# they hold more raw rows than this; otherwise from the raw rows
+SERIES_RAW_ROWS = int(os.environ.get("SERIES_RAW_ROWS", 20000))
+HOUR_MS = 3600 * 1000
+# Inputs above this many times the point budget are first cut to the
+# min/max of equal buckets, so LTTB only runs on that many candidates
+SERIES_PRESELECT_RATIO = 4
+SERIES_CACHE_SIZE = int(os.environ.get("SERIES_CACHE_SIZE", 64))
+
+
+def to_iso(ms):
+    """Epoch milliseconds -> the store's ISO timestamp text."""
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat(timespec="milliseconds")
+
+
+# =========================
+# Downsampling
+# =========================
+def lttb(x, y, n):
+    """Indices of ``n`` points picked by Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept; every bucket in between keeps the
+    point forming the largest triangle with the point kept before it and
+    the mean of the next bucket, which preserves peaks and dips that
+    averaging would flatten.
+    """
+    size = len(x)
+    if n >= size:
+        return np.arange(size)
+    if n < 3:
+        return np.array([0, size - 1])[:n]
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:size - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:size - 1], edges[:-1]) / counts
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 1 < n - 2:
+            next_x, next_y = mean_x[i + 1], mean_y[i + 1]
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def minmax_indices(y, buckets):
+    """Sorted indices of the lowest and highest point in each of ``buckets`` equal runs."""
+    size = len(y)
+    width = size // buckets
+    if width < 2:
+        return np.arange(size)
+    body = y[:width * buckets].reshape(buckets, width)
+    offsets = np.arange(buckets) * width
+    picked = [offsets + body.argmin(axis=1), offsets + body.argmax(axis=1), [0, size - 1]]
+    tail = y[width * buckets:]
+    if len(tail):
+        picked.append([width * buckets + tail.argmin(), width * buckets + tail.argmax()])
+    return np.unique(np.concatenate(picked))
+
+
+def downsample(x, y, points):
+    """Cut ``(x, y)`` to at most ``points`` points, keeping the shape (MinMax + LTTB)."""
+    if len(x) > points * SERIES_PRESELECT_RATIO:
+        keep = minmax_indices(y, points * SERIES_PRESELECT_RATIO // 2)
+        x, y = x[keep], y[keep]
+    keep = lttb(x, y, points)
+    return x[keep], y[keep]
+
+
+# =========================
+# Mood series over the prediction store
+# =========================
+def _hourly_points(store, start, end):
+    """Each hour's extremes as time-ordered points within ``[start, end)`` (epoch ms)."""
+    rows = store.hourly_extremes(to_iso(start), to_iso(end))
+    if not rows:
+        return np.zeros(0), np.zeros(0)
+    extremes = np.array(rows, dtype=np.float64)
+    x = extremes[:, [0, 2]]
+    y = extremes[:, [1, 3]]
+    # Within an hour the extreme that happened first comes first
+    order = np.argsort(x, axis=1, kind="stable")
+    x = np.take_along_axis(x, order, axis=1).ravel()
+    y = np.take_along_axis(y, order, axis=1).ravel()
+    keep = (x >= start) & (x < end)
+    keep[1:] &= x[1:] != x[:-1]  # an hour with one reading has min == max
+    return x[keep], y[keep]
+
+
+def _row_series(store, series, start, end, points):
+    """Mood readings by record order, for a store none of whose records has a timestamp."""
+    first, last = store.id_bounds()
+    series.update(axis="row", first=first, last=last)
+    if first is None:
+        return series
+    start = first if start is None else min(max(start, first), last + 1)
+    end = last + 1 if end is None else min(max(end, first), last + 1)
+    series.update(start=start, end=end)
+    if end <= start:
+        return series
+    data = np.array(store.points_by_id(start, end), dtype=np.float64).reshape(-1, 2)
+    series["rows"] = len(data)
+    series["source"] = "raw"
+    x, y = downsample(data[:, 0], data[:, 1], points)
+    series["points"] = [[int(t), round(float(v) * 10, 1)] for t, v in zip(x, y)]
+    return series
+
+
+def mood_series(store, start=None, end=None, points=SERIES_DEFAULT_POINTS):
+    """Mood readings (confidence x 10) between ``start`` and ``end`` (epoch ms).
+
+    Missing bounds default to the first and last stored record, and bounds
+    outside them are clamped to them. Short ranges are read row by row;
+    long ones, and history whose raw rows were compacted away, come from
+    the hourly extremes. Either way the result is downsampled to at most
+    ``points`` points. A store with no timestamped record at all (a legacy
+    CSV import) is charted by record id instead (``"axis": "row"``);
+    otherwise ``"untimed"`` counts the records that cannot be placed.
+    """
+    first, last = store.time_bounds()
+    series = {"axis": "time", "first": first, "last": last, "start": start, "end": end,
+              "rows": 0, "untimed": 0, "source": None, "points": []}
+    series["untimed"] = store.untimed_count()
+    if first is None:
+        return _row_series(store, series, start, end, points) if series["untimed"] else series
+    start = first if start is None else min(max(start, first), last + 1)
+    end = last + 1 if end is None else min(max(end, first), last + 1)
+    series.update(start=start, end=end)
+    if end <= start:
+        return series
+
+    # Rows before the oldest raw one were compacted; only their rollup is left
+    raw_start = store.raw_start()
+    split = min(max(raw_start if raw_start is not None else end, start), end)
+    parts, sources = [], []
+    if start < split:
+        parts.append(_hourly_points(store, start, split))
+        sources.append("hourly")
+    if split < end:
+        coarse = (end - split) / points >= HOUR_MS
+        if not coarse and store.count_between(to_iso(split), to_iso(end)) <= SERIES_RAW_ROWS:
+            raw = store.points_between(to_iso(split), to_iso(end))
+            data = np.array(raw, dtype=np.float64).reshape(-1, 2)
+            parts.append((data[:, 0], data[:, 1]))
+            sources.append("raw")
+        else:
+            parts.append(_hourly_points(store, split, end))
+            sources.append("hourly")
+    x = np.concatenate([p[0] for p in parts])
+    y = np.concatenate([p[1] for p in parts])
+    series["rows"] = int(len(x))
+    series["source"] = "+".join(dict.fromkeys(sources))
+    x, y = downsample(x, y, points)
+    series["points"] = [[int(t), round(float(v) * 10, 1)] for t, v in zip(x, y)]
+    return series
+
+
+class SeriesCache:
+    """Finished /dashboard/series responses, keyed by query and store version.
+
+    The ETag is a hash of the query and ``store.version()``, so a browser
+    revalidating a chart it already has gets a 304 after one O(1) lookup.
+    Bodies are kept in a small per-process LRU, plain and gzipped; new
+    predictions or a compaction change the version and retire them.
+    """
+
+    def __init__(self, store, size=SERIES_CACHE_SIZE):
+        self.store = store
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, start=None, end=None, points=SERIES_DEFAULT_POINTS):
+        """Return ``(etag, entry)``; ``entry`` is None when only the tag was needed."""
+        key = (start, end, points, self.store.version())
+        tag = hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+        with self.lock:
+            entry = self.entries.get(tag)
+            if entry is not None:
+                self.entries.move_to_end(tag)
+        return f'"{tag}"', entry
+
+    def build(self, tag, start=None, end=None, points=SERIES_DEFAULT_POINTS):
+        series = mood_series(self.store, start, end, points)
+        body = json.dumps(series, separators=(",", ":")).encode()
+        entry = {"series": series, "": body, "gzip": gzip.compress(body, compresslevel=6, mtime=0)}
+        with self.lock:
+            self.entries[tag] = entry
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def series(self, start=None, end=None, points=SERIES_DEFAULT_POINTS):
+        tag, entry = self.get(start, end, points)
+        return (entry or self.build(tag, start, end, points))["series"]
+
+    def response(self, start=None, end=None, points=SERIES_DEFAULT_POINTS):
+        points = min(max(points or SERIES_DEFAULT_POINTS, 3), SERIES_MAX_POINTS)
+        etag, entry = self.get(start, end, points)
+        headers = [
+            ("ETag", etag),
+            # Revalidated every time; the 304 costs no query beyond the version
+            ("Cache-Control", "no-cache"),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None and (if_none_match.strip() == "*" or etag in if_none_match):
+            return Response(status=304, headers=headers)
+        entry = entry or self.build(etag.strip('"'), start, end, points)
+        encoding = "gzip" if request.accept_encodings["gzip"] else ""
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        return Response(entry[encoding], mimetype="application/json", headers=headers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the downsampled mood series over a prediction store.")
+    parser.add_argument("--db", default=os.environ.get("PREDICTION_DB", "predictions.db"))
+    parser.add_argument("--points", type=int, default=SERIES_DEFAULT_POINTS)
+    args = parser.parse_args()
+
+    from store_utils import PredictionStore
+
+    store = PredictionStore(args.db)
+    first, last = store.time_bounds()
+    if first is None:
+        raise SystemExit(f"❌ {args.db} has no timestamped records")
+    day = 24 * 3600 * 1000
+    for label, span in [("day", day), ("week", 7 * day), ("month", 30 * day), ("year", 365 * day), ("all", None)]:
+        start = None if span is None else max(first, last + 1 - span)
+        began = time.perf_counter()
+        series = mood_series(store, start, None, args.points)
+        elapsed = time.perf_counter() - began
+        print(f"⏱️ {label:>5}: {series['rows']:>9,} rows from {series['source']} -> "
+              f"{len(series['points'])} points in {elapsed * 1e3:.1f} ms")
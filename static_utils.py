@@ -0,0 +1,205 @@
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import time
+
+from flask import Response, abort, render_template, request, send_file, url_for
+from werkzeug.http import http_date, parse_date
+
+try:
+    import brotli
+except ImportError:  # brotli variants are optional; gzip is always built
+    brotli = None
+
+# =========================
+# Vendored front-end assets
+# =========================
+# `python static_utils.py vendor` downloads these into static/vendor with
+# .gz/.br variants and a manifest; until then pages use the CDN URLs
+VENDOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "vendor")
+VENDOR_MANIFEST = os.path.join(VENDOR_DIR, "manifest.json")
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+ASSETS = {
+    "bootstrap.min.css": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css",
+    "bootstrap.bundle.min.js": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js",
+    "p5.min.js": "https://cdn.jsdelivr.net/npm/p5@1.9.0/lib/p5.min.js",
+    "chart.umd.min.js": "https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js",
+    "axios.min.js": "https://cdn.jsdelivr.net/npm/axios@1.6.8/dist/axios.min.js",
+    "tailwindcss.js": "https://cdn.tailwindcss.com/3.4.1",
+}
+
+# Preferred first; "" is the uncompressed body
+ENCODINGS = [("br", ".br"), ("gzip", ".gz"), ("", "")]
+
+
+def _compress(data):
+    """Precompressed variants of ``data`` as ``{encoding: bytes}``."""
+    variants = {"": data, "gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+    return variants
+
+
+def _pick_encoding(available):
+    """Best encoding in ``available`` that the client accepts."""
+    for encoding, _ in ENCODINGS:
+        if encoding in available and (not encoding or request.accept_encodings[encoding]):
+            return encoding
+    return ""
+
+
+def vendor_assets(directory=VENDOR_DIR, force=False):
+    """Download every asset with its compressed variants; returns the manifest."""
+    import requests
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for name, url in ASSETS.items():
+        path = os.path.join(directory, name)
+        if force or not os.path.exists(path):
+            response = requests.get(url, timeout=60)
+            response.raise_for_status()
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(response.content)
+            os.replace(f"{path}.tmp", path)
+        with open(path, "rb") as f:
+            data = f.read()
+        variants = _compress(data)
+        for encoding, suffix in ENCODINGS:
+            if suffix and encoding in variants:
+                with open(path + suffix, "wb") as f:
+                    f.write(variants[encoding])
+        manifest[name] = {"url": url, "sha256": hashlib.sha256(data).hexdigest(), "bytes": len(data)}
+    with open(os.path.join(directory, "manifest.json.tmp"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(directory, "manifest.json.tmp"), os.path.join(directory, "manifest.json"))
+    return manifest
+
+
+_manifest = None
+
+
+def vendor_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(VENDOR_MANIFEST) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(name):
+    """URL of a front-end dependency: the vendored copy if present, else its CDN."""
+    entry = vendor_manifest().get(name)
+    if entry is None:
+        return ASSETS[name]
+    # The content hash in the URL lets the response be cached as immutable
+    return url_for("vendor_asset", name=name, v=entry["sha256"][:12])
+
+
+def asset_response(name):
+    """Serve a vendored asset, precompressed when the client accepts it."""
+    entry = vendor_manifest().get(name)
+    if entry is None:
+        abort(404)
+    path = os.path.join(VENDOR_DIR, name)
+    encoding = _pick_encoding({enc for enc, suffix in ENCODINGS if os.path.exists(path + suffix)})
+    suffix = dict(ENCODINGS)[encoding]
+    response = send_file(
+        path + suffix,
+        mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream",
+        etag=f"{entry['sha256'][:16]}-{encoding or 'identity'}",
+        max_age=ASSET_MAX_AGE,
+        conditional=True,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# =========================
+# Cached static pages
+# =========================
+class PageCache:
+    """Responses for templates that render the same HTML on every request.
+
+    Each template is rendered once per process, on first use, and kept as
+    ready-made bodies (plain, gzip and, when available, brotli) with their
+    headers: an ETag over the HTML and the template file's mtime as
+    Last-Modified. A request then costs an encoding pick and a header
+    comparison, answering 304 when the browser's copy is current. With
+    template auto-reload on (debug), pages are rendered every time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.pages = {}
+        self.lock = threading.Lock()
+
+    def _render(self, template):
+        html = render_template(template).encode("utf-8")
+        filename = self.app.jinja_env.get_template(template).filename
+        mtime = os.path.getmtime(filename) if filename else time.time()
+        last_modified = http_date(int(mtime))
+        tag = hashlib.sha256(html).hexdigest()[:16]
+        variants = {}
+        for encoding, body in _compress(html).items():
+            headers = [
+                ("Content-Type", "text/html; charset=utf-8"),
+                ("ETag", f'"{tag}-{encoding or "identity"}"'),
+                ("Last-Modified", last_modified),
+                # Unversioned URLs: browsers keep the page but revalidate it each time
+                ("Cache-Control", "no-cache"),
+                ("Vary", "Accept-Encoding"),
+            ]
+            if encoding:
+                headers.append(("Content-Encoding", encoding))
+            variants[encoding] = (body, headers)
+        return {"variants": variants, "mtime": int(mtime)}
+
+    def _not_modified(self, page, etag):
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return if_none_match.strip() == "*" or etag in if_none_match
+        since = request.headers.get("If-Modified-Since")
+        if since is None:
+            return False
+        since = parse_date(since)
+        return since is not None and since.timestamp() >= page["mtime"]
+
+    def response(self, template):
+        if self.app.jinja_env.auto_reload:
+            return render_template(template)
+        page = self.pages.get(template)
+        if page is None:
+            with self.lock:
+                page = self.pages.get(template) or self._render(template)
+                self.pages[template] = page
+
+        body, headers = page["variants"][_pick_encoding(page["variants"])]
+        if self._not_modified(page, headers[1][1]):
+            return Response(status=304, headers=headers[1:])
+        return Response(body, headers=headers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vendor the front-end dependencies into static/vendor.")
+    parser.add_argument("command", choices=["vendor"])
+    parser.add_argument("--force", action="store_true", help="download again even if present")
+    args = parser.parse_args()
+
+    manifest = vendor_assets(force=args.force)
+    if brotli is None:
+        print("⚠️ brotli is not installed; only gzip variants were written (pip install brotli)")
+    total = sum(entry["bytes"] for entry in manifest.values())
+    print(f"✅ Vendored {len(manifest)} assets ({total / 1e3:.0f} kB) into {VENDOR_DIR}")
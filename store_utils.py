@@ -0,0 +1,349 @@
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+# =========================
+# Prediction store settings
+# =========================
+PREDICTION_DB_PATH = os.environ.get("PREDICTION_DB", "predictions.db")
+IMPORT_CHUNK_ROWS = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    ts TEXT,
+    prediction INTEGER,
+    confidence REAL NOT NULL,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS predictions_ts ON predictions(ts);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    count INTEGER NOT NULL,
+    sum_confidence REAL NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, count, sum_confidence) VALUES (1, 0, 0.0);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    sum_confidence REAL NOT NULL,
+    stressed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hourly (
+    hour TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    sum_confidence REAL NOT NULL,
+    min_confidence REAL NOT NULL,
+    min_ts TEXT NOT NULL,
+    max_confidence REAL NOT NULL,
+    max_ts TEXT NOT NULL
+);
+"""
+
+# Fills ``hourly`` from the raw rows of a store created before it existed.
+# SQLite takes the bare ``ts`` column from the row holding the MIN/MAX.
+HOURLY_BACKFILL = """
+INSERT OR IGNORE INTO hourly
+SELECT lo.hour, lo.n, lo.total, lo.low, lo.low_ts, hi.high, hi.high_ts
+FROM (SELECT substr(ts, 1, 13) AS hour, COUNT(*) AS n, SUM(confidence) AS total,
+             MIN(confidence) AS low, ts AS low_ts
+      FROM predictions WHERE ts IS NOT NULL GROUP BY hour) AS lo
+JOIN (SELECT substr(ts, 1, 13) AS hour, MAX(confidence) AS high, ts AS high_ts
+      FROM predictions WHERE ts IS NOT NULL GROUP BY hour) AS hi USING (hour)
+"""
+
+# ISO timestamp text -> Unix epoch milliseconds, inside SQLite
+EPOCH_MS = "CAST(ROUND((julianday({}) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def _to_float(value):
+    # Same as pd.to_numeric(errors="coerce").fillna(0) on the old CSV log
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if value != value else value
+
+
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class PredictionStore:
+    """Append-only SQLite store for prediction records with running rollups.
+
+    Rows go into an indexed ``predictions`` table in WAL mode, and the same
+    transaction bumps an all-time ``totals`` row, a ``daily`` rollup per
+    UTC day and an ``hourly`` one holding each hour's extremes. Readers
+    therefore get the average mood in O(1) and a chart of any range from
+    at most two rows per hour, however long the history is. Usable as a
+    PredictionLogWriter sink.
+    """
+
+    def __init__(self, path=PREDICTION_DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+        self._backfill_hourly()
+
+    def _backfill_hourly(self):
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM hourly LIMIT 1").fetchone():
+            return
+        # Checked again under the write lock, so rows another process
+        # writes meanwhile are counted exactly once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            empty = conn.execute("SELECT 1 FROM hourly LIMIT 1").fetchone() is None
+            if empty:
+                conn.execute(HOURLY_BACKFILL)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _conn(self):
+        # One connection per thread and process; never reuse one across a fork
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def write_rows(self, rows):
+        """Insert ``[prediction, confidence, message, timestamp]`` rows."""
+        conn = self._conn()
+        with conn:
+            self._insert(conn, rows)
+
+    def _insert(self, conn, rows):
+        """Add rows and their rollups inside the caller's transaction."""
+        records = []
+        day_totals = defaultdict(lambda: [0, 0.0, 0])
+        hours = {}
+        total = 0.0
+        for prediction, confidence, message, ts in rows:
+            prediction = _to_int(prediction)
+            confidence = _to_float(confidence)
+            ts = ts or None
+            records.append((ts, prediction, confidence, message))
+            total += confidence
+            if ts:
+                day = day_totals[ts[:10]]
+                day[0] += 1
+                day[1] += confidence
+                day[2] += prediction == 1
+                hour = hours.get(ts[:13])
+                if hour is None:
+                    hours[ts[:13]] = [1, confidence, confidence, ts, confidence, ts]
+                else:
+                    hour[0] += 1
+                    hour[1] += confidence
+                    if confidence < hour[2]:
+                        hour[2], hour[3] = confidence, ts
+                    if confidence > hour[4]:
+                        hour[4], hour[5] = confidence, ts
+        conn.executemany(
+            "INSERT INTO predictions (ts, prediction, confidence, message) VALUES (?, ?, ?, ?)",
+            records,
+        )
+        conn.execute(
+            "UPDATE totals SET count = count + ?, sum_confidence = sum_confidence + ? WHERE id = 1",
+            (len(records), total),
+        )
+        conn.executemany(
+            "INSERT INTO daily (day, count, sum_confidence, stressed) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(day) DO UPDATE SET count = count + excluded.count, "
+            "sum_confidence = sum_confidence + excluded.sum_confidence, "
+            "stressed = stressed + excluded.stressed",
+            [(day, *vals) for day, vals in day_totals.items()],
+        )
+        # Right-hand sides see the old row, so each extreme keeps its own timestamp
+        conn.executemany(
+            "INSERT INTO hourly (hour, count, sum_confidence, min_confidence, min_ts, "
+            "max_confidence, max_ts) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(hour) DO UPDATE SET count = count + excluded.count, "
+            "sum_confidence = sum_confidence + excluded.sum_confidence, "
+            "min_ts = CASE WHEN excluded.min_confidence < min_confidence THEN excluded.min_ts ELSE min_ts END, "
+            "min_confidence = MIN(min_confidence, excluded.min_confidence), "
+            "max_ts = CASE WHEN excluded.max_confidence > max_confidence THEN excluded.max_ts ELSE max_ts END, "
+            "max_confidence = MAX(max_confidence, excluded.max_confidence)",
+            [(hour, *vals) for hour, vals in hours.items()],
+        )
+
+    def totals(self):
+        """Return ``(count, mean confidence)`` over all records ever stored."""
+        count, total = self._conn().execute(
+            "SELECT count, sum_confidence FROM totals WHERE id = 1"
+        ).fetchone()
+        return count, (total / count if count else 0.0)
+
+    def version(self):
+        """A value that changes whenever the stored history does (appends or compaction)."""
+        conn = self._conn()
+        count = conn.execute("SELECT count FROM totals WHERE id = 1").fetchone()[0]
+        first_id = conn.execute("SELECT MIN(id) FROM predictions").fetchone()[0]
+        return count, first_id
+
+    def time_bounds(self):
+        """Return the first and last record time as epoch milliseconds (None when empty)."""
+        conn = self._conn()
+        bounds = []
+        for order in ("", "DESC"):
+            raw = conn.execute(
+                f"SELECT {EPOCH_MS.format('ts')} FROM predictions WHERE ts IS NOT NULL ORDER BY ts {order} LIMIT 1"
+            ).fetchone()
+            # Hours whose raw rows were compacted away still count
+            hour = conn.execute(
+                f"SELECT {EPOCH_MS.format('min_ts')}, {EPOCH_MS.format('max_ts')} FROM hourly "
+                f"ORDER BY hour {order} LIMIT 1"
+            ).fetchone()
+            candidates = ([raw[0]] if raw else []) + (list(hour) if hour else [])
+            bounds.append((max if order else min)(candidates) if candidates else None)
+        return tuple(bounds)
+
+    def raw_start(self):
+        """Epoch milliseconds of the oldest raw record still stored (None when empty)."""
+        row = self._conn().execute(
+            f"SELECT {EPOCH_MS.format('ts')} FROM predictions WHERE ts IS NOT NULL ORDER BY ts LIMIT 1"
+        ).fetchone()
+        return row[0] if row else None
+
+    def untimed_count(self):
+        """Records without a timestamp (imported from a log older than the Timestamp column)."""
+        return self._conn().execute("SELECT COUNT(*) FROM predictions WHERE ts IS NULL").fetchone()[0]
+
+    def id_bounds(self):
+        """Return the first and last record id (None when empty)."""
+        return self._conn().execute("SELECT MIN(id), MAX(id) FROM predictions").fetchone()
+
+    def points_by_id(self, start, end):
+        """``(id, confidence)`` of every record with ``start <= id < end``, timestamped or not."""
+        return self._conn().execute(
+            "SELECT id, confidence FROM predictions WHERE id >= ? AND id < ? ORDER BY id",
+            (start, end),
+        ).fetchall()
+
+    def count_between(self, start, end):
+        """Rows with ``start <= ts < end`` (ISO text), counted from the hourly rollup."""
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(count), 0) FROM hourly WHERE hour >= ? AND hour <= ?",
+            (start[:13], end[:13]),
+        ).fetchone()
+        return row[0]
+
+    def points_between(self, start, end):
+        """Raw ``(epoch ms, confidence)`` rows with ``start <= ts < end``, in time order."""
+        return self._conn().execute(
+            f"SELECT {EPOCH_MS.format('ts')}, confidence FROM predictions "
+            "WHERE ts >= ? AND ts < ? ORDER BY ts",
+            (start, end),
+        ).fetchall()
+
+    def hourly_extremes(self, start, end):
+        """Each hour's lowest and highest ``(epoch ms, confidence)`` between ``start`` and ``end``."""
+        return self._conn().execute(
+            f"SELECT {EPOCH_MS.format('min_ts')}, min_confidence, "
+            f"{EPOCH_MS.format('max_ts')}, max_confidence FROM hourly "
+            "WHERE hour >= ? AND hour <= ? ORDER BY hour",
+            (start[:13], end[:13]),
+        ).fetchall()
+
+    def compact(self, keep_days):
+        """Drop raw rows older than ``keep_days``; totals, daily and hourly rollups are kept.
+
+        Untimed rows (from a log older than the Timestamp column) go too once
+        a timestamped row logged after them is past the cutoff.
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=keep_days)).isoformat()
+        conn = self._conn()
+        with conn:
+            newest_old = conn.execute("SELECT MAX(id) FROM predictions WHERE ts < ?", (cutoff,)).fetchone()[0]
+            deleted = conn.execute("DELETE FROM predictions WHERE ts < ?", (cutoff,)).rowcount
+            if newest_old is not None:
+                deleted += conn.execute(
+                    "DELETE FROM predictions WHERE ts IS NULL AND id < ?", (newest_old,)
+                ).rowcount
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        return deleted
+
+    def import_csv(self, path, chunk_rows=IMPORT_CHUNK_ROWS):
+        """One-shot import of a legacy ``prediction_log.csv``; returns the row count."""
+        imported = 0
+        for chunk in _csv_chunks(path, chunk_rows):
+            self.write_rows(chunk)
+            imported += len(chunk)
+        return imported
+
+    def import_legacy(self, path, chunk_rows=IMPORT_CHUNK_ROWS):
+        """Import the CSV log at ``path`` if the store has never held a record.
+
+        Runs in one transaction under the write lock, so when several
+        workers start at once exactly one of them imports. Returns the row
+        count (0 when there was nothing to do).
+        """
+        if not os.path.exists(path) or self.totals()[0]:
+            return 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            imported = 0
+            if conn.execute("SELECT count FROM totals WHERE id = 1").fetchone()[0] == 0:
+                for chunk in _csv_chunks(path, chunk_rows):
+                    self._insert(conn, chunk)
+                    imported += len(chunk)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return imported
+
+
+def _csv_chunks(path, chunk_rows):
+    """Yield a CSV log's records as store rows, ``chunk_rows`` at a time.
+
+    Logs written before the Timestamp column existed read with no timestamp.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        chunk = []
+        for record in csv.DictReader(f):
+            chunk.append([
+                record.get("Prediction"),
+                record.get("Confidence"),
+                record.get("Message"),
+                record.get("Timestamp"),
+            ])
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the prediction store.")
+    parser.add_argument("--db", default=PREDICTION_DB_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="import a legacy CSV log").add_argument("csv_path")
+    sub.add_parser("compact", help="drop old raw rows").add_argument(
+        "--keep-days", type=int, default=365
+    )
+    args = parser.parse_args()
+
+    store = PredictionStore(args.db)
+    if args.command == "import":
+        print(f"✅ Imported {store.import_csv(args.csv_path)} rows into {args.db}")
+    else:
+        print(f"✅ Removed {store.compact(args.keep_days)} rows older than {args.keep_days} days")
@@ -0,0 +1,291 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# Prediction table settings
+# =========================
+# /predict answers come from PREDICTION_TABLE when it exists and still
+# matches the loaded model (see model_utils); build it with
+#   python table_utils.py build
+PREDICTION_TABLE = os.environ.get("PREDICTION_TABLE", "prediction_table.npy")
+TABLE_FORMAT = 1
+TABLE_CHUNK_ROWS = 50000
+TABLE_PROBES = 64
+PROGRESS_SECONDS = 5.0
+
+# The fields /predict takes from the web form; build_form_data pins the rest
+TABLE_FIELDS = [
+    "Gender", "Country", "Occupation", "family_history", "Days_Indoors",
+    "Growing_Stress", "Changes_Habits", "Mood_Swings", "Coping_Struggles",
+    "Work_Interest", "mental_health_interview", "care_options",
+]
+
+ROW_DTYPE = np.dtype([("prediction", "u1"), ("confidence", "<f4")])
+
+
+# =========================
+# Input space
+# =========================
+def input_space(encoder):
+    """One representative raw value per distinct encoding of every table field.
+
+    Any answer a field can take encodes like exactly one of these values:
+    a one-hot field sets one of the columns whose name ``category_key`` can
+    produce or none of them (``""``), and ordinal and binary fields map
+    every answer, known or not, to one of their table entries.
+    """
+    from model_utils import category_key
+
+    onehot = dict(encoder.onehot_tables)
+    mapped = {field: (table, default) for field, table, default in
+              encoder.ordinal_tables + encoder.binary_tables}
+    space = []
+    for field in TABLE_FIELDS:
+        if field in onehot:
+            values = sorted(key for key in onehot[field] if category_key(key) == key) + [""]
+        else:
+            table, default = mapped[field]
+            values, seen = [], []
+            for key, slots in table.items():
+                if slots not in seen:
+                    seen.append(slots)
+                    values.append(key)
+            if default not in seen:
+                values.append("")
+        space.append([field, values])
+    return space
+
+
+class PredictionTable:
+    """Memory-mapped prediction and confidence for every reachable /predict input.
+
+    Row ``i`` holds the answer for the form whose per-field codes are the
+    mixed-radix digits of ``i`` (last field fastest). The table is a
+    ``.npy`` file opened with ``mmap_mode="r"``, so every gunicorn worker
+    shares the same page-cache copy; its layout and provenance sit in a
+    JSON file beside it.
+    """
+
+    def __init__(self, rows, meta, encoder):
+        from model_utils import category_key
+
+        self.rows = rows
+        self.predictions = rows["prediction"]
+        self.confidences = rows["confidence"]
+        self.meta = meta
+        self.category_key = category_key
+        self.pinned = list(meta["pinned"].items())
+
+        # Per field: raw answer -> code, code for anything else, whether to normalise first
+        onehot = dict(encoder.onehot_tables)
+        mapped = {field: (table, default) for field, table, default in
+                  encoder.ordinal_tables + encoder.binary_tables}
+        self.coders = []
+        for field, values in meta["space"]:
+            if field in onehot:
+                codes = {key: code for code, key in enumerate(values) if key}
+                self.coders.append((field, codes, len(values) - 1, True, len(values)))
+                continue
+            table, default = mapped[field]
+            slots = [table.get(value, default) for value in values]
+            codes = {key: slots.index(key_slots) for key, key_slots in table.items()}
+            self.coders.append((field, codes, slots.index(default), False, len(values)))
+
+    @classmethod
+    def open(cls, path, state):
+        """Open ``path`` for ``state``; ``None`` if it was built for another model."""
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        rows = np.load(path, mmap_mode="r")
+        if meta.get("format") != TABLE_FORMAT or rows.dtype != ROW_DTYPE:
+            return None
+        if meta["space"] != input_space(state.feature_encoder) or meta["pinned"] != pinned_form():
+            return None
+        table = cls(rows, meta, state.feature_encoder)
+        if len(rows) != table.size:
+            return None
+        return table if table.matches(state) else None
+
+    @property
+    def size(self):
+        return int(np.prod([radix for *_, radix in self.coders]))
+
+    def index(self, form_data):
+        """Row of ``form_data`` in the table, or ``None`` if it is not covered."""
+        for field, value in self.pinned:
+            if form_data.get(field) != value:
+                return None
+        i = 0
+        for field, codes, other, normalise, radix in self.coders:
+            value = form_data.get(field)
+            if normalise:
+                value = self.category_key(value)
+            i = i * radix + codes.get(value, other)
+        return i
+
+    def lookup(self, form_data):
+        """``(prediction, confidence)`` for ``form_data``, or ``None`` to ask the model."""
+        try:
+            i = self.index(form_data)
+        except TypeError:
+            return None  # an unhashable answer; not a web form
+        if i is None:
+            return None
+        return int(self.predictions[i]), float(self.confidences[i])
+
+    def forms(self, indices):
+        """The representative form records of table rows ``indices``."""
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = {}
+        for field, values in reversed(self.meta["space"]):
+            columns[field] = np.array(values, dtype=object)[indices % len(values)]
+            indices = indices // len(values)
+        frame = pd.DataFrame(columns)
+        for field, value in self.pinned:
+            frame[field] = value
+        return frame
+
+    def matches(self, state, probes=TABLE_PROBES):
+        """Spot-check rows spread over the table against the model itself."""
+        from model_utils import _predict_matrix
+
+        rng = np.random.default_rng(len(self.rows))
+        indices = np.unique(np.concatenate([
+            np.linspace(0, len(self.rows) - 1, probes // 2).astype(np.int64),
+            rng.integers(0, len(self.rows), probes // 2),
+        ]))
+        forms = self.forms(indices).to_dict("records")
+        X = np.vstack([state.feature_encoder.encode(form) for form in forms])
+        predictions, confidences = _predict_matrix(state, X)
+        return bool(
+            np.array_equal(predictions, self.predictions[indices])
+            and np.allclose(confidences, self.confidences[indices], rtol=0, atol=1e-6)
+        )
+
+
+def pinned_form():
+    """The form fields /predict always sends with the same value."""
+    from model_utils import build_form_data
+
+    return {field: value for field, value in build_form_data({}).items() if field not in TABLE_FIELDS}
+
+
+# =========================
+# Build
+# =========================
+_table = None
+
+
+def _init_table_worker(threads, meta):
+    global _table
+    import model_utils
+    import score_utils
+
+    score_utils._init_worker(threads)
+    if score_utils._worker_error is None:
+        _table = PredictionTable(np.zeros(0, dtype=ROW_DTYPE), meta, model_utils.current_state().feature_encoder)
+
+
+def _score_rows(start, stop):
+    import score_utils
+    from model_utils import preprocess_and_predict_batch
+
+    if score_utils._worker_error is not None:
+        raise score_utils._worker_error
+    predictions, confidences = preprocess_and_predict_batch(_table.forms(np.arange(start, stop)))
+    if predictions is None:
+        raise RuntimeError(f"scoring table rows {start}-{stop} failed")
+    return predictions, confidences
+
+
+def build_table(path=PREDICTION_TABLE, workers=None, chunk_rows=TABLE_CHUNK_ROWS, threads_per_worker=1):
+    """Score every reachable /predict input and write the table to ``path``.
+
+    Rows are scored in chunks through ``preprocess_and_predict_batch`` by a
+    pool of ``workers`` processes (as in score_utils) and written in order
+    into a memory-mapped file, which replaces ``path`` only once complete
+    and checked. Returns ``(rows, seconds)``.
+    """
+    import model_utils
+    from numpy.lib.format import open_memmap
+
+    state = model_utils.current_state()
+    meta = {
+        "format": TABLE_FORMAT,
+        "space": input_space(state.feature_encoder),
+        "pinned": pinned_form(),
+        "model_version": state.version,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    size = PredictionTable(np.zeros(0, dtype=ROW_DTYPE), meta, state.feature_encoder).size
+    meta["rows"] = size
+    workers = workers or os.cpu_count() or 1
+    print(f"🧮 {size} reachable inputs: "
+          + " x ".join(f"{field} {len(values)}" for field, values in meta["space"]))
+
+    tmp_path = f"{path}.tmp.npy"
+    rows = open_memmap(tmp_path, mode="w+", dtype=ROW_DTYPE, shape=(size,))
+    started = time.monotonic()
+    next_report = started + PROGRESS_SECONDS
+    pending = deque()
+    done = 0
+    with Pool(workers, initializer=_init_table_worker, initargs=(threads_per_worker, meta)) as pool:
+        for start in range(0, size, chunk_rows):
+            stop = min(start + chunk_rows, size)
+            pending.append((start, stop, pool.apply_async(_score_rows, (start, stop))))
+            while pending and (len(pending) >= 2 * workers or start + chunk_rows >= size):
+                first, last, result = pending.popleft()
+                predictions, confidences = result.get()
+                rows["prediction"][first:last] = predictions
+                rows["confidence"][first:last] = confidences
+                done = last
+                now = time.monotonic()
+                if now >= next_report:
+                    print(f"⏳ {done}/{size} rows, {done / (now - started):.0f} rows/s")
+                    next_report = now + PROGRESS_SECONDS
+    rows.flush()
+    del rows
+
+    table = PredictionTable(np.load(tmp_path, mmap_mode="r"), meta, state.feature_encoder)
+    if not table.matches(state):
+        os.remove(tmp_path)
+        raise SystemExit("❌ Table rows disagree with the model's own predictions")
+    with open(f"{path}.json.tmp", "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, path)
+    os.replace(f"{path}.json.tmp", f"{path}.json")
+    return size, time.monotonic() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute /predict answers for every reachable form.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="score every reachable input into the table")
+    build.add_argument("--out", default=PREDICTION_TABLE)
+    build.add_argument("--workers", type=int, help="default: one per CPU")
+    build.add_argument("--threads-per-worker", type=int, default=1)
+    build.add_argument("--chunk-rows", type=int, default=TABLE_CHUNK_ROWS)
+    check = sub.add_parser("check", help="verify a table against the current model")
+    check.add_argument("--table", default=PREDICTION_TABLE)
+    args = parser.parse_args()
+
+    os.environ.setdefault("MODEL_STARTUP", "lazy")
+    if args.command == "build":
+        rows, seconds = build_table(args.out, args.workers, args.chunk_rows, args.threads_per_worker)
+        size_mb = os.path.getsize(args.out) / 1e6
+        print(f"✅ Table of {rows} rows ({size_mb:.1f} MB) written to {args.out} in {seconds:.1f}s")
+    else:
+        import model_utils
+
+        table = PredictionTable.open(args.table, model_utils.current_state())
+        if table is None:
+            raise SystemExit(f"❌ {args.table} does not match the current model; rebuild it")
+        print(f"✅ {args.table} matches the current model ({len(table.rows)} rows)")
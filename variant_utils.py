@@ -0,0 +1,398 @@
+import argparse
+import copy
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+from event_log_utils import app_log
+from metrics_utils import metrics
+
+# =========================
+# Model variant settings
+# =========================
+# MODEL_VARIANTS is a JSON list (inline, or the path of a file holding it) of
+# models to run next to the primary one, for example
+#   [{"name": "retrained", "bundle": "bundles/v7", "mode": "shadow"},
+#    {"name": "fast", "engine": "fast", "mode": "ab", "percent": 10}]
+# Each variant comes from a "bundle" directory (with its own encoders) or a
+# "model" pickle (default stack_model_1.pkl) used with the primary's
+# encoders; "engine": "fast" compiles it (see fast_model_utils).
+#   ab:     serves "percent" of /predict requests instead of the primary
+#   shadow: scores every request in the background; its answer is only compared
+MODEL_VARIANTS = os.environ.get("MODEL_VARIANTS", "")
+SHADOW_THREADS = int(os.environ.get("SHADOW_THREADS", 1))
+# Comparison jobs waiting beyond this are dropped rather than queued
+SHADOW_QUEUE_DEPTH = int(os.environ.get("SHADOW_QUEUE_DEPTH", 64))
+# Shadow threads run at a lower scheduling priority than request threads
+SHADOW_NICE = int(os.environ.get("SHADOW_NICE", 10))
+
+PRIMARY = "primary"
+MODES = ("ab", "shadow")
+
+
+def read_config(value=MODEL_VARIANTS):
+    """Parse MODEL_VARIANTS (inline JSON or a file path) into a list of dicts."""
+    value = value.strip()
+    if not value:
+        return []
+    if not value.startswith("["):
+        with open(value) as f:
+            value = f.read()
+    entries = json.loads(value)
+    names = set()
+    ab_percent = 0.0
+    for entry in entries:
+        name, mode = entry.get("name"), entry.get("mode", "shadow")
+        if not name or name == PRIMARY or name in names:
+            raise ValueError(f"variant names must be unique and not {PRIMARY!r}: {name!r}")
+        if mode not in MODES:
+            raise ValueError(f"variant {name!r}: mode must be one of {MODES}")
+        if "bundle" in entry and "model" in entry:
+            raise ValueError(f"variant {name!r}: give a bundle or a model, not both")
+        if mode == "ab":
+            ab_percent += float(entry.get("percent", 0))
+        names.add(name)
+    if ab_percent > 100:
+        raise ValueError(f"A/B variants take {ab_percent}% of traffic, more than 100%")
+    return entries
+
+
+def _score(state, form_data):
+    """Encode and score one form on ``state``, outside the batcher and table."""
+    import model_utils
+
+    X = state.feature_encoder.encode(form_data)
+    predictions, confidences = model_utils._predict_matrix(state, X)
+    return int(predictions[0]), float(confidences[0])
+
+
+class Variant:
+    """One model variant, scored with its own or the primary's encoders."""
+
+    def __init__(self, name, mode, percent=0.0, model=None, state=None):
+        self.name = name
+        self.mode = mode
+        self.percent = percent
+        self.model = model
+        self.state = state  # set for bundles, which bring their own encoders
+        self.bound = None
+
+    @classmethod
+    def load(cls, entry):
+        import fast_model_utils
+        import model_utils
+
+        engine = entry.get("engine", "sklearn")
+        state = model = None
+        if "bundle" in entry:
+            import bundle_utils
+
+            bundle = bundle_utils.load_bundle(entry["bundle"])
+            model = bundle["model"]
+            if engine == "fast":
+                model = fast_model_utils.compile_model(model)
+            state = model_utils.ModelState(
+                model, bundle["mood_encoder"], bundle["days_encoder"], bundle["scaler"],
+                bundle["final_columns"], bundle["binary_map"], version=bundle["manifest"]["version"],
+            )
+        else:
+            import joblib
+
+            model = joblib.load(entry.get("model", model_utils.MODEL_PATH))
+            if engine == "fast":
+                model = fast_model_utils.compile_model(model)
+        return cls(entry["name"], entry.get("mode", "shadow"), float(entry.get("percent", 0)), model, state)
+
+    def state_for(self, primary):
+        if self.state is not None:
+            return self.state
+        # Reuse the primary's encoders (and their compiled lookup tables);
+        # rebound when a hot reload swaps the primary state
+        bound = self.bound
+        if bound is None or bound[0] is not primary:
+            state = copy.copy(primary)
+            state.model = self.model
+            state.table = None
+            bound = self.bound = (primary, state)
+        return bound[1]
+
+    def predict(self, primary, form_data):
+        return _score(self.state_for(primary), form_data)
+
+
+class VariantRegistry:
+    """The primary model plus A/B and shadow variants for /predict.
+
+    ``predict`` picks the arm for a request (the primary, or an A/B variant
+    for its share of traffic), answers from it and hands a copy of the form
+    to a small pool of background threads. They score the shadow variants
+    (and the primary, when an A/B variant answered) and record agreement,
+    confidence deltas and latency into ``metrics``, so the comparison is
+    summed over every worker like any other series. The job queue is
+    bounded: when shadows fall behind, new jobs are dropped and counted
+    instead of queueing, so the request path never waits on them.
+    """
+
+    def __init__(self, threads=SHADOW_THREADS, queue_depth=SHADOW_QUEUE_DEPTH):
+        self.threads = threads
+        self.queue_depth = queue_depth
+        self.variants = []
+        self.ab = []
+        self.shadows = []
+        self.enabled = False
+        self.pid = None
+        self.start_lock = threading.Lock()
+
+    def load(self, config=MODEL_VARIANTS):
+        """Load the configured variants; ones that fail to load are skipped."""
+        try:
+            entries = read_config(config)
+        except Exception as e:
+            app_log.error("variant.config_failed", e)
+            entries = []
+        variants = []
+        for entry in entries:
+            try:
+                variants.append(Variant.load(entry))
+            except Exception as e:
+                app_log.error("variant.load_failed", e, variant=entry.get("name"))
+                continue
+            app_log.event("variant.loaded", variant=entry["name"], mode=entry.get("mode", "shadow"))
+        self.variants = variants
+        # Cumulative upper bounds: one random draw picks the A/B arm
+        self.ab = []
+        upper = 0.0
+        for variant in variants:
+            if variant.mode == "ab" and variant.percent > 0:
+                upper += variant.percent
+                self.ab.append((upper, variant))
+        self.shadows = [v for v in variants if v.mode == "shadow"]
+        self.enabled = bool(self.ab or self.shadows)
+
+    def _assign(self):
+        if not self.ab:
+            return None
+        draw = random.random() * 100
+        for upper, variant in self.ab:
+            if draw < upper:
+                return variant
+        return None
+
+    def predict(self, state, form_data, predict_primary):
+        """Answer one /predict request; returns ``(prediction, confidence, served_by)``."""
+        arm = self._assign()
+        start = time.perf_counter()
+        result = None
+        if arm is not None:
+            try:
+                result = arm.predict(state, form_data)
+            except Exception as e:
+                metrics.inc("wellness_errors_total", where="variant")
+                app_log.error("variant.failed", e, variant=arm.name)
+                arm = None
+                start = time.perf_counter()
+        if result is None:
+            result = predict_primary(state, form_data)
+        served_by = arm.name if arm is not None else PRIMARY
+        metrics.observe("wellness_variant_seconds", time.perf_counter() - start, variant=served_by, path="live")
+        metrics.inc("wellness_variant_served_total", variant=served_by)
+        if self.shadows or arm is not None:
+            self._submit((state, dict(form_data), arm, result))
+        return result[0], result[1], served_by
+
+    # -------------------------
+    # Background comparisons
+    # -------------------------
+    def _ensure_started(self):
+        # Its own threads and queue per process, also after a gunicorn fork
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=self.queue_depth)
+            for i in range(self.threads):
+                threading.Thread(target=self._run, name=f"model-shadow-{i}", daemon=True).start()
+            self.pid = os.getpid()
+
+    def _submit(self, job):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            metrics.inc("wellness_variant_jobs_total", result="dropped")
+
+    def _run(self):
+        try:
+            # Linux applies a thread id here to this thread alone
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), SHADOW_NICE)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            job = self.queue.get()
+            try:
+                self._compare(*job)
+                metrics.inc("wellness_variant_jobs_total", result="done")
+            except Exception as e:
+                metrics.inc("wellness_variant_jobs_total", result="error")
+                app_log.error("variant.job_failed", e)
+
+    def _timed(self, name, score):
+        start = time.perf_counter()
+        try:
+            result = score()
+        except Exception as e:
+            metrics.inc("wellness_errors_total", where="variant")
+            app_log.error("variant.failed", e, variant=name)
+            return None
+        metrics.observe("wellness_variant_seconds", time.perf_counter() - start, variant=name, path="shadow")
+        return result
+
+    def _compare(self, state, form_data, arm, result):
+        primary = result
+        if arm is not None:
+            primary = self._timed(PRIMARY, lambda: _score(state, form_data))
+            if primary is None:
+                return
+            _record(arm.name, result, primary)
+        for variant in self.shadows:
+            shadow = self._timed(variant.name, lambda: variant.predict(state, form_data))
+            if shadow is not None:
+                _record(variant.name, shadow, primary)
+
+
+def _record(name, result, primary):
+    agreement = "agree" if result[0] == primary[0] else "disagree"
+    metrics.inc("wellness_variant_comparisons_total", variant=name, agreement=agreement)
+    metrics.observe("wellness_variant_confidence_delta", result[1] - primary[1], variant=name)
+
+
+# =========================
+# Comparison report
+# =========================
+def _quantile(bounds, counts, q):
+    """Quantile ``q`` interpolated linearly within its bucket (None if empty).
+
+    The same estimate as Prometheus' histogram_quantile: the first bucket
+    starts at 0 (or is its bound if that is not positive), and a quantile
+    in the +Inf bucket is reported as the highest finite bound.
+    """
+    total = counts.sum()
+    if not total:
+        return None
+    cumulative = np.cumsum(counts)
+    rank = q * total
+    i = int(np.searchsorted(cumulative, rank))
+    if i >= len(bounds):
+        return bounds[-1]
+    upper = bounds[i]
+    if i == 0:
+        if upper <= 0:
+            return upper
+        lower, below = 0.0, 0.0
+    else:
+        lower, below = bounds[i - 1], cumulative[i - 1]
+    return round(lower + (upper - lower) * float((rank - below) / counts[i]), 6)
+
+
+def _histogram_summary(bounds, values):
+    n = len(bounds)
+    count = float(values[n + 2])
+    return {
+        "count": int(count),
+        "mean": round(values[n + 1] / count, 6) if count else None,
+        "p50": _quantile(bounds, values[:n + 1], 0.5),
+        "p95": _quantile(bounds, values[:n + 1], 0.95),
+    }
+
+
+def variant_report(registry, totals=None):
+    """Agreement, confidence deltas and latency per variant, summed over every worker."""
+    totals = metrics.collect() if totals is None else totals
+    series = {}
+    for (name, labels), values in totals.items():
+        if name.startswith("wellness_variant_"):
+            series[(name, labels)] = values
+
+    def get(name, **labels):
+        return series.get((name, tuple(sorted(labels.items()))))
+
+    latency_bounds = metrics.bucket_sets["wellness_variant_seconds"]
+    delta_bounds = metrics.bucket_sets["wellness_variant_confidence_delta"]
+    report = {"variants": {}, "jobs": {}}
+    for result in ("done", "dropped", "error"):
+        values = series.get(("wellness_variant_jobs_total", (("result", result),)))
+        report["jobs"][result] = int(values[0]) if values is not None else 0
+
+    arms = [(PRIMARY, "primary", 100 - sum(v.percent for v in registry.variants if v.mode == "ab"))]
+    arms += [(v.name, v.mode, v.percent if v.mode == "ab" else 0.0) for v in registry.variants]
+    for name, mode, percent in arms:
+        served = series.get(("wellness_variant_served_total", (("variant", name),)))
+        entry = {"mode": mode, "percent": percent, "served": int(served[0]) if served is not None else 0,
+                 "latency_seconds": {}}
+        for path in ("live", "shadow"):
+            values = get("wellness_variant_seconds", variant=name, path=path)
+            if values is not None:
+                entry["latency_seconds"][path] = _histogram_summary(latency_bounds, values)
+        if name != PRIMARY:
+            agree = get("wellness_variant_comparisons_total", variant=name, agreement="agree")
+            disagree = get("wellness_variant_comparisons_total", variant=name, agreement="disagree")
+            agree = int(agree[0]) if agree is not None else 0
+            disagree = int(disagree[0]) if disagree is not None else 0
+            entry["comparisons"] = agree + disagree
+            entry["agreement_rate"] = round(agree / (agree + disagree), 6) if agree + disagree else None
+            delta = series.get(("wellness_variant_confidence_delta", (("variant", name),)))
+            if delta is not None:
+                summary = _histogram_summary(delta_bounds, delta)
+                bounds = [repr(b) for b in delta_bounds] + ["+Inf"]
+                entry["confidence_delta"] = {
+                    "mean": summary["mean"],
+                    "histogram": {le: int(c) for le, c in zip(bounds, delta[:len(bounds)])},
+                }
+        report["variants"][name] = entry
+    return report
+
+
+variants = VariantRegistry()
+
+
+# =========================
+# Offline check
+# =========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score random forms on every configured variant and the primary model.")
+    parser.add_argument("--config", default=MODEL_VARIANTS, help="variant JSON (default: $MODEL_VARIANTS)")
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ.setdefault("MODEL_STARTUP", "lazy")
+    import model_utils
+    from fast_model_utils import sample_forms
+
+    state = model_utils.current_state()
+    registry = VariantRegistry()
+    registry.load(args.config)
+    if not registry.variants:
+        raise SystemExit("❌ No variants configured (set MODEL_VARIANTS or pass --config)")
+    forms = sample_forms(state, args.samples, args.seed)
+
+    def run(score):
+        start = time.perf_counter()
+        results = np.array([score(form) for form in forms])
+        return results, (time.perf_counter() - start) / len(forms)
+
+    primary, primary_seconds = run(lambda form: _score(state, form))
+    print(f"⏱️ {PRIMARY}: {primary_seconds * 1e3:.2f} ms/row")
+    for variant in registry.variants:
+        results, seconds = run(lambda form: variant.predict(state, form))
+        agreement = np.mean(results[:, 0] == primary[:, 0])
+        delta = results[:, 1] - primary[:, 1]
+        print(f"📊 {variant.name} ({variant.mode}): agreement {agreement:.2%}, "
+              f"confidence delta mean {delta.mean():+.4f} max |{np.abs(delta).max():.4f}|, "
+              f"{seconds * 1e3:.2f} ms/row")